@@ -0,0 +1,510 @@
+"""
+State backends for the Discord bot.
+
+this file provides the storage under the VoiceJournal: a backend keeps a
+snapshot of the session store and the journal of the join/leave events
+recorded after it. Events are written in batches (one transaction, or one
+pipeline, per save) and a new snapshot replaces the old one together with
+the journal entries it covers, atomically, so another process reading the
+state never sees half a batch. Backends are chosen with STATE_BACKEND in
+the .env file:
+
+- file (default): 'voice_data.snapshot' and 'voice_data.journal' next to the
+  bot, for a single process.
+- memory: nothing is written, for benchmarks and throwaway runs.
+- sqlite:<path>: one SQLite database (in WAL mode) that several processes
+  on the same machine can share.
+- redis://host:port/db: a Redis-protocol server shared by processes on any
+  machine, needs the redis package.
+
+The SQLite and Redis backends check, in the same transaction as each write,
+that nobody else wrote the state since this process read it (the last
+sequence number saved is still the one it knows), and raise StateConflict
+instead of interleaving their events with another process's.
+"""
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# events written per statement or pipeline round trip
+BATCH_SIZE = 1000
+
+
+class StateConflict(RuntimeError):
+    """
+    Raised when the state was written by another process since this one read it.
+    """
+
+
+class StateBackend(ABC):
+    """
+    Storage of a snapshot and a journal of events, both keyed by sequence number.
+
+    Events are passed around as (seq, line) pairs, line being the event
+    serialized as JSON (sequence number included). Snapshots are opaque
+    bytes (see snapshot.py) saved with the sequence number of the last event
+    they include. Subclasses implement every method, a backend missing one
+    can't be created.
+
+    Attributes
+    ----------
+    head : int
+        The last sequence number saved (snapshot or journal) as of this
+        process's last read or write, what shared backends expect to find
+        when they write.
+    """
+    head = 0
+
+    @abstractmethod
+    def exists(self):
+        """
+        Tell whether anything was saved yet.
+
+        Returns
+        -------
+        bool
+            True if there is a snapshot or journal entries.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self):
+        """
+        Read the state.
+
+        Returns
+        -------
+        tuple
+            (snapshot, lines): the snapshot as a bytes-like object or None,
+            and the journal lines in sequence order, some of which may be
+            covered by the snapshot.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def append(self, events):
+        """
+        Write a batch of events after the ones already saved.
+
+        Parameters
+        ----------
+        events : list of tuple
+            (seq, line) pairs in sequence order.
+
+        Returns
+        -------
+        None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace(self, seq, snapshot):
+        """
+        Save a snapshot and drop the journal entries it covers.
+
+        Parameters
+        ----------
+        seq : int
+            Sequence number of the last event the snapshot includes.
+        snapshot : bytes
+            The snapshot.
+
+        Returns
+        -------
+        None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def saved_at(self):
+        """
+        Return when the state was last written.
+
+        Returns
+        -------
+        int or None
+            Wall-clock nanoseconds (like time.time_ns), None if nothing was saved.
+        """
+        raise NotImplementedError
+
+    def _check(self, head, events, line_at):
+        # head is the last sequence number saved, read in the transaction about to write
+        if head == self.head:
+            return
+        # an earlier attempt at this batch that went through although its reply was lost
+        lines = dict(events)
+        if self.head < head and head in lines and line_at(head) == lines[head]:
+            return
+        raise StateConflict(
+            f"the saved state moved to seq {head} while this process expected {self.head}: "
+            "another process is writing it, run each shard in one process at a time"
+        )
+
+
+class FileBackend(StateBackend):
+    """
+    Snapshot and journal kept in two local files.
+
+    The snapshot is memory-mapped when it is read, so only the parts of it
+    that are decoded are read from disk.
+
+    Parameters
+    ----------
+    snapshot_path : str
+        Path of the snapshot file.
+    journal_path : str
+        Path of the journal file.
+    legacy_path : str, optional
+        Path of the JSON snapshot written by earlier versions, read when
+        there is no snapshot yet and renamed to <path>.bak once a new one is written.
+    """
+    def __init__(self, snapshot_path, journal_path, legacy_path=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.legacy_path = legacy_path
+
+    def _paths(self):
+        return [path for path in (self.snapshot_path, self.journal_path, self.legacy_path) if path]
+
+    def exists(self):
+        return any(os.path.exists(path) for path in self._paths())
+
+    def read(self):
+        snapshot = None
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    # the map stays valid after the file is closed
+                    snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            if self.legacy_path:
+                try:
+                    with open(self.legacy_path, "rb") as f:
+                        snapshot = f.read()
+                except FileNotFoundError:
+                    pass
+
+        lines = []
+        torn = False
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        json.loads(line)
+                    except ValueError:
+                        # a torn last line from a crash mid-write, nothing after it is usable
+                        torn = True
+                        break
+                    lines.append(line)
+        except FileNotFoundError:
+            pass
+
+        if torn:
+            # drop the torn tail so later appends start on a clean line
+            print(f"Dropping unreadable tail of {self.journal_path}")
+            with open(self.journal_path, "w") as f:
+                f.writelines(lines)
+        return snapshot, lines
+
+    def append(self, events):
+        if not events:
+            return
+        with open(self.journal_path, "a") as f:
+            f.write("\n".join(line for _, line in events) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replace(self, seq, snapshot):
+        # written to a temporary file and renamed over the old one, a crash never leaves half a snapshot
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # every line is covered by the snapshot now
+        open(self.journal_path, "w").close()
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            # kept as a backup, the new snapshot replaces it
+            os.replace(self.legacy_path, self.legacy_path + ".bak")
+
+    def saved_at(self):
+        times = []
+        for path in self._paths():
+            try:
+                times.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                pass
+        return max(times) if times else None
+
+
+class MemoryBackend(StateBackend):
+    """
+    Snapshot and journal kept in memory, lost when the process exits.
+    """
+    def __init__(self):
+        self.snapshot = None
+        self.events = []
+        self.written_at = None
+
+    def exists(self):
+        return self.snapshot is not None or bool(self.events)
+
+    def read(self):
+        return self.snapshot, [line for _, line in self.events]
+
+    def append(self, events):
+        if events:
+            self.events.extend(events)
+            self.written_at = time.time_ns()
+
+    def replace(self, seq, snapshot):
+        self.snapshot = bytes(snapshot)
+        self.events = [(event_seq, line) for event_seq, line in self.events if event_seq > seq]
+        self.written_at = time.time_ns()
+
+    def saved_at(self):
+        return self.written_at
+
+
+class SQLiteBackend(StateBackend):
+    """
+    Snapshot and journal kept in a SQLite database, one pair of rows sets per name.
+
+    The database is in WAL mode, so processes sharing it can read while one
+    of them writes, and each batch is one transaction. Writes take the
+    database's write lock first (BEGIN IMMEDIATE) and check the head in it,
+    so a process can't write on top of another's events.
+
+    Parameters
+    ----------
+    path : str
+        Path of the database file.
+    name : str
+        Name of the state in the database (one per shard).
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS state_snapshots (
+        name TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        saved_at INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS state_journal (
+        name TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        line TEXT NOT NULL,
+        PRIMARY KEY (name, seq)
+    );
+    CREATE TABLE IF NOT EXISTS state_writes (
+        name TEXT PRIMARY KEY,
+        saved_at INTEGER NOT NULL
+    );
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        # writes happen on the persistence worker thread, the first read on the event loop
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def exists(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM state_writes WHERE name = ?", (self.name,)).fetchone() is not None
+
+    def read(self):
+        # one read transaction, so the snapshot and the journal are from the same moment
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            row = self._conn.execute("SELECT data FROM state_snapshots WHERE name = ?", (self.name,)).fetchone()
+            lines = [
+                line for (line,) in self._conn.execute(
+                    "SELECT line FROM state_journal WHERE name = ? ORDER BY seq", (self.name,)
+                )
+            ]
+            self.head = self._head()
+        if row is None:
+            return None, lines
+        # JSON snapshots saved by earlier versions come back as text
+        return (row[0].encode("utf-8") if isinstance(row[0], str) else row[0]), lines
+
+    def _head(self):
+        (head,) = self._conn.execute(
+            "SELECT MAX(seq) FROM (SELECT seq FROM state_snapshots WHERE name = ? "
+            "UNION ALL SELECT MAX(seq) FROM state_journal WHERE name = ?)", (self.name, self.name)
+        ).fetchone()
+        return head or 0
+
+    def _line_at(self, seq):
+        row = self._conn.execute("SELECT line FROM state_journal WHERE name = ? AND seq = ?", (self.name, seq)).fetchone()
+        return row[0] if row else None
+
+    def _touch(self):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state_writes (name, saved_at) VALUES (?, ?)", (self.name, time.time_ns())
+        )
+
+    def append(self, events):
+        if not events:
+            return
+        with self._lock, self._conn:
+            # the write lock is held from here to the commit, no other process writes in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._check(self._head(), events, self._line_at)
+            for i in range(0, len(events), BATCH_SIZE):
+                # a line written again after a failed save replaces itself
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO state_journal (name, seq, line) VALUES (?, ?, ?)",
+                    [(self.name, seq, line) for seq, line in events[i:i + BATCH_SIZE]]
+                )
+            self._touch()
+        self.head = max(self.head, events[-1][0])
+
+    def replace(self, seq, snapshot):
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._check(self._head(), (), self._line_at)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state_snapshots (name, seq, data, saved_at) VALUES (?, ?, ?, ?)",
+                (self.name, seq, sqlite3.Binary(snapshot), time.time_ns())
+            )
+            self._conn.execute("DELETE FROM state_journal WHERE name = ? AND seq <= ?", (self.name, seq))
+            self._touch()
+        self.head = max(self.head, seq)
+
+    def saved_at(self):
+        with self._lock:
+            row = self._conn.execute("SELECT saved_at FROM state_writes WHERE name = ?", (self.name,)).fetchone()
+        return row[0] if row else None
+
+
+class RedisBackend(StateBackend):
+    """
+    Snapshot and journal kept on a Redis-protocol server.
+
+    The journal is a sorted set scored by sequence number, so a snapshot
+    drops exactly the entries it covers, whatever was appended meanwhile.
+    Appends are sent as pipelined MULTI/EXEC transactions, BATCH_SIZE
+    entries per command, under a WATCH of the journal and the snapshot's
+    sequence number: the head is checked between WATCH and MULTI, and the
+    transaction is dropped if another process wrote either meanwhile.
+
+    Parameters
+    ----------
+    name : str
+        Prefix of the keys of the state (one per shard).
+    url : str, optional
+        URL of the server, e.g. redis://localhost:6379/0.
+    client : redis.Redis, optional
+        A client to use instead of connecting to url, e.g. a fakeredis.FakeRedis.
+    """
+    def __init__(self, name, url=None, client=None):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis://... needs the redis package: pip install redis")
+        if client is None:
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self._watch_error = redis.WatchError
+        self.snapshot_key = f"{name}:snapshot"
+        self.journal_key = f"{name}:journal"
+        self.saved_at_key = f"{name}:saved_at"
+        self.seq_key = f"{name}:seq"
+
+    def exists(self):
+        return bool(self.client.exists(self.snapshot_key, self.journal_key))
+
+    def read(self):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(self.snapshot_key)
+        pipe.get(self.seq_key)
+        pipe.zrange(self.journal_key, 0, -1, withscores=True)
+        data, snapshot_seq, entries = pipe.execute()
+        self.head = self._top(snapshot_seq, entries)
+        return (data or None), [line.decode() if isinstance(line, bytes) else line for line, _ in entries]
+
+    @staticmethod
+    def _top(snapshot_seq, entries):
+        # the head from the snapshot's sequence number and the last journal entry, (line, score) pairs
+        return max(int(snapshot_seq or 0), int(entries[-1][1]) if entries else 0)
+
+    def _write(self, events, queue):
+        with self.client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(self.seq_key, self.journal_key)
+                head = self._top(pipe.get(self.seq_key), pipe.zrange(self.journal_key, -1, -1, withscores=True))
+
+                def line_at(seq):
+                    lines = [line.decode() if isinstance(line, bytes) else line for line in pipe.zrangebyscore(self.journal_key, seq, seq)]
+                    return lines[0] if lines else None
+
+                self._check(head, events, line_at)
+                pipe.multi()
+                queue(pipe)
+                pipe.set(self.saved_at_key, time.time_ns())
+                pipe.execute()
+            except self._watch_error:
+                raise StateConflict("the saved state was written by another process during this save, run each shard in one process at a time")
+
+    def append(self, events):
+        if not events:
+            return
+
+        def queue(pipe):
+            for i in range(0, len(events), BATCH_SIZE):
+                # a line written again after a failed save is the same member, it isn't duplicated
+                pipe.zadd(self.journal_key, {line: seq for seq, line in events[i:i + BATCH_SIZE]})
+
+        self._write(events, queue)
+        self.head = max(self.head, events[-1][0])
+
+    def replace(self, seq, snapshot):
+        def queue(pipe):
+            pipe.set(self.snapshot_key, bytes(snapshot))
+            pipe.set(self.seq_key, seq)
+            pipe.zremrangebyscore(self.journal_key, "-inf", seq)
+
+        self._write((), queue)
+        self.head = max(self.head, seq)
+
+    def saved_at(self):
+        value = self.client.get(self.saved_at_key)
+        return int(value) if value is not None else None
+
+
+def open_backend(spec, name):
+    """
+    Create the backend described by a STATE_BACKEND setting.
+
+    Parameters
+    ----------
+    spec : str or None
+        "file" (or empty), "memory", "sqlite:<path>" or "redis://...".
+    name : str
+        Name of the state, e.g. "voice_data" or "voice_data.shard-3"; the
+        file backend uses it for its file names.
+
+    Returns
+    -------
+    StateBackend
+        The backend.
+    """
+    spec = spec or "file"
+    if spec == "file":
+        return FileBackend(f"{name}.snapshot", f"{name}.journal", f"{name}.json")
+    if spec == "memory":
+        return MemoryBackend()
+    if spec.startswith("sqlite:"):
+        return SQLiteBackend(spec[len("sqlite:"):], name)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(name, url=spec)
+    raise ValueError(f"unknown STATE_BACKEND: {spec}")
@@ -0,0 +1,119 @@
+"""
+Cold start benchmark for the Discord bot.
+
+this file measures the time from process start until the voice data is
+loaded and the guilds being tracked are ready, the state on_ready reaches
+before it reconciles them. For each roster size it saves the same data as
+the JSON snapshot earlier versions wrote and as the binary snapshot, then
+starts a fresh Python process per format that imports the bot's modules,
+loads the data and decodes the guilds with tracked channels (the others stay
+encoded until they are used). Only a share of the guilds is tracking a
+session, like between scheduled meetings.
+
+usage: python benchmarks/coldstart.py [--members N ...] [--guilds G] [--active FRACTION]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import SessionStore, GuildSession, MemberRecord, now_ns  # noqa: E402
+from snapshot import encode_snapshot  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run in the child process: load like start_shard does, then touch the guilds reconcile_guilds would
+CHILD = """
+import time
+started = time.perf_counter()
+import utils
+from store import SessionStore
+shard = utils.shards.get(0)
+if FORMAT == "json":
+    import json
+    with open("voice_data.json") as f:
+        data = json.load(f)
+    shard.store.update(SessionStore.from_dict(data["sessions"]))
+else:
+    utils.load_voice_data(shard)
+loaded = time.perf_counter()
+members = sum(len(session.members) for session in shard.store.sessions.values() if session.tracked)
+print(loaded - started, time.perf_counter() - started, members)
+"""
+
+
+def build_store(members, guilds, active):
+    store = SessionStore()
+    now = now_ns()
+    per_guild = max(1, members // guilds)
+    tracking = max(1, int(guilds * active))
+    member_id = 10**17
+    for g in range(guilds):
+        session = GuildSession(10**18 + g, 10**18 + 10**6 + g, f"voice-{g}") if g < tracking else GuildSession(10**18 + g)
+        channel_id = session._intern(10**18 + 10**6 + g, f"voice-{g}")
+        for i in range(per_guild):
+            # members of the guilds in session are still connected, the others all left
+            join_ns = now - i * 1000 if g < tracking else None
+            session.members[member_id] = MemberRecord(join_ns, (i % 3600) * 1_000_000_000, channel_id)
+            if join_ns is not None:
+                session._index(member_id, channel_id)
+            member_id += 1
+        session._rebuild_leaderboard()
+        store.sessions[session.guild_id] = session
+        for tracked_id in session.tracked:
+            store.routes[tracked_id] = session
+    return store
+
+
+def start(directory, fmt):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", f"FORMAT = {fmt!r}\n" + CHILD], cwd=directory, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout.split("\n")
+    total = time.perf_counter() - start
+    load, ready, members = output[-2].split()
+    return total, float(load), float(ready), int(members)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a cold start with JSON and binary snapshots.")
+    parser.add_argument("--members", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--active", type=float, default=0.1, help="share of guilds tracking a session")
+    args = parser.parse_args()
+
+    print(f"guilds: {args.guilds}  tracking a session: {args.active:.0%}")
+    for members in args.members:
+        store = build_store(members, args.guilds, args.active)
+        with tempfile.TemporaryDirectory() as directory:
+            json_dir = os.path.join(directory, "json")
+            binary_dir = os.path.join(directory, "binary")
+            os.makedirs(json_dir)
+            os.makedirs(binary_dir)
+            with open(os.path.join(json_dir, "voice_data.json"), "w") as f:
+                json.dump({"seq": 0, "sessions": store.to_dict()}, f)
+            with open(os.path.join(binary_dir, "voice_data.snapshot"), "wb") as f:
+                f.write(encode_snapshot(0, store))
+            sizes = {fmt: os.path.getsize(os.path.join(d, name)) for fmt, d, name in (
+                ("json", json_dir, "voice_data.json"), ("binary", binary_dir, "voice_data.snapshot")
+            )}
+            del store
+
+            results = {fmt: start(d, fmt) for fmt, d in (("json", json_dir), ("binary", binary_dir))}
+        print(f"members: {members}")
+        for fmt, (total, load, ready, touched) in results.items():
+            print(
+                f"  {fmt:<7} {sizes[fmt] / 2**20:8.1f} MiB  process start to ready {total:7.2f} s"
+                f"  (imports and load {load:6.2f} s, tracked guilds decoded at {ready:6.2f} s, {touched} members)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Lightweight stand-ins for discord objects used by the benchmarks.
+
+this file provides local fakes for members, voice states, channels, guilds,
+voice clients, messages and command contexts. They implement only what the
+bot's handlers touch, so the real handlers can be driven without a network
+connection.
+"""
+import asyncio
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_ids = itertools.count(10**17)
+
+
+def next_id():
+    """
+    Return a new snowflake-sized ID.
+
+    Returns
+    -------
+    int
+        A unique ID.
+    """
+    return next(_ids)
+
+
+class FakeUser:
+    def __init__(self, user_id=None, name="user"):
+        self.id = user_id or next_id()
+        self.name = name
+
+    @property
+    def display_name(self):
+        return self.name
+
+
+class FakeVoiceState:
+    def __init__(self, channel=None):
+        self.channel = channel
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild, user_id=None, name="member"):
+        super().__init__(user_id, name)
+        self.guild = guild
+        self.voice = None
+        self.roles = []
+
+
+class FakeMessage:
+    def __init__(self, channel):
+        self.id = next_id()
+        self.channel = channel
+        self.embeds = []
+
+
+class FakeTextChannel:
+    def __init__(self, guild, name):
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+        self.sent = 0
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        if self.guild.latency:
+            await asyncio.sleep(self.guild.latency)
+        self.sent += 1
+        message = FakeMessage(self)
+        if embed is not None:
+            message.embeds.append(embed)
+        return message
+
+
+class FakeVoiceClient:
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+
+    def is_connected(self):
+        return self.guild.voice_client is self
+
+    async def disconnect(self, force=False):
+        if self.guild.voice_client is self:
+            self.guild.voice_client = None
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, name):
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+        self.members = []
+
+    @property
+    def voice_states(self):
+        return {member.id: member.voice for member in self.members}
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self.guild, self)
+        if self.guild.me is not None and self.guild.me.voice is None:
+            move(self.guild.me, self)
+        return self.guild.voice_client
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.id = next_id()
+        self.name = name
+
+
+class FakeGuild:
+    """
+    A guild with voice and text channels, members and an optional voice client.
+
+    Parameters
+    ----------
+    name : str
+        The guild's name.
+    voice_channels : int
+        How many voice channels to create.
+    text_channels : iterable of str
+        Names of the text channels to create.
+
+    Attributes
+    ----------
+    latency : float
+        Seconds every simulated API call (send, channel creation, member
+        lookups) takes.
+    uncached : dict
+        Members Discord knows that aren't in the library's member cache,
+        found by query_members and fetch_member only.
+    requests : int
+        Member lookups made (gateway requests and REST calls).
+    """
+    def __init__(self, name, voice_channels=1, text_channels=("general",)):
+        self.id = next_id()
+        self.name = name
+        self.members = {}
+        self.voice_client = None
+        self.default_role = FakeRole("@everyone")
+        self.me = None
+        self.voice_channels = [FakeVoiceChannel(self, f"voice-{i}") for i in range(voice_channels)]
+        self.text_channels = [FakeTextChannel(self, name) for name in text_channels]
+        self.latency = 0
+        self.shard_id = 0
+        self.uncached = {}
+        self.requests = 0
+
+    @property
+    def channels(self):
+        return self.text_channels + self.voice_channels
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id):
+        for channel in self.channels:
+            if channel.id == channel_id:
+                return channel
+        return None
+
+    def add_member(self, name=None, user_id=None):
+        member = FakeMember(self, user_id, name or f"member-{len(self.members)}")
+        self.members[member.id] = member
+        return member
+
+    async def query_members(self, query=None, *, limit=5, user_ids=None, presences=False, cache=True):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self.uncached[member_id] for member_id in user_ids if member_id in self.uncached][:limit]
+
+    async def fetch_member(self, member_id):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        member = self.members.get(member_id) or self.uncached.get(member_id)
+        if member is None:
+            raise LookupError(f"unknown member {member_id}")
+        return member
+
+    async def create_text_channel(self, name, overwrites=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        channel = FakeTextChannel(self, name)
+        self.text_channels.append(channel)
+        return channel
+
+
+def move(member, channel):
+    """
+    Move a member to a voice channel (or out of voice with None) and return
+    the before/after voice states a gateway VOICE_STATE_UPDATE would carry.
+
+    Parameters
+    ----------
+    member : FakeMember
+        The member to move.
+    channel : FakeVoiceChannel or None
+        The channel to move to.
+
+    Returns
+    -------
+    tuple
+        (before, after) voice states.
+    """
+    before = member.voice or FakeVoiceState()
+    if before.channel is not None:
+        before.channel.members.remove(member)
+    after = FakeVoiceState(channel)
+    if channel is not None:
+        channel.members.append(member)
+    member.voice = after if channel is not None else None
+    return before, after
+
+
+class FakeFollowup:
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    async def send(self, *args, **kwargs):
+        self.ctx.responses.append((args, kwargs))
+
+
+class FakeContext:
+    """
+    The subset of discord.ApplicationContext used by the slash commands.
+
+    Parameters
+    ----------
+    guild : FakeGuild
+        The guild the command runs in.
+    author : FakeMember
+        The member running the command.
+    """
+    def __init__(self, guild, author):
+        self.guild = guild
+        self.author = author
+        self.responses = []
+        self.followup = FakeFollowup(self)
+
+    async def defer(self, *args, **kwargs):
+        pass
+
+    async def respond(self, *args, **kwargs):
+        self.responses.append((args, kwargs))
+
+    async def send(self, *args, **kwargs):
+        self.responses.append((args, kwargs))
+
+
+def install_bot_user(bot, name="oculus"):
+    """
+    Give the bot a user as if it had logged in.
+
+    Parameters
+    ----------
+    bot : discord.Bot
+        The bot from shared.py.
+    name : str, optional
+        The bot's name.
+
+    Returns
+    -------
+    FakeUser
+        The bot's user.
+    """
+    user = FakeUser(name=name)
+    bot._connection.user = user
+    return user
@@ -0,0 +1,137 @@
+"""
+Fan-out benchmark for the Discord bot.
+
+this file measures the disconnection notice sent to every guild against the
+fakes from benchmarks/fakes.py, with a simulated API latency and Discord's
+rate limits enforced by the fake channels (a 429 past 5 messages per 5
+seconds in a channel or 50 per second in total). It compares the original
+handler, which awaited each send in turn, with events.stop_shard going
+through the outbox: how long the handler is blocked, when the last notice is
+delivered, how many sends were rate limited, how long a report queued during
+the broadcast waits, and how many notices a connection dropping twice sends.
+
+usage: python benchmarks/fanout.py [--guilds N] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import os
+import tempfile
+import time
+import types
+
+import discord
+from fakes import FakeGuild, install_bot_user
+
+FAREWELL = "error detected! system malfunction! the internet!!! beep beep initiating shutdown... or maybe just rebooting... the end is neaaaarr!!"
+
+
+class RateLimits:
+    # Discord's limits as the fake API enforces them
+    def __init__(self):
+        self.channels = collections.defaultdict(collections.deque)
+        self.all = collections.deque()
+        self.hits = 0
+
+    def check(self, channel_id):
+        now = time.monotonic()
+        sent = self.channels[channel_id]
+        for window, seconds, limit in ((sent, 5, 5), (self.all, 1, 50)):
+            while window and window[0] <= now - seconds:
+                window.popleft()
+            if len(window) >= limit:
+                self.hits += 1
+                response = types.SimpleNamespace(status=429, reason="Too Many Requests", headers={"Retry-After": f"{window[0] + seconds - now:.3f}"})
+                raise discord.HTTPException(response, "You are being rate limited.")
+        sent.append(now)
+        self.all.append(now)
+
+
+def build_guilds(count, latency, limits, utils):
+    guilds = []
+    for g in range(count):
+        guild = FakeGuild(f"guild-{g}", text_channels=("general", "project-oculus"))
+        guild.latency = latency
+        channel = guild.text_channels[-1]
+        utils.bot_channels.set(guild.id, channel.id)
+        send = channel.send
+
+        async def limited(*args, _send=send, _id=channel.id, **kwargs):
+            limits.check(_id)
+            return await _send(*args, **kwargs)
+
+        channel.send = limited
+        guilds.append(guild)
+    return guilds
+
+
+async def legacy(guilds, utils):
+    # the original farewell: await each guild's message before the next one
+    for guild in guilds:
+        target_channel = utils.bot_channels.get(guild)
+        if target_channel:
+            try:
+                await target_channel.send(FAREWELL)
+            except discord.HTTPException:
+                pass
+
+
+async def run(args):
+    # imported here so the bot's modules read and write their files in the working directory set by main
+    import shared
+    import utils
+    import events
+
+    install_bot_user(shared.bot)
+    shard = utils.shards.get(0)
+    print(f"guilds: {args.guilds}  simulated API latency: {args.latency * 1000:.0f} ms")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        limits = RateLimits()
+        guilds = build_guilds(args.guilds, args.latency, limits, utils)
+        start = time.perf_counter()
+        await legacy(guilds, utils)
+        await legacy(guilds, utils)
+        baseline = time.perf_counter() - start
+        baseline_hits = limits.hits
+        baseline_sent = sum(guild.text_channels[-1].sent for guild in guilds)
+
+        await asyncio.sleep(5)  # let the fake limits reset
+        limits = RateLimits()
+        guilds = build_guilds(args.guilds, args.latency, limits, utils)
+        start = time.perf_counter()
+        await events.stop_shard(shard, guilds)
+        # the connection drops again before the notices are out
+        await events.stop_shard(shard, guilds)
+        blocked = time.perf_counter() - start
+        # a report requested in the middle of the broadcast
+        await asyncio.sleep(min(1.0, args.guilds / 100))
+        queued = time.perf_counter()
+        await utils.outbox.send(guilds[-1].text_channels[-1], "report", lane=utils.REPORT)
+        report_wait = time.perf_counter() - queued
+        await utils.outbox.drain()
+        delivered = time.perf_counter() - start
+        sent = sum(guild.text_channels[-1].sent for guild in guilds)
+
+    print(f"{'awaited in turn (original)':<28} handler blocked {baseline:8.2f} s  {baseline_sent:6d} sent  {baseline_hits:5d} rate limited")
+    print(
+        f"{'outbox':<28} handler blocked {blocked:8.2f} s  {sent:6d} sent  {limits.hits:5d} rate limited"
+        f"  all delivered at {delivered:6.2f} s  report waited {report_wait * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the disconnection notice fan-out against fake guilds.")
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each simulated API call takes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
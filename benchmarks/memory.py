@@ -0,0 +1,83 @@
+"""
+Memory benchmark for the session store.
+
+this file compares the memory used by the original flat voice_data layout
+({member_id: {"join_time": datetime, "total_duration": timedelta, "channel_name": str}})
+with the SessionStore's slotted records, for a guild where every member has
+an open interval in one of a few channels.
+
+usage: python benchmarks/memory.py [members]
+"""
+import datetime
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import SessionStore, now_ns  # noqa: E402
+
+
+class FakeChannel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+
+
+def legacy_layout(members, channels):
+    now = datetime.datetime.now()
+    voice_data = {}
+    for i in range(members):
+        channel = channels[i % len(channels)]
+        # names used to come from the gateway objects, one string per event
+        voice_data[10**17 + i] = {
+            "join_time": now + datetime.timedelta(microseconds=i),
+            "total_duration": datetime.timedelta(seconds=i % 3600),
+            "channel_name": "".join(channel.name)
+        }
+    return voice_data
+
+
+def store_layout(members, channels, indexes=True):
+    store = SessionStore()
+    now = now_ns()
+    store.track(1, channels[0])
+    for i in range(members):
+        store.start(1, 10**17 + i, channels[i % len(channels)], now + i * 1000)
+    session = store.session(1)
+    for i, record in enumerate(session.members.values()):
+        record.total_ns = (i % 3600) * 1_000_000_000
+    session._rebuild_leaderboard()
+    if not indexes:
+        # keep only what the legacy layout holds, for a like-for-like comparison
+        session.channels = {}
+        session.leaderboard.rebuild(())
+    return store
+
+
+def measure(build, *args):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = build(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    channels = [FakeChannel(10**18 + i, f"voice-channel-{i}") for i in range(4)]
+
+    legacy = measure(legacy_layout, members, channels)
+    records = measure(store_layout, members, channels, False)
+    full = measure(store_layout, members, channels, True)
+
+    print(f"members: {members}")
+    print(f"legacy dict layout:             {legacy / 2**20:8.2f} MiB  {legacy / members:6.0f} B/member")
+    print(f"slotted records:                {records / 2**20:8.2f} MiB  {records / members:6.0f} B/member  ({records / legacy:.0%} of legacy)")
+    print(f"slotted records + indexes:      {full / 2**20:8.2f} MiB  {full / members:6.0f} B/member  ({full / legacy:.0%} of legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Report name resolution benchmark for the Discord bot.
+
+this file measures how the member names of a long report are resolved
+against a FakeGuild whose member lookups take a simulated round trip. Only
+a share of the roster is in the library's member cache, some members left
+the guild since the session. It compares looking up every member missing
+from the cache one at a time (what fixing "Unknown member" row by row would
+cost) with utils.member_names, which requests them from the gateway in
+chunks, then renders the report again, and again after a restart, to show
+the cached names are reused, those of members who left included.
+
+usage: python benchmarks/report_names.py [--rows N] [--cached FRACTION] [--left FRACTION] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from fakes import FakeGuild
+
+
+async def one_at_a_time(guild, member_ids):
+    names = {}
+    for member_id in member_ids:
+        member = guild.get_member(member_id)
+        if member is None:
+            try:
+                member = await guild.fetch_member(member_id)
+            except LookupError:
+                continue
+        names[member_id] = member.display_name
+    return names
+
+
+def unknown(lines):
+    return sum("Unknown member" in line for line in lines)
+
+
+async def run(args):
+    # imported here so the cache file is written in the working directory set by main
+    import utils
+    from names import NameCache
+
+    rng = random.Random(args.seed)
+    guild = FakeGuild("report")
+    guild.latency = args.latency
+    rows = []
+    for i in range(args.rows):
+        member = guild.add_member(f"member-{i}")
+        roll = rng.random()
+        if roll >= args.cached:
+            # not in the member cache: Discord still knows the member, unless they left
+            del guild.members[member.id]
+            if roll < args.cached + (1 - args.cached) * (1 - args.left):
+                guild.uncached[member.id] = member
+        rows.append((member.id, rng.randrange(36000), "lecture-hall"))
+    member_ids = [row[0] for row in rows]
+    print(f"rows: {args.rows}  in the member cache: {args.cached:.0%}  left the guild: {args.left:.0%}  lookup round trip: {args.latency * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    names = await one_at_a_time(guild, member_ids)
+    elapsed = time.perf_counter() - start
+    print(f"  one lookup per missing row  {guild.requests:5d} requests  {elapsed:7.2f} s  unknown: {args.rows - len(names)}")
+
+    # the first time the departed members were seen, they were still in the guild
+    departed = [member_id for member_id in member_ids if guild.get_member(member_id) is None and member_id not in guild.uncached]
+    utils.member_names.names.clear()
+    for member_id in departed:
+        utils.member_names.put(guild.id, member_id, f"departed-{member_id}", time.time() - 2 * utils.member_names.ttl)
+
+    for label in ("batched, first report", "batched, next report"):
+        guild.requests = 0
+        start = time.perf_counter()
+        await utils.member_names.resolve(guild, member_ids)
+        lines = [utils.report_line(rank, *row, guild) for rank, row in enumerate(rows, 1)]
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<26}  {guild.requests:5d} requests  {elapsed:7.2f} s  unknown: {unknown(lines)}")
+
+    await utils.member_names.save()
+    restarted = NameCache(utils.member_names.path)
+    restarted.load()
+    utils.member_names = restarted
+    guild.requests = 0
+    lines = [utils.report_line(rank, *row, guild) for rank, row in enumerate(rows, 1)]
+    print(f"  after a restart, no lookup  {guild.requests:5d} requests  {'':9}  unknown: {unknown(lines)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row and batched member name lookups for a report.")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--cached", type=float, default=0.3, help="share of the members in the library's member cache")
+    parser.add_argument("--left", type=float, default=0.1, help="share of the uncached members who left the guild")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each lookup takes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
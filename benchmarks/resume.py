@@ -0,0 +1,125 @@
+"""
+Resume benchmark for the Discord bot.
+
+this file measures what happens in on_resumed against the fakes from
+benchmarks/fakes.py: every guild has a long roster of members tracked earlier
+in the session and a few members in the bot's channel right now. It compares
+the original handler, which reloaded the whole saved data and looked the
+channel up by name before restarting everyone in it, with
+utils.reconcile_guilds, and checks that the reconciled data matches the
+voice states.
+
+usage: python benchmarks/resume.py [--guilds N] [--roster R] [--present P] [--left L]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+import discord
+from fakes import FakeContext, FakeGuild, install_bot_user, move
+
+
+async def legacy(guilds, shard, store):
+    # the original on_resumed: reload everything saved, then find the channel by name in every guild
+    data = shard.journal.load()
+    for guild in guilds:
+        if not guild.voice_client:
+            session = data.session(guild.id)
+            if session and session.channel_name:
+                channel = discord.utils.get(guild.voice_channels, name=session.channel_name)
+                if channel:
+                    await channel.connect()
+                    now = store.now_ns()
+                    for member in channel.members:
+                        data.start(guild.id, member.id, channel, now)
+    return data
+
+
+async def run(args):
+    # imported here so the bot's modules read and write their files in the working directory set by main
+    import shared
+    import store
+    import utils
+    import events
+    import commands
+
+    rng = random.Random(args.seed)
+    bot_user = install_bot_user(shared.bot)
+    # the fake guilds all belong to shard 0, like every guild of a bot without sharding
+    shard = utils.shards.get(0)
+    voice_data = shard.store
+    print(f"guilds: {args.guilds}  roster/guild: {args.roster}  in voice: {args.present}  left while away: {args.left}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        shard.ingest.start()
+        guilds = []
+        for g in range(args.guilds):
+            guild = FakeGuild(f"guild-{g}", voice_channels=2, text_channels=("project-oculus",))
+            guild.me = guild.add_member(bot_user.name, bot_user.id)
+            members = [guild.add_member() for _ in range(args.roster)]
+            home = guild.voice_channels[0]
+            # the whole roster attended earlier, only the last members are still in the channel
+            for member in members:
+                move(member, home)
+            move(guild.me, home)
+            await commands.join.callback(FakeContext(guild, members[0]))
+            now = store.now_ns()
+            for member in members[:-args.present]:
+                move(member, None)
+                voice_data.stop(guild.id, member.id, now)
+            guilds.append((guild, members[-args.present:]))
+        await utils.save_voice_data()
+
+        # the connection drops, some members leave and some join while the bot is away
+        disconnected = store.now_ns()
+        for guild, present in guilds:
+            guild.voice_client = None
+            move(guild.me, None)
+            for member in rng.sample(present, args.left):
+                move(member, None)
+            for _ in range(args.left):
+                move(guild.add_member(), guild.voice_channels[0])
+
+        start = time.perf_counter()
+        await legacy([guild for guild, _ in guilds], shard, store)
+        baseline = time.perf_counter() - start
+
+        for guild, _ in guilds:
+            guild.voice_client = None
+            move(guild.me, None)
+        start = time.perf_counter()
+        await utils.reconcile_guilds([guild for guild, _ in guilds], disconnected)
+        elapsed = time.perf_counter() - start
+        shard.ingest.flush()
+
+    correct = all(
+        voice_data.session(guild.id).channels.get(guild.voice_channels[0].id, set())
+        == {member.id for member in guild.voice_channels[0].members}
+        for guild, _ in guilds
+    )
+    print(f"{'reload and restart (original)':<32} {baseline * 1000:10.1f} ms")
+    print(f"{'reconcile_guilds':<32} {elapsed * 1000:10.1f} ms  ({baseline / elapsed:5.1f}x)")
+    print(f"open intervals match the voice states: {correct}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the resume handler against fake guilds.")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--roster", type=int, default=2000, help="members tracked earlier in each guild")
+    parser.add_argument("--present", type=int, default=50, help="members still in the bot's channel of each guild")
+    parser.add_argument("--left", type=int, default=10, help="members of each guild who leave (and join) while the bot is away")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
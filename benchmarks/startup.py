@@ -0,0 +1,101 @@
+"""
+Startup benchmark for the Discord bot.
+
+this file measures the guild work done in on_ready against the fakes from
+benchmarks/fakes.py, where every API call (sending a message, creating a
+channel) takes a simulated round trip. It compares the original startup, which
+greeted and then checked each guild one at a time in two loops, with
+utils.prepare_guilds at a few concurrency limits, and reports the time to
+ready for each.
+
+usage: python benchmarks/startup.py [--guilds N] [--missing FRACTION] [--latency SECONDS] [--concurrency C ...]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from fakes import FakeGuild, install_bot_user
+
+
+def build_guilds(count, missing, latency, seed):
+    rng = random.Random(seed)
+    guilds = []
+    for g in range(count):
+        names = ["general", "announcements"] + [f"text-{i}" for i in range(20)]
+        if rng.random() >= missing:
+            names.append("project-oculus")
+        guild = FakeGuild(f"guild-{g}", text_channels=names)
+        guild.latency = latency
+        guilds.append(guild)
+    return guilds
+
+
+async def sequential(guilds, utils):
+    # the original on_ready: greet every guild, then make sure each one has the channel
+    for guild in guilds:
+        target_channel = None
+        for channel in guild.text_channels:
+            if "project-oculus" in channel.name.lower():
+                target_channel = channel
+                break
+        if target_channel:
+            await target_channel.send(utils.GREETING_TEXT)
+    for guild in guilds:
+        await utils.ensure_bot_channel(guild)
+
+
+async def concurrent(guilds, utils, concurrency):
+    results = await utils.prepare_guilds(guilds, concurrency)
+    return [result[0] for result in results if result and result[0] and not result[1]]
+
+
+async def run(args):
+    # imported here so the bot's modules read and write their files in the working directory set by main
+    import shared
+    import utils
+
+    install_bot_user(shared.bot)
+    print(f"guilds: {args.guilds}  missing channel: {args.missing:.0%}  simulated API latency: {args.latency * 1000:.0f} ms")
+    with contextlib.redirect_stdout(io.StringIO()):
+        guilds = build_guilds(args.guilds, args.missing, args.latency, args.seed)
+        start = time.perf_counter()
+        await sequential(guilds, utils)
+        baseline = time.perf_counter() - start
+    print(f"{'sequential (original)':<28} ready in {baseline:8.2f} s")
+
+    for concurrency in args.concurrency:
+        with contextlib.redirect_stdout(io.StringIO()):
+            guilds = build_guilds(args.guilds, args.missing, args.latency, args.seed)
+            start = time.perf_counter()
+            channels = await concurrent(guilds, utils, concurrency)
+            ready = time.perf_counter() - start
+            # greetings are sent after the bot is ready
+            await utils.greet_guilds(channels)
+            greeted = time.perf_counter() - start
+        print(
+            f"{f'prepare_guilds, {concurrency} at once':<28} ready in {ready:8.2f} s"
+            f"  ({baseline / ready:5.1f}x)  greetings done at {greeted:8.2f} s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the startup guild work against fake guilds.")
+    parser.add_argument("--guilds", type=int, default=500)
+    parser.add_argument("--missing", type=float, default=0.1, help="share of guilds without the bot's channel")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each simulated API call takes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Voice-event storm benchmark for the Discord bot.
+
+this file drives the real on_voice_state_update handler and the /list and
+/leave commands against the fakes from benchmarks/fakes.py: every guild gets
+a tracked session (the bot's channel, plus more with /track), then a random mix of joins, leaves, moves between voice
+channels, mute toggles (updates that don't change channel) and bot moves is
+replayed across the guilds, in bursts between which the ingest consumer gets
+to apply what the handler queued. It reports events per second (including
+the time spent applying them), p50/p99 handler latency, the ingest batches
+and peak memory, with nothing sent over the network.
+
+The bot's files (voice_data.snapshot, the journal, the .env) are read and written
+in a temporary directory, so running it doesn't touch real data.
+
+usage: python benchmarks/voice_storm.py [--guilds N] [--members M] [--channels C] [--events E] ...
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fakes import FakeContext, FakeGuild, FakeVoiceState, install_bot_user, move
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summary(name, samples, elapsed):
+    if not samples:
+        return f"{name:<22} no calls"
+    return (
+        f"{name:<22} {len(samples):>8} calls  {len(samples) / elapsed:>10.0f}/s  "
+        f"p50 {percentile(samples, 0.50) / 1000:>8.1f} us  p99 {percentile(samples, 0.99) / 1000:>8.1f} us"
+    )
+
+
+def build_guilds(args, bot_user):
+    guilds = []
+    for g in range(args.guilds):
+        guild = FakeGuild(f"guild-{g}", voice_channels=args.channels, text_channels=("general", "project-oculus"))
+        guild.me = guild.add_member(bot_user.name, bot_user.id)
+        for _ in range(args.members):
+            guild.add_member()
+        guilds.append(guild)
+    return guilds
+
+
+async def run(args):
+    # imported here so the bot's modules read and write their files in the working directory set by main
+    import shared
+    import events
+    import commands
+    import utils
+
+    rng = random.Random(args.seed)
+    bot_user = install_bot_user(shared.bot)
+    guilds = build_guilds(args, bot_user)
+    humans = {guild.id: [m for m in guild.members.values() if m.id != bot_user.id] for guild in guilds}
+    handler = events.on_voice_state_update
+    # the fake guilds all belong to shard 0, like every guild of a bot without sharding
+    ingest = utils.shards.get(0).ingest
+    latencies = {"join": [], "leave": [], "move": [], "mute": [], "bot move": []}
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        ingest.start()
+        # start a session in every guild, with a share of the members already in the bot's channel
+        for guild in guilds:
+            home = guild.voice_channels[0]
+            for member in humans[guild.id][:int(args.members * args.occupancy)]:
+                move(member, rng.choice(guild.voice_channels))
+            author = humans[guild.id][0]
+            move(author, home)
+            move(guild.me, home)
+            await commands.join.callback(FakeContext(guild, author))
+            for channel in guild.voice_channels[1:args.tracked]:
+                await commands.track.callback(FakeContext(guild, author), channel)
+
+        ingest.flush()
+        batches, applied = ingest.batches, ingest.applied
+        start = time.perf_counter()
+        for i in range(args.events):
+            guild = rng.choice(guilds)
+            roll = rng.random()
+            if roll < args.bot_moves:
+                # the bot is dragged to another channel, the library updates the voice client first
+                channel = rng.choice(guild.voice_channels)
+                guild.voice_client.channel = channel
+                member, (before, after), kind = guild.me, move(guild.me, channel), "bot move"
+            else:
+                member = rng.choice(humans[guild.id])
+                if member.voice is None:
+                    before, after = move(member, rng.choice(guild.voice_channels))
+                    kind = "join"
+                elif roll < args.bot_moves + args.mutes:
+                    before = after = FakeVoiceState(member.voice.channel)
+                    kind = "mute"
+                elif rng.random() < args.leave_ratio:
+                    before, after = move(member, None)
+                    kind = "leave"
+                else:
+                    before, after = move(member, rng.choice(guild.voice_channels))
+                    kind = "move"
+            t = time.perf_counter_ns()
+            await handler(member, before, after)
+            latencies[kind].append(time.perf_counter_ns() - t)
+            if i % args.burst == args.burst - 1:
+                # the gateway reader yields to the loop, the consumer applies the burst
+                await asyncio.sleep(0)
+        ingest.flush()
+        elapsed = time.perf_counter() - start
+        batches, applied = ingest.batches - batches, ingest.applied - applied
+
+        # /list then /leave in every guild, the author joins the bot's channel first
+        command_latencies = {"/list": [], "/leave": []}
+        command_start = time.perf_counter()
+        for guild in guilds:
+            author = humans[guild.id][0]
+            t = time.perf_counter_ns()
+            await commands.list.callback(FakeContext(guild, author), args.static, None, args.min_attendance, args.timeline)
+            command_latencies["/list"].append(time.perf_counter_ns() - t)
+            move(author, guild.voice_client.channel)
+            t = time.perf_counter_ns()
+            await commands.leave.callback(FakeContext(guild, author), args.static, None, args.min_attendance, args.timeline)
+            command_latencies["/leave"].append(time.perf_counter_ns() - t)
+        command_elapsed = time.perf_counter() - command_start
+
+    if args.tracemalloc:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_line = f"peak traced memory: {peak / 2**20:.2f} MiB"
+    else:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak_line = f"peak RSS: {peak / (2**20 if sys.platform == 'darwin' else 2**10):.2f} MiB"
+
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"guilds: {args.guilds}  members/guild: {args.members}  voice channels/guild: {args.channels}")
+    print(f"events: {total} in {elapsed:.3f} s  ({total / elapsed:.0f} events/s)")
+    print(summary("all events", [s for samples in latencies.values() for s in samples], elapsed))
+    for kind, samples in latencies.items():
+        print(summary(kind, samples, elapsed))
+    for name, samples in command_latencies.items():
+        print(summary(name, samples, command_elapsed))
+    print(f"ingest: {applied} transitions applied in {batches} batches ({applied / max(batches, 1):.1f} per batch)")
+    print(peak_line)
+    print(f"handler output: {len(sink.getvalue().splitlines())} lines")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a synthetic storm of voice state updates against the bot's handlers.")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--members", type=int, default=500, help="members per guild")
+    parser.add_argument("--channels", type=int, default=4, help="voice channels per guild")
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--tracked", type=int, default=1, help="voice channels tracked per guild, the bot's and the rest with /track")
+    parser.add_argument("--occupancy", type=float, default=0.5, help="share of members in voice when the storm starts")
+    parser.add_argument("--leave-ratio", type=float, default=0.3, help="share of updates of members in voice that are leaves rather than moves")
+    parser.add_argument("--mutes", type=float, default=0.2, help="share of updates that don't change channel")
+    parser.add_argument("--bot-moves", type=float, default=0.001, help="share of updates that move the bot")
+    parser.add_argument("--burst", type=int, default=50, help="updates handled between two turns of the event loop")
+    parser.add_argument("--static", action="store_true", help="send the /list and /leave reports whole instead of paginated")
+    parser.add_argument("--min-attendance", type=int, default=None, help="run /list and /leave with this min_attendance filter")
+    parser.add_argument("--timeline", action="store_true", help="run /list and /leave with show_timeline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="report traced peak memory instead of peak RSS (slower)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
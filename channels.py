@@ -0,0 +1,158 @@
+"""
+Bot channel cache for the Discord bot.
+
+this file provides the BotChannelCache, which remembers the ID of the bot's
+'project-oculus' channel in each guild so reports are sent after one dict
+lookup instead of a scan of the guild's text channels. The cache is saved to
+'bot_channels.json' so it survives restarts, and is only invalidated when the
+channel is deleted or renamed. A lock per guild makes sure a deleted channel
+is recreated once, however many events ask for it at the same time.
+"""
+import asyncio
+import json
+import os
+
+
+class BotChannelCache:
+    """
+    Persistent {guild_id: channel_id} map of the bot's channels.
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON file the cache is saved to.
+
+    Attributes
+    ----------
+    channel_ids : dict
+        Format: {guild_id: channel_id}
+    dirty : bool
+        True if the cache changed since it was last saved.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.channel_ids = {}
+        self.dirty = False
+        self._locks = {}
+
+    def __len__(self):
+        return len(self.channel_ids)
+
+    def load(self):
+        """
+        Read the saved cache, if there is one.
+
+        Returns
+        -------
+        None
+        """
+        try:
+            with open(self.path, "r") as f:
+                self.channel_ids = {int(k): v for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            self.channel_ids = {}
+        except Exception as e:
+            print(f"Error loading the bot channel cache: {e}")
+            self.channel_ids = {}
+        self.dirty = False
+
+    def _write(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        """
+        Write the cache on a worker thread if it changed.
+
+        Returns
+        -------
+        None
+        """
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = {str(k): v for k, v in self.channel_ids.items()}
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+        except Exception as e:
+            self.dirty = True
+            print(f"Error saving the bot channel cache: {e}")
+
+    def get(self, guild):
+        """
+        Return the bot's channel in a guild if it is cached and still exists.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild.
+
+        Returns
+        -------
+        discord.TextChannel or None
+            The channel, or None on a cache miss.
+        """
+        channel_id = self.channel_ids.get(guild.id)
+        return guild.get_channel(channel_id) if channel_id is not None else None
+
+    def set(self, guild_id, channel_id):
+        """
+        Remember the bot's channel of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel_id : int
+            The ID of the channel.
+
+        Returns
+        -------
+        None
+        """
+        if self.channel_ids.get(guild_id) != channel_id:
+            self.channel_ids[guild_id] = channel_id
+            self.dirty = True
+
+    def invalidate(self, guild_id, channel_id=None):
+        """
+        Forget the bot's channel of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel_id : int, optional
+            Only forget it if it is this channel.
+
+        Returns
+        -------
+        bool
+            True if an entry was removed.
+        """
+        if guild_id in self.channel_ids and channel_id in (None, self.channel_ids[guild_id]):
+            del self.channel_ids[guild_id]
+            self.dirty = True
+            return True
+        return False
+
+    def lock(self, guild_id):
+        """
+        Return the lock serializing the lookups and creations of a guild's channel.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        asyncio.Lock
+            The guild's lock.
+        """
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = self._locks[guild_id] = asyncio.Lock()
+        return lock
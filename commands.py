@@ -8,14 +8,24 @@ restricted to users with specific roles.
 """
 
 import discord
+import asyncio
 import datetime
+import heapq
+import time
+import timeline
 from discord.ext import commands
-from shared import bot, voice_data, global_start_time
-from utils import save_voice_data, load_voice_data, format_time, send_paginated_time_logs
+from shared import bot, global_start_time
+from store import now_ns
+from utils import save_voice_data, load_voice_data, format_time, send_paginated_time_logs, join_voice, attendance_history, metrics, shards, scheduler, member_names
+from reports import ReportSnapshot
+from export import FORMATS, export_rows, build_export
+from history import day_of, DAY
+from schedules import time_of_day, parse_schedule, WEEKDAYS
 
 
 @bot.slash_command(name="join", description="The bot will join the server")
 @commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
 async def join(ctx):
     """
     Joins the voice channel that the user is in.
@@ -33,39 +43,25 @@ async def join(ctx):
     None
     """
     await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    shard.ingest.flush()
     
     # checks if bot is already in a voice channel in this guild
-    existing_vc = discord.utils.get(bot.voice_clients, guild=ctx.guild)
+    existing_vc = ctx.guild.voice_client
     if existing_vc and existing_vc.is_connected():
         return await ctx.respond(f"{bot.user.name} is already connected to {existing_vc.channel.name}")
     
     if ctx.author.voice:
         channel = ctx.author.voice.channel
         try:
-            voice_client = await channel.connect()
-            now = datetime.datetime.now()
+            # channels registered with /track keep their session, the bot's channel is added to it
+            await join_voice(shard, ctx.guild, channel)
     
             # set global start time
             global global_start_time
-            global_start_time = now
+            global_start_time = datetime.datetime.now()
     
-            # add bot to voice_data
-            voice_data[bot.user.id] = {
-                "join_time": now,
-                "total_duration": datetime.timedelta(),
-                "channel_name": channel.name
-            }
-    
-            # Initialize voice_data for all members already in the channel
-            for member in channel.members:
-                if member.id != bot.user.id:
-                    voice_data[member.id] = {
-                        "join_time": now,
-                        "total_duration": datetime.timedelta(),
-                        "channel_name": channel.name
-                    }
-    
-            print(f"Bot joined voice channel: {channel.name} at {now}")
+            print(f"Bot joined voice channel: {channel.name} at {global_start_time}")
             await ctx.respond(f"{bot.user.name} joined voice channel: {channel.name}")
         except Exception as e:
             await ctx.respond(f"Error joining voice channel: {e}")
@@ -73,72 +69,182 @@ async def join(ctx):
         await ctx.respond("You are not connected to a voice channel.")
  
 
+def parse_clock(text, now):
+    """
+    Parse a time of day given as HH:MM (UTC) into its latest occurrence.
+    
+    Parameters
+    ----------
+    text : str
+        The time, e.g. "19:30".
+    now : int
+        Current wall-clock nanoseconds (time.time_ns).
+        
+    Returns
+    -------
+    int
+        Wall-clock nanoseconds of the last time the clock showed that time, today or yesterday.
+    """
+    seconds = day_of(now / 1_000_000_000) * DAY + time_of_day(text)
+    if seconds * 1_000_000_000 > now:
+        seconds -= DAY
+    return seconds * 1_000_000_000
+
+
+def filter_rows(rows, intervals, present_at=None, min_attendance=None, now=None):
+    """
+    Keep the report rows of the members who match the /list and /leave filters.
+    
+    Parameters
+    ----------
+    rows : list of tuple
+        (member_id, seconds, channel_name) rows of the report.
+    intervals : tuple
+        (members, starts, ends) of the session, see SessionStore.intervals.
+    present_at : int, optional
+        Wall-clock nanoseconds the members must have been connected at.
+    min_attendance : int, optional
+        Percentage of the session, from its first join to now, the members must have been connected for.
+    now : int, optional
+        Wall-clock nanoseconds the session is measured up to.
+        
+    Returns
+    -------
+    list of tuple
+        The matching rows, in the same order.
+    """
+    if present_at is not None:
+        present = timeline.present_at(intervals, present_at)
+        rows = [row for row in rows if row[0] in present]
+    if min_attendance is not None and len(intervals[1]):
+        shares = timeline.attendance(intervals, timeline.first_start(intervals), now)
+        rows = [row for row in rows if shares.get(row[0], 0) * 100 >= min_attendance]
+    return rows
+
+
+def timeline_summary(intervals, now, samples=24):
+    """
+    Describe how many members were connected over the session.
+    
+    Parameters
+    ----------
+    intervals : tuple
+        (members, starts, ends) of the session, see SessionStore.intervals.
+    now : int
+        Wall-clock nanoseconds the session is measured up to.
+    samples : int, optional
+        Number of points of the curve.
+        
+    Returns
+    -------
+    str
+        A line with the curve of the number of members connected and its peak.
+    """
+    if not len(intervals[1]):
+        return "Nobody was connected during this session."
+    start = timeline.first_start(intervals)
+    step = max((now - start) // samples, 1)
+    counts = timeline.concurrency(intervals, [start + i * step for i in range(samples)])
+    highest, highest_at = timeline.peak(intervals)
+    bars = "▁▂▃▄▅▆▇█"
+    curve = "".join(bars[min(len(bars) - 1, count * len(bars) // (highest + 1))] if count else " " for count in counts)
+
+    def clock(ns):
+        return datetime.datetime.fromtimestamp(ns / 1_000_000_000, datetime.timezone.utc).strftime("%H:%M")
+
+    return f"Members connected from {clock(start)} to {clock(now)} UTC: `{curve}` peak of {highest} at {clock(highest_at)} UTC."
+
+
 @bot.slash_command(name="leave", description="Leaves the voice channel and sends the time spent by each member and the bot")
 @commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
-async def leave(ctx):
+@metrics.timed("command")
+async def leave(
+    ctx,
+    static: discord.Option(bool, "Send the whole report at once instead of a paginated message", required=False, default=False),
+    present_at: discord.Option(str, "Only members connected at this time of day, HH:MM UTC", required=False, default=None),
+    min_attendance: discord.Option(int, "Only members connected for at least this % of the session", required=False, default=None, min_value=1, max_value=100),
+    show_timeline: discord.Option(bool, "Also show how many members were connected over the session", required=False, default=False)
+):
     """
     Leave the voice channel and display time tracking results.
     
     This command makes the bot leave the voice channel and displays a paginated
-    list of all members' time spent in the channel, sorted by duration.
-    The user must be in the same voice channel as the bot.
+    list of all members' time spent in the guild's tracked channels, sorted by
+    duration, then stops tracking them. The user must be in the same voice
+    channel as the bot; if the bot isn't connected, it ends the tracking of
+    the channels registered with /track.
     
     Parameters
     ----------
     ctx : discord.ApplicationContext
         The context of the slash command.
+    static : bool, optional
+        Send the whole report at once instead of a paginated message.
+    present_at : str, optional
+        Only list the members connected at this time of day (HH:MM, UTC).
+    min_attendance : int, optional
+        Only list the members connected for at least this percentage of
+        the session, counted from its first join.
+    show_timeline : bool, optional
+        Also show the number of members connected over the session and its peak.
         
     Returns
     -------
     None
     """
     await ctx.defer()
-    save_voice_data()
+    shard = shards.for_guild(ctx.guild)
+    try:
+        present_ns = parse_clock(present_at, time.time_ns()) if present_at else None
+    except ValueError:
+        return await ctx.respond(f"{present_at} is not a time of day, use HH:MM (UTC).")
+    shard.ingest.flush()  # apply the transitions still queued before totalling
+    await save_voice_data(shard)
 
     # retrieve the correct voice_client for the guild
-    voice_client = discord.utils.get(bot.voice_clients, guild=ctx.guild)
-    if voice_client and voice_client.is_connected():
+    voice_client = ctx.guild.voice_client
+    connected = voice_client and voice_client.is_connected()
+    session = shard.store.session(ctx.guild.id)
+    if connected and not (ctx.author.voice and ctx.author.voice.channel == voice_client.channel):
+        await ctx.respond("You are not in the same voice channel as the bot.")
+    elif not connected and not (session and session.tracked):
+        await ctx.respond("I am not connected to a voice channel.")
+    else:
         try:
-            if ctx.author.voice and ctx.author.voice.channel == voice_client.channel:
-                now = datetime.datetime.now()
-                members_data = []
-
-                # update durations for members still in voice channels
-                for member_id, data in voice_data.items():
-                    join_time = data['join_time']
-                    if join_time:
-                        duration = now - join_time
-                        data['total_duration'] += duration
-                        data['join_time'] = None
-
-                # sort voice_data by total_duration (descending order)
-                sorted_members = sorted(
-                    voice_data.items(),
-                    key=lambda x: x[1]["total_duration"].total_seconds(),
-                    reverse=True
-                )
-
-                for member_id, data in sorted_members:
-                    member = ctx.guild.get_member(member_id)
-                    member_name = member.name if member else f"Unknown member (ID: {member_id})"
-                    total_duration = format_time(data['total_duration'])
-                    members_data.append(f"**{member_name}** was in {data['channel_name']} for: {total_duration}")
-
-                await send_paginated_time_logs(ctx, members_data)
-
-                voice_data.clear()
+            now = now_ns()
+
+            # update durations for members of this guild still in voice channels
+            shard.store.stop_guild(ctx.guild.id, now)
+
+            # the guild's members by total_duration (descending order), kept sorted by the leaderboard
+            sorted_members = shard.store.ranking(ctx.guild.id, now)
+            if session is not None and (present_ns is not None or min_attendance or show_timeline):
+                intervals = shard.store.intervals(ctx.guild.id, now)
+                wall_now = session.to_wall_ns(now)
+                sorted_members = filter_rows(sorted_members, intervals, present_ns, min_attendance, wall_now)
+                if show_timeline:
+                    await ctx.respond(timeline_summary(intervals, wall_now))
+            await send_paginated_time_logs(ctx, sorted_members, static)
+
+            shard.store.clear_guild(ctx.guild.id)
+            if connected:
                 await voice_client.disconnect()
                 await ctx.respond(f"{bot.user.name} left the voice channel.")
             else:
-                await ctx.respond("You are not in the same voice channel as the bot.")
+                await ctx.respond("Stopped tracking this server's voice channels.")
         except Exception as e:
             await ctx.respond(f"Error leaving voice channel: {e}")
-    else:
-        await ctx.respond("I am not connected to a voice channel.")
  
 @bot.slash_command(name="list", description="Returns a numbered, sorted list of durations")
 @commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
-async def list(ctx):
+@metrics.timed("command")
+async def list(
+    ctx,
+    static: discord.Option(bool, "Send the whole report at once instead of a paginated message", required=False, default=False),
+    present_at: discord.Option(str, "Only members connected at this time of day, HH:MM UTC", required=False, default=None),
+    min_attendance: discord.Option(int, "Only members connected for at least this % of the session", required=False, default=None, min_value=1, max_value=100),
+    show_timeline: discord.Option(bool, "Also show how many members were connected over the session", required=False, default=False)
+):
     """
     Displays a real-time list of time spent by members in the same voice channel.
     
@@ -150,59 +256,55 @@ async def list(ctx):
     ----------
     ctx : discord.ApplicationContext
         The context of the slash command.
+    static : bool, optional
+        Send the whole report at once instead of a paginated message.
+    present_at : str, optional
+        Only list the members connected at this time of day (HH:MM, UTC).
+    min_attendance : int, optional
+        Only list the members connected for at least this percentage of
+        the session, counted from its first join.
+    show_timeline : bool, optional
+        Also show the number of members connected over the session and its peak.
         
     Returns
     -------
     None
     """
     await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    try:
+        present_ns = parse_clock(present_at, time.time_ns()) if present_at else None
+    except ValueError:
+        return await ctx.respond(f"{present_at} is not a time of day, use HH:MM (UTC).")
     await ctx.respond("Generating real-time list...")
     print("list command called")
     
-    # create a copy of voice_data to avoid modifying the original (do not touch this)
-    temp_voice_data = {}
-    now = datetime.datetime.now()
-    members_data = []
-    
-    # update durations for members still in voice channels
-    for member_id, data in voice_data.items():
-        # create a copy of the member data
-        temp_data = {
-            "join_time": data["join_time"],
-            "total_duration": datetime.timedelta(seconds=data["total_duration"].total_seconds()),
-            "channel_name": data["channel_name"]
-        }
-        
-        # calculate current session duration if member is in a voice channel
-        if temp_data["join_time"]:
-            current_duration = now - temp_data["join_time"]
-            temp_data["total_duration"] += current_duration
-        
-        temp_voice_data[member_id] = temp_data
- 
-    # sorts temp_voice_data by total_duration (descending order)
-    sorted_members = sorted(
-        temp_voice_data.items(),
-        key=lambda x: x[1]["total_duration"].total_seconds(),
-        reverse=True
-    )
- 
-    for member_id, data in sorted_members:
-        member = ctx.guild.get_member(member_id)
-        member_name = member.name if member else f"Unknown member (ID: {member_id})"
-        total_duration = format_time(data["total_duration"])
-        members_data.append(f"**{member_name}** was in {data['channel_name']} for: {total_duration}")
- 
-    await send_paginated_time_logs(ctx, members_data)
+    shard.ingest.flush()
+    now = now_ns()
+    
+    # totals include the current session of members still in voice channels,
+    # computed without modifying the stored data or re-sorting the roster;
+    # rows are only formatted when their page is shown
+    sorted_members = shard.store.ranking(ctx.guild.id, now)
+    session = shard.store.session(ctx.guild.id)
+    if session is not None and (present_ns is not None or min_attendance or show_timeline):
+        # one pass over the session's interval arrays for the whole roster
+        intervals = shard.store.intervals(ctx.guild.id, now)
+        wall_now = session.to_wall_ns(now)
+        sorted_members = filter_rows(sorted_members, intervals, present_ns, min_attendance, wall_now)
+        if show_timeline:
+            await ctx.respond(timeline_summary(intervals, wall_now))
+    await send_paginated_time_logs(ctx, sorted_members, static)
  
 
 @bot.slash_command(name="reset_data", description="Resets all voice activity data and restarts tracking")
 @commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
 async def reset_data(ctx):
     """
     Reset all voice activity tracking data.
     
-    This command clears all stored voice activity data and restarts tracking
+    This command clears the guild's stored voice activity data and restarts tracking
     for members currently in the voice channel if the bot is connected.
     
     Parameters
@@ -215,28 +317,423 @@ async def reset_data(ctx):
     None
     """
     await ctx.defer()
-    global voice_data
-    voice_data.clear()
-    save_voice_data()  # save the cleared data to ensure it's persisted
+    shard = shards.for_guild(ctx.guild)
+    shard.ingest.flush()  # so no queued transition lands in the fresh data
+    session = shard.store.session(ctx.guild.id)
+    tracked = [channel_id for channel_id in session.tracked if channel_id != session.channel_id] if session else []
+    shard.store.clear_guild(ctx.guild.id)
+    await save_voice_data(shard)  # save the cleared data to ensure it's persisted
  
     # check if the bot is currently in a voice channel
-    voice_client = discord.utils.get(bot.voice_clients, guild=ctx.guild)
+    now = now_ns()
+    voice_client = ctx.guild.voice_client
     if voice_client and voice_client.is_connected():
-        now = datetime.datetime.now()
         channel = voice_client.channel
-        for member in channel.members:
-            voice_data[member.id] = {
-                "join_time": now,
-                "total_duration": datetime.timedelta(),
-                "channel_name": channel.name
-            }
-        await ctx.respond("Voice activity data has been reset, and tracking has restarted for members in the current voice channel.")
+        shard.store.open_session(ctx.guild.id, channel, [member.id for member in channel.members], now)
+
+    # channels registered with /track stay tracked
+    for channel_id in tracked:
+        channel = ctx.guild.get_channel(channel_id)
+        if channel is not None:
+            shard.store.track(ctx.guild.id, channel, primary=False)
+            for member in channel.members:
+                shard.store.start(ctx.guild.id, member.id, channel, now)
+
+    if shard.store.session(ctx.guild.id):
+        await ctx.respond("Voice activity data has been reset, and tracking has restarted for members in the tracked voice channels.")
     else:
         await ctx.respond("Voice activity data has been reset. The bot is not currently in a voice channel, so no members are being tracked.")
  
 
+@bot.slash_command(name="track", description="Tracks a voice channel without the bot having to join it")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def track(
+    ctx,
+    channel: discord.Option(discord.VoiceChannel, "Voice channel to track")
+):
+    """
+    Start tracking a voice channel alongside the guild's other tracked channels.
+    
+    Members already in the channel are tracked right away. Any number of
+    channels can be tracked at once, their members are listed together by
+    /list and /leave.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+    channel : discord.VoiceChannel
+        The voice channel to track.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    shard.ingest.flush()
+    if shard.store.tracking(channel.id):
+        return await ctx.respond(f"{channel.name} is already being tracked.")
+
+    now = now_ns()
+    shard.store.track(ctx.guild.id, channel, primary=False)
+    for member in channel.members:
+        shard.store.start(ctx.guild.id, member.id, channel, now)
+    print(f"Started tracking {channel.name} in {ctx.guild.name}")
+    await ctx.respond(f"Tracking {channel.name} ({len(channel.members)} member(s) in it).")
+
+
+@bot.slash_command(name="untrack", description="Stops tracking a voice channel registered with /track")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def untrack(
+    ctx,
+    channel: discord.Option(discord.VoiceChannel, "Voice channel to stop tracking")
+):
+    """
+    Stop tracking a voice channel.
+    
+    The time of the members in it is closed out and kept for /list and
+    /leave. The bot's own channel is left with /leave instead.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+    channel : discord.VoiceChannel
+        The voice channel to stop tracking.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    shard.ingest.flush()
+    session = shard.store.tracking(channel.id)
+    if session is None:
+        return await ctx.respond(f"{channel.name} is not being tracked.")
+    if channel.id == session.channel_id:
+        return await ctx.respond(f"{channel.name} is the bot's voice channel, use /leave instead.")
+
+    closed = shard.store.untrack(ctx.guild.id, channel.id, now_ns())
+    print(f"Stopped tracking {channel.name} in {ctx.guild.name}")
+    await ctx.respond(f"Stopped tracking {channel.name} ({len(closed)} member(s) were in it).")
+
+
+@bot.slash_command(name="schedule", description="Joins and leaves a voice channel on its own every week")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def schedule(
+    ctx,
+    channel: discord.Option(discord.VoiceChannel, "Voice channel the bot joins"),
+    day: discord.Option(str, "Day of the week", choices=[day.capitalize() for day in WEEKDAYS]),
+    start: discord.Option(str, "Start time, HH:MM UTC"),
+    end: discord.Option(str, "End time, HH:MM UTC")
+):
+    """
+    Add a weekly session, e.g. every Tue 18:00-20:00 in #lecture-hall.
+    
+    At the start time the bot joins the channel like /join, at the end time
+    it sends the report and leaves like /leave. A session that is already
+    within its hours is started right away.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+    channel : discord.VoiceChannel
+        The voice channel the bot joins.
+    day : str
+        The day of the week.
+    start : str
+        The start time, HH:MM in UTC.
+    end : str
+        The end time, HH:MM in UTC, earlier than start for a session past midnight.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.defer()
+    try:
+        offset, length = parse_schedule(day, start, end)
+    except ValueError as e:
+        return await ctx.respond(f"Invalid schedule: {e}. Times are HH:MM (UTC).")
+    shard = shards.for_guild(ctx.guild)
+    added = shard.store.add_schedule(ctx.guild.id, channel, offset, length)
+    await save_voice_data(shard)
+    scheduler.add(shard, added)
+    print(f"Added schedule {added.describe()} in {ctx.guild.name}")
+    await ctx.respond(f"Scheduled {added.describe()}.")
+
+
+@bot.slash_command(name="unschedule", description="Removes a weekly session added with /schedule")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def unschedule(
+    ctx,
+    number: discord.Option(int, "Number of the schedule, see /schedules")
+):
+    """
+    Remove a weekly session. A session it started keeps going until /leave.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+    number : int
+        The ID of the schedule.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    existing = shard.store.schedules.get(number)
+    if existing is None or existing.guild_id != ctx.guild.id:
+        return await ctx.respond(f"There is no schedule #{number} in this server, see /schedules.")
+    # its queued firing is dropped by the scheduler when it comes up
+    shard.store.remove_schedule(number)
+    await save_voice_data(shard)
+    await ctx.respond(f"Removed {existing.describe()}.")
+
+
+@bot.slash_command(name="schedules", description="Lists the weekly sessions of this server")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def schedules(ctx):
+    """
+    List the weekly sessions added with /schedule.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+        
+    Returns
+    -------
+    None
+    """
+    found = shards.for_guild(ctx.guild).store.guild_schedules(ctx.guild.id)
+    if not found:
+        return await ctx.respond("No weekly sessions, add one with /schedule.")
+    lines = [schedule.describe() for schedule in found[:25]]
+    if len(found) > 25:
+        lines.append(f"...and {len(found) - 25} more.")
+    await ctx.respond("\n".join(lines))
+
+
+@bot.slash_command(name="history", description="Shows past attendance from the history database")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def history(
+    ctx,
+    member: discord.Option(discord.Member, "Member to total up, leave empty for the last 10 sessions", required=False, default=None),
+    days: discord.Option(int, "How many days back to look for the member, today included", required=False, default=30, min_value=1)
+):
+    """
+    Display attendance history stored in the SQLite database.
+    
+    With a member, shows the total time they spent in tracked sessions of
+    this guild over the last days (UTC), read from the daily rollups and
+    including their current interval. Without one, shows the attendance of
+    the guild's last 10 sessions. Only available if HISTORY_DB is set.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+    member : discord.Member, optional
+        The member to total up.
+    days : int, optional
+        How many days back to look for the member, today included.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    if not attendance_history:
+        return await ctx.respond("Attendance history is not enabled, set HISTORY_DB in the .env file.")
+
+    # queries run on a worker thread so the event loop never waits on the database
+    loop = asyncio.get_running_loop()
+    if member:
+        # intervals closed since the last save are written first, the one still running is added on top
+        shard.ingest.flush()
+        await save_voice_data(shard)
+        total_duration = await loop.run_in_executor(None, attendance_history.member_total, ctx.guild.id, member.id, days)
+        since = (day_of(datetime.datetime.now().timestamp()) - days + 1) * DAY
+        total_duration += datetime.timedelta(seconds=open_seconds(shard.store, ctx.guild.id, since).get(member.id, 0.0))
+        await ctx.respond(f"**{member.name}** spent {format_time(total_duration)} in tracked sessions over the last {days} day(s).")
+        return
+
+    sessions = await loop.run_in_executor(None, attendance_history.recent_sessions, ctx.guild.id)
+    if not sessions:
+        return await ctx.respond("No sessions recorded yet.")
+    lines = []
+    for session_id, channel_name, started_at, ended_at, attendees, total_seconds in sessions:
+        ended = ended_at.strftime("%H:%M") if ended_at else "ongoing"
+        lines.append(f"**{started_at:%Y-%m-%d %H:%M}** - {ended} in {channel_name}: {attendees} member(s), {format_time(total_seconds)} in total")
+    await ctx.respond("\n".join(lines))
+ 
+
+@bot.slash_command(name="export", description="Sends the attendance data as a CSV or JSON Lines file")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def export(
+    ctx,
+    format: discord.Option(str, "File format", choices=FORMATS, required=False, default="csv"),
+    compress: discord.Option(bool, "gzip the file", required=False, default=False),
+    intervals: discord.Option(bool, "Include one row per interval after the members", required=False, default=True)
+):
+    """
+    Send the attendance data of the guild as a file attachment.
+    
+    The file has one row per member with their rank, ID, name, channel and
+    raw seconds, then (unless disabled) one row per interval of the current
+    session with its start and end. Closed intervals come from the history
+    database, so they are only included if HISTORY_DB is set. The rows are
+    streamed into the file on a worker thread, the formatted export is never
+    held in memory as a whole.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+    format : str, optional
+        "csv" or "jsonl".
+    compress : bool, optional
+        gzip the file.
+    intervals : bool, optional
+        Include the interval rows.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    shard.ingest.flush()
+    guild = ctx.guild
+    if intervals and attendance_history:
+        # closed intervals are read back from the history, make sure it has all of them
+        await save_voice_data(shard)
+
+    # the ranking is copied on the loop, the database query, formatting and writing happen on a worker thread
+    loop = asyncio.get_running_loop()
+    now = now_ns()
+    snapshot = ReportSnapshot(guild.id, shard.store.iter_ranking(guild.id, now))
+    closed, running, channel_names = (), (), {}
+    if intervals:
+        session = shard.store.session(guild.id)
+        if session is not None:
+            running = shard.store.open_intervals(guild.id)
+            channel_names = dict(session.channel_names)
+        session_id = await loop.run_in_executor(None, attendance_history.current_session, guild.id) if attendance_history else None
+        if session_id is not None:
+            closed = attendance_history.iter_intervals(session_id)
+    rows = export_rows(snapshot, guild, closed, running, channel_names)
+
+    try:
+        buffer, size = await loop.run_in_executor(None, build_export, rows, format, compress)
+    except Exception as e:
+        return await ctx.respond(f"Error building the export: {e}")
+    with buffer:
+        limit = getattr(guild, "filesize_limit", 8 * 2**20)
+        if size > limit:
+            return await ctx.respond(f"The export is {size / 2**20:.1f} MiB, over this server's {limit / 2**20:.0f} MiB upload limit, try compress.")
+        filename = f"attendance-{guild.id}.{format}" + (".gz" if compress else "")
+        await ctx.respond(f"{len(snapshot)} member(s) exported.", file=discord.File(buffer, filename=filename))
+ 
+
+def open_seconds(store, guild_id, since):
+    """
+    Time spent since a given time by the members of a guild whose interval is still running.
+    
+    Parameters
+    ----------
+    store : SessionStore
+        The store of the guild's shard.
+    guild_id : int
+        The ID of the guild.
+    since : float
+        UNIX time to count from, earlier parts of the intervals are left out.
+        
+    Returns
+    -------
+    dict
+        Format: {member_id: seconds}
+    """
+    now = datetime.datetime.now().timestamp()
+    return {
+        member_id: max(0.0, now - max(joined, since))
+        for member_id, _, joined in store.open_intervals(guild_id)
+    }
+
+
+@bot.slash_command(name="top", description="Shows who spent the most time in tracked channels today or this week")
+@commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
+async def top(
+    ctx,
+    period: discord.Option(str, "Today or this week (UTC, weeks start on Monday)", choices=["day", "week"], required=False, default="week"),
+    count: discord.Option(int, "How many members to show", required=False, default=10, min_value=1, max_value=25)
+):
+    """
+    Display the members who spent the most time in tracked channels of the
+    guild during the current day or ISO week.
+    
+    Totals are read from the history's rollups, one row per member for the
+    period whatever the number of intervals, plus the intervals still
+    running. Only available if HISTORY_DB is set.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+    period : str, optional
+        "day" or "week".
+    count : int, optional
+        How many members to show.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.defer()
+    shard = shards.for_guild(ctx.guild)
+    if not attendance_history:
+        return await ctx.respond("Attendance history is not enabled, set HISTORY_DB in the .env file.")
+
+    # intervals closed since the last save are written first, the ones still running are added on top
+    shard.ingest.flush()
+    await save_voice_data(shard)
+    loop = asyncio.get_running_loop()
+    start, rows = await loop.run_in_executor(None, attendance_history.period_totals, ctx.guild.id, period)
+    totals = dict(rows)
+    for member_id, seconds in open_seconds(shard.store, ctx.guild.id, start).items():
+        totals[member_id] = totals.get(member_id, 0.0) + seconds
+    best = heapq.nlargest(count, totals.items(), key=lambda item: item[1])
+    if not best:
+        return await ctx.respond("Nobody was tracked yet in this period.")
+
+    title = "Today" if period == "day" else f"Week of {datetime.datetime.fromtimestamp(start, datetime.timezone.utc):%Y-%m-%d}"
+    lines = [f"**{title}**"]
+    await member_names.resolve(ctx.guild, [member_id for member_id, _ in best], bot.get_user)
+    for rank, (member_id, seconds) in enumerate(best, 1):
+        member_name = member_names.get(ctx.guild.id, member_id) or f"Unknown member (ID: {member_id})"
+        lines.append(f"{rank}. **{member_name}**: {format_time(seconds)}")
+    await ctx.respond("\n".join(lines))
+ 
+
 @bot.slash_command(name="help_me", description="Well, I hope it'll help")
 @commands.has_any_role("Moderator", "Admin", "admin", "Leaders","ADMIN", "LEADER")
+@metrics.timed("command")
 async def help_me(ctx):
     """
     Displays help information about available commands.
@@ -253,4 +750,28 @@ async def help_me(ctx):
     -------
     None
     """
-    await ctx.respond("/join: Makes the bot enter the voice channel you're in.\n/leave: The bot leaves the voice channel, you need to be in the VC for it to work; it calculates the time spent by each member and logs it.\n/list: Real-time list.\n/reset_data: Resets all voice activity data and restarts tracking.")
+    await ctx.respond("/join: Makes the bot enter the voice channel you're in.\n/leave: The bot leaves the voice channel, you need to be in the VC for it to work; it calculates the time spent by each member and logs it.\n/list: Real-time list.\n/list and /leave options: present_at (HH:MM UTC) and min_attendance (%) filter the members, show_timeline adds attendance over time.\n/reset_data: Resets all voice activity data and restarts tracking.\n/track, /untrack: Track a voice channel without the bot joining it, or stop.\n/schedule, /unschedule, /schedules: Weekly sessions the bot joins and leaves on its own (times in UTC).\n/history: Past attendance of a member or of the last sessions (needs HISTORY_DB).\n/top: Most time spent today or this week (needs HISTORY_DB).\n/export: Attendance as a CSV or JSON Lines file, with raw seconds and one row per interval.\n/stats: Handler latencies and data sizes (admins only).")
+
+
+@bot.slash_command(name="stats", description="Shows the bot's handler latencies and data sizes")
+@commands.has_any_role("Admin", "admin", "ADMIN")
+@metrics.timed("command")
+async def stats(ctx):
+    """
+    Display the bot's runtime metrics.
+    
+    Shows, for every instrumented event handler, slash command and
+    persistence call, how many times it ran, how often, its p50/p99 latency
+    and its errors, followed by the size of the tracked data. Only visible
+    to the member who ran it.
+    
+    Parameters
+    ----------
+    ctx : discord.ApplicationContext
+        The context of the slash command.
+        
+    Returns
+    -------
+    None
+    """
+    await ctx.respond(f"```\n{metrics.summary()[:1900]}\n```", ephemeral=True)
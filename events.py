@@ -4,22 +4,166 @@ Event handlers for the Discord bot.
 This file contains event listeners that respond to Discord events such as
 when the bot is ready, joins a server, connects to a voice channel, disconnects, re-connects
 , channel deletion. It manages voice tracking and ensures the bot's functionality
-across different scenarios.
+across different scenarios. With sharding, each shard is started, saved,
+disconnected and resumed on its own through the on_shard_* events.
 """
-import discord
-import datetime
-from shared import bot, voice_data, global_start_time
-from utils import load_voice_data, save_voice_data, periodic_save, ensure_bot_channel
+import time
+from shared import bot, SHARDED
+from store import now_ns
+from ingest import VoiceIngest
+from utils import load_voice_data, save_voice_data, periodic_save, ensure_bot_channel, bot_channels, prepare_guilds, greet_guilds, reconcile_guilds, GREETING, reports, Paginator, metrics, METRICS_PORT, METRICS_HOST, shards, outbox, scheduler
+
+
+def _add_ingest(shard):
+    # channel transitions waiting to be applied to the shard's store, drained by the shard's own consumer task
+    shard.ingest = VoiceIngest(shard.store, metrics)
+
+shards.on_create(_add_ingest)
+metrics.gauge("channels_tracked", "Voice channels being tracked.", lambda: sum(len(shard.store.routes) for shard in shards))
+metrics.gauge("ingest_queue", "Voice transitions waiting to be applied.", lambda: sum(len(shard.ingest) for shard in shards))
+metrics.gauge("schedules_queued", "Weekly sessions waiting for their next start or end.", lambda: len(scheduler))
+
+
+def shard_guilds(shard_id):
+    """
+    Return the guilds of a shard.
+    
+    Parameters
+    ----------
+    shard_id : int
+        The shard's ID, 0 without sharding.
+    
+    Returns
+    -------
+    list of discord.Guild
+        The guilds whose events the shard receives.
+    """
+    return [guild for guild in bot.guilds if guild.shard_id == shard_id]
+
+async def start_shard(shard, guilds):
+    """
+    Get a shard going once its gateway session is ready.
+    
+    The first time, the shard's saved data is loaded; on a later session
+    what's in memory is kept, it is newer than the files. Then its periodic
+    save and its ingest consumer are started, and its guilds are reconciled
+    with the members connected right now. The shard's weekly sessions are
+    handed to the scheduler after that, the first time, so the ones missed
+    while the bot was down are caught up on reconciled data.
+    
+    Parameters
+    ----------
+    shard : Shard
+        The shard.
+    guilds : list of discord.Guild
+        The shard's guilds.
+    
+    Returns
+    -------
+    None
+    """
+    first = not shard.loaded
+    if first:
+        # the saved intervals were right as of the last save, whoever left after that left while the bot was down
+        saved_at = shard.journal.saved_at()
+        ended = now_ns() - max(0, time.time_ns() - saved_at) if saved_at is not None else None
+        load_voice_data(shard)
+        if not shard.loaded:
+            return  # the bot is stopping, see load_voice_data
+    else:
+        ended = shard.disconnected_at
+
+    # voice events are tracked (and saved) while the guilds are being prepared
+    if shard.save_task is None or shard.save_task.done():
+        shard.save_task = bot.loop.create_task(periodic_save(shard))
+    shard.ingest.start()
+    shard.ingest.flush()
+    await reconcile_guilds(guilds, ended)
+
+    if first:
+        scheduler.load(shard)
+    scheduler.start()
+
+async def resume_shard(shard, guilds):
+    """
+    Reconcile a shard's guilds after its connection was resumed.
+    
+    The bot rejoins its channels, intervals of members who left while it was
+    away are closed at the time of the disconnection, members who are there
+    now are tracked. The data in memory is kept, it is newer than what is saved.
+    
+    Parameters
+    ----------
+    shard : Shard
+        The shard.
+    guilds : list of discord.Guild
+        The shard's guilds.
+    
+    Returns
+    -------
+    None
+    """
+    shard.ingest.flush()
+    await reconcile_guilds(guilds, shard.disconnected_at)
+
+async def stop_shard(shard, guilds):
+    """
+    Save a shard that lost its connection and remember when it did.
+    
+    Open intervals are left open, resume_shard (or start_shard) closes those
+    of the members who left in the meantime. The voice clients of the
+    shard's guilds are cleaned up and a disconnection message is queued for
+    the bot's channel in each of them.
+    
+    Parameters
+    ----------
+    shard : Shard
+        The shard.
+    guilds : list of discord.Guild
+        The shard's guilds.
+    
+    Returns
+    -------
+    None
+    """
+    shard.ingest.flush()
+    shard.disconnected_at = now_ns()
+    await save_voice_data(shard)
+
+    for guild in guilds:
+        # clean up voice clients
+        if guild.voice_client:
+            try:
+                await guild.voice_client.disconnect(force=True)
+            except Exception as e:
+                print(f"error disconnecting from voice channel: {e}")
+
+        # the cached <bot channel name> channel, no scan of the guild's channels
+        target_channel = bot_channels.get(guild)
+        
+        if target_channel:
+            # queued rather than awaited, a flapping connection replaces its unsent farewell instead of adding one
+            outbox.post(
+                target_channel,
+                "error detected! system malfunction! the internet!!! beep beep initiating shutdown... or maybe just rebooting... the end is neaaaarr!!",
+                key=("farewell", guild.id)
+            )
+        else:
+            print(f"no 'project-oculus' channel known in guild: {guild.name}")
 
 # bot events
 @bot.event
+@metrics.timed("event")
 async def on_ready():
     """
     Event handler for when the bot is ready and connected to Discord.
     
-    This function is called when the bot successfully connects to Discord.
-    It syncs commands, loads saved voice data, sends a greeting message to
-    the bot's channel in each guild, and starts the periodic save task.
+    This function is called when the bot successfully connects to Discord
+    (with sharding, once every shard is ready, see on_shard_ready).
+    It syncs commands, starts the bot's shard without sharding (see
+    start_shard), makes sure every guild has the bot's channel (several guilds at a time)
+    and reports how long that took, then greets each guild in the background
+    unless GREETING is off.
     
     Parameters
     ----------
@@ -29,35 +173,40 @@ async def on_ready():
     -------
     None
     """
+    started = time.monotonic()
     await bot.sync_commands()  # py-cord now
-    # load data into the shared variable
-    temp_data = load_voice_data()
-    voice_data.clear()
-    voice_data.update(temp_data)
+
+    # one stateless paginator serves the buttons of every report message, even after a restart
+    bot.add_view(Paginator())
+    await bot.loop.run_in_executor(None, reports.prune)
+
+    # local Prometheus endpoint, on_ready can run again after a reconnect so serve ignores repeated calls
+    if METRICS_PORT:
+        try:
+            await metrics.serve(int(METRICS_PORT), METRICS_HOST)
+        except Exception as e:
+            print(f"Error starting the metrics server: {e}")
     
     print(f'logged in as {bot.user}\n------------------------')
-    
-    # iterate through all guilds the bot is in
-    for guild in bot.guilds:
-        # find a channel with the <bot channel name> as its name
-        target_channel = None
-        for channel in guild.text_channels:
-            if "project-oculus" in channel.name.lower():  # case-insensitive check
-                target_channel = channel
-                break
-        
-        if target_channel:
-            await target_channel.send("hello!!! beep boop! if you'd like to try this bot you could add it to your server using this link: insert your bot link")
-        else:
-            print(f"no channel with 'project-oculus' in its name found in guild: {guild.name}")
-            
-    bot.loop.create_task(periodic_save())
 
-    # create <bot channel name> in all guilds if it doesn't exist
-    for guild in bot.guilds:
-        await ensure_bot_channel(guild)
+    if not SHARDED:
+        await start_shard(shards.get(0), bot.guilds)
+
+    # find or create <bot channel name> in every guild, a bounded number of guilds at a time
+    guilds = bot.guilds
+    results = await prepare_guilds(guilds)
+    await bot_channels.save()
+    elapsed = time.monotonic() - started
+    metrics.gauge("startup_seconds", "Seconds on_ready took to prepare every guild.", lambda: elapsed)
+    print(f"ready in {elapsed:.2f}s ({len(guilds)} guilds)")
+
+    # greetings go out afterwards, in the background, in the channels that weren't just created
+    if GREETING:
+        channels = [result[0] for result in results if result and result[0] and not result[1]]
+        bot.loop.create_task(greet_guilds(channels))
 
 @bot.event
+@metrics.timed("event")
 async def on_guild_join(guild):
     """
     Event handler for when the bot joins a new guild.
@@ -76,11 +225,13 @@ async def on_guild_join(guild):
     await ensure_bot_channel(guild) 
     
 @bot.event
+@metrics.timed("event")
 async def on_guild_channel_delete(channel):
     """
     Event handler for when a channel is deleted in a guild.
     
-    If the bot's dedicated channel is deleted, this recreates it.
+    If the bot's dedicated channel is deleted, this forgets its cached ID and
+    recreates it; several deletions arriving together create one channel.
     
     Parameters
     ----------
@@ -91,17 +242,62 @@ async def on_guild_channel_delete(channel):
     -------
     None
     """
-    if channel.name == "project-oculus":
-        guild = channel.guild
+    guild = channel.guild
+    # the cache knows the bot's channel by ID, the name check covers channels it hadn't seen yet
+    if bot_channels.invalidate(guild.id, channel.id) or channel.name == "project-oculus":
         await ensure_bot_channel(guild)
         
 
 @bot.event
+@metrics.timed("event")
+async def on_guild_channel_update(before, after):
+    """
+    Event handler for when a channel is updated in a guild.
+    
+    Forgets the cached ID of the bot's channel when it is renamed, the next
+    report finds (or creates) the channel again.
+    
+    Parameters
+    ----------
+    before : discord.abc.GuildChannel
+        The channel before the update.
+    after : discord.abc.GuildChannel
+        The channel after the update.
+    
+    Returns
+    -------
+    None
+    """
+    if before.name != after.name:
+        bot_channels.invalidate(after.guild.id, after.id)
+
+@bot.event
+@metrics.timed("event")
+async def on_shard_ready(shard_id):
+    """
+    Event handler for when a shard's gateway session is ready (only with sharding).
+    
+    Parameters
+    ----------
+    shard_id : int
+        The shard's ID.
+    
+    Returns
+    -------
+    None
+    """
+    print(f"shard {shard_id} ready")
+    await start_shard(shards.get(shard_id), shard_guilds(shard_id))
+
+@bot.event
+@metrics.timed("event")
 async def on_resumed():
     """
     Event handler for when the bot's connection to Discord is resumed.
     
-    Reloads voice data and attempts to reconnect to the last known voice channel.
+    Without sharding, reconciles the tracked channels with the voice states
+    the gateway reports now, see resume_shard. With sharding this is left
+    to on_shard_resumed.
     
     Parameters
     ----------
@@ -111,47 +307,38 @@ async def on_resumed():
     -------
     None
     """
-    global voice_data
-    voice_data = load_voice_data()
     print(f"{bot.user} reconnected to discord.")
+    if not SHARDED:
+        await resume_shard(shards.get(0), bot.guilds)
 
-    # attempt to reconnect to the last known voice channel
-    for guild in bot.guilds:
-        voice_client = discord.utils.get(bot.voice_clients, guild=guild)
-        if not voice_client:
-            # find the last known channel from voice_data
-            for member_id, data in voice_data.items():
-                channel_name = data.get("channel_name")
-                if channel_name:
-                    channel = discord.utils.get(guild.voice_channels, name=channel_name)
-                    if channel:
-                        try:
-                            await channel.connect()
-                            print(f"reconnected to voice channel: {channel.name}")
-                            
-                            # reinitialize voice_data for all members currently in the channel
-                            now = datetime.datetime.now()
-                            for member in channel.members:
-                                if member.id not in voice_data:
-                                    voice_data[member.id] = {
-                                        "join_time": now,
-                                        "total_duration": datetime.timedelta(),
-                                        "channel_name": channel.name
-                                    }
-                                else:
-                                    voice_data[member.id]["join_time"] = now
-                                    voice_data[member.id]["channel_name"] = channel.name
-                            break
-                        except Exception as e:
-                            print(f"failed to reconnect to voice channel {channel.name}: {e}")
+@bot.event
+@metrics.timed("event")
+async def on_shard_resumed(shard_id):
+    """
+    Event handler for when a shard's connection is resumed (only with sharding).
+    
+    Parameters
+    ----------
+    shard_id : int
+        The shard's ID.
+    
+    Returns
+    -------
+    None
+    """
+    print(f"shard {shard_id} reconnected to discord.")
+    await resume_shard(shards.get(shard_id), shard_guilds(shard_id))
 
 @bot.event
+@metrics.timed("event")
 async def on_disconnect():
     """
     Event handler for when the bot disconnects from Discord.
     
-    Updates and saves voice data, cleans up voice clients, and sends
-    a disconnection message to the bot's channel in each guild.
+    Without sharding, saves voice data and remembers when the connection was
+    lost, cleans up voice clients, and sends a disconnection message to the
+    bot's channel in each guild, see stop_shard. With sharding this is left
+    to on_shard_disconnect.
     
     Parameters
     ----------
@@ -161,45 +348,41 @@ async def on_disconnect():
     -------
     None
     """
-    now = datetime.datetime.now()
-    for member_id, data in voice_data.items():
-        if data["join_time"]:
-            data["total_duration"] += now - data["join_time"]
-            data["join_time"] = None
-    save_voice_data()
     print(f"{bot.user} disconnected from discord.")
-    
-    # clean up voice clients
-    for vc in bot.voice_clients:
-        try:
-            await vc.disconnect(force=True)
-        except Exception as e:
-            print(f"error disconnecting from voice channel: {e}")
+    if not SHARDED:
+        await stop_shard(shards.get(0), bot.guilds)
 
-    # iterate through all guilds the bot is in
-    for guild in bot.guilds:
-        # find a channel with <bot channel name> as its name
-        target_channel = None
-        for channel in guild.text_channels:
-            if "project-oculus" in channel.name.lower():  # case-insensitive check
-                target_channel = channel
-                break
-        
-        if target_channel:
-            await target_channel.send("error detected! system malfunction! the internet!!! beep beep initiating shutdown... or maybe just rebooting... the end is neaaaarr!!")
-        else:
-            print(f"no channel with 'project-oculus' in its name found in guild: {guild.name}")
+@bot.event
+@metrics.timed("event")
+async def on_shard_disconnect(shard_id):
+    """
+    Event handler for when a shard loses its connection (only with sharding).
+    
+    Parameters
+    ----------
+    shard_id : int
+        The shard's ID.
+    
+    Returns
+    -------
+    None
+    """
+    print(f"shard {shard_id} disconnected from discord.")
+    await stop_shard(shards.get(shard_id), shard_guilds(shard_id))
             
 
 # handle voice state updates
 @bot.event
+@metrics.timed("event")
 async def on_voice_state_update(member, before, after):
     """
     Event handler for when a member's voice state changes.
     
-    tracks when members join/leave the bot's voice channel and updates
-    their time tracking data accordingly. Also handles the bot's own movement
-    between voice channels.
+    tracks when members join/leave a tracked voice channel (the bot's own or
+    one registered with /track) and updates their time tracking data
+    accordingly. Also handles the bot's own movement between voice channels.
+    Updates that don't change the member's channel are dropped right away,
+    channel changes are queued and applied in batches by the ingest consumer.
     
     Parameters
     ----------
@@ -214,66 +397,27 @@ async def on_voice_state_update(member, before, after):
     -------
     None
     """
-    now = datetime.datetime.now()
-
-    # check if the bot is connected to a voice channel
-    if not bot.voice_clients:
+    # mute, deafen, stream and video toggles don't change the channel, drop them before anything else
+    if before.channel == after.channel:
         return
 
-    # find the bot's voice client in the member's guild
-    voice_client = discord.utils.get(bot.voice_clients, guild=member.guild)
-    if not voice_client:
-        return  # bot is not in a voice channel in this guild
-    
-    bot_channel = voice_client.channel
-
-    # member joined the bot's channel
-    if after.channel and after.channel.id == bot_channel.id and before.channel != after.channel:
-        # initialize or update member's data
-        if member.id not in voice_data:
-            voice_data[member.id] = {
-                "join_time": now,
-                "total_duration": datetime.timedelta(),
-                "channel_name": after.channel.name
-            }
-        else:
-            voice_data[member.id]["join_time"] = now
-            voice_data[member.id]["channel_name"] = after.channel.name
-        print(f"{member.name} joined {after.channel.name} at {now}")
-    
-    # member left the bot's channel
-    elif before.channel and before.channel.id == bot_channel.id and before.channel != after.channel:
-        if member.id in voice_data and voice_data[member.id]["join_time"]:
-            duration = now - voice_data[member.id]["join_time"]
-            voice_data[member.id]["total_duration"] += duration
-            voice_data[member.id]["join_time"] = None
-            print(f"{member.name} left {before.channel.name} after {duration}")
-    
-    # handle bot movement
+    # the bot's own moves change which channels are tracked, they're applied right
+    # away (after what's queued) so the updates that follow are routed accordingly
+    shard = shards.for_guild(member.guild)
     if member.id == bot.user.id:
-        if before.channel != after.channel:
-            # bot left a channel, update all members in that channel
-            if before.channel:
-                for member_id, data in voice_data.items():
-                    if data["join_time"] and member_id != bot.user.id:
-                        member_obj = before.channel.guild.get_member(member_id)
-                        if member_obj and member_obj.voice and member_obj.voice.channel == before.channel:
-                            duration = now - data["join_time"]
-                            data["total_duration"] += duration
-                            data["join_time"] = None
-                            print(f"Updated {member_obj.name}'s time: +{duration}")
+        moved_members = [(member.id, member.name)]
+        if after.channel:
+            moved_members += [(m.id, m.name) for m in after.channel.members if m.id != member.id]
+        shard.ingest.submit(now_ns(), member.guild, member, before.channel, after.channel, moved_members)
+        shard.ingest.flush()
+        return
+
+    # route both channels through the shard's tracked channel map, one dict lookup each however many sessions are active
+    routes = shard.store.routes
+    left = before.channel if before.channel and before.channel.id in routes else None
+    joined = after.channel if after.channel and after.channel.id in routes else None
+    if left is None and joined is None:
+        return  # neither channel is tracked
 
-            # bot joined a channel, start tracking all members already in the channel
-            if after.channel:
-                for member in after.channel.members:
-                    if member.id != bot.user.id:
-                        if member.id not in voice_data:
-                            voice_data[member.id] = {
-                                "join_time": now,
-                                "total_duration": datetime.timedelta(),
-                                "channel_name": after.channel.name
-                            }
-                        else:
-                            voice_data[member.id]["join_time"] = now
-                            voice_data[member.id]["channel_name"] = after.channel.name
-                        print(f"Started tracking {member.name} in {after.channel.name}")
+    # the transition is applied (and logged) by the ingest consumer, together with the ones that arrive alongside it
+    shard.ingest.submit(now_ns(), member.guild, member, left, joined)
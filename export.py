@@ -0,0 +1,149 @@
+"""
+Attendance export for the Discord bot.
+
+this file provides the rows and the file behind the /export command. The
+roster and the intervals are streamed through generators straight into a
+CSV or JSON Lines writer (gzip-compressed if asked), which writes to a
+spooled temporary file: small exports stay in memory, large ones spill to
+disk, and the whole formatted list never exists at once.
+"""
+import csv
+import datetime
+import gzip
+import io
+import json
+import tempfile
+
+FORMATS = ("csv", "jsonl")
+
+# columns of every row, None (an empty CSV field, null in JSON) where a column doesn't apply
+FIELDS = ("type", "rank", "member_id", "member_name", "channel", "seconds", "start", "end")
+
+# exports above this size are spooled to a temporary file instead of memory
+SPOOL_SIZE = 4 * 2**20
+
+# characters of formatted rows buffered before they are written out
+CHUNK_SIZE = 64 * 2**10
+
+
+def _iso(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+
+
+def export_rows(snapshot, guild, intervals=(), open_intervals=(), channel_names=None, now=None):
+    """
+    Generate the rows of an export: one "member" row per member in ranking
+    order, then one "interval" row per interval.
+
+    Parameters
+    ----------
+    snapshot : ReportSnapshot
+        The guild's ranking.
+    guild : discord.Guild
+        The guild used to look up member names.
+    intervals : iterable of tuple, optional
+        Closed intervals as (member_id, channel_id, start, end), times in UNIX seconds.
+    open_intervals : iterable of tuple, optional
+        Intervals still running as (member_id, channel_id, start), their end is left empty.
+    channel_names : dict, optional
+        Format: {channel_id: channel_name}
+    now : float, optional
+        UNIX time open intervals are measured up to, now by default.
+
+    Returns
+    -------
+    generator of tuple
+        Rows with the values of FIELDS, times as ISO 8601 UTC strings.
+        Members without a cached name get an empty one.
+    """
+    channel_names = channel_names or {}
+    now = now if now is not None else datetime.datetime.now(datetime.timezone.utc).timestamp()
+
+    def name(member_id):
+        member = guild.get_member(member_id) if guild else None
+        return member.name if member else ""
+
+    for rank, member_id, seconds, channel_name in snapshot.rows():
+        yield "member", rank, member_id, name(member_id), channel_name, round(seconds, 3), None, None
+    for member_id, channel_id, start, end in intervals:
+        yield "interval", None, member_id, name(member_id), channel_names.get(channel_id, channel_id), round(end - start, 3), _iso(start), _iso(end)
+    for member_id, channel_id, start in open_intervals:
+        yield "interval", None, member_id, name(member_id), channel_names.get(channel_id, channel_id), round(now - start, 3), _iso(start), None
+
+
+def write_export(rows, fileobj, fmt="csv", compress=False):
+    """
+    Write rows to a binary file as CSV or JSON Lines, one row at a time.
+
+    Parameters
+    ----------
+    rows : iterable of tuple
+        Rows with the values of FIELDS, see export_rows.
+    fileobj : file object
+        The binary file to write to, left open.
+    fmt : str, optional
+        "csv" (with a header line) or "jsonl".
+    compress : bool, optional
+        gzip the output.
+
+    Returns
+    -------
+    None
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    raw = gzip.GzipFile(fileobj=fileobj, mode="wb") if compress else fileobj
+    # rows are formatted into a small text buffer that is encoded and flushed every CHUNK_SIZE characters
+    text = io.StringIO()
+    try:
+        if fmt == "csv":
+            writer = csv.writer(text)
+            writer.writerow(FIELDS)
+            for row in rows:
+                writer.writerow(row)
+                if text.tell() >= CHUNK_SIZE:
+                    raw.write(text.getvalue().encode("utf-8"))
+                    text.seek(0)
+                    text.truncate()
+        else:
+            for row in rows:
+                text.write(json.dumps(dict(zip(FIELDS, row))))
+                text.write("\n")
+                if text.tell() >= CHUNK_SIZE:
+                    raw.write(text.getvalue().encode("utf-8"))
+                    text.seek(0)
+                    text.truncate()
+        raw.write(text.getvalue().encode("utf-8"))
+    finally:
+        # closing the gzip stream writes its trailer, fileobj itself stays open
+        if compress:
+            raw.close()
+
+
+def build_export(rows, fmt="csv", compress=False):
+    """
+    Write an export to a spooled temporary file. Blocking, meant to run on a worker thread.
+
+    Parameters
+    ----------
+    rows : iterable of tuple
+        Rows with the values of FIELDS, see export_rows.
+    fmt : str, optional
+        "csv" or "jsonl".
+    compress : bool, optional
+        gzip the output.
+
+    Returns
+    -------
+    tuple
+        (file, size): the file rewound to its start, for the caller to close, and its size in bytes.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        write_export(rows, buffer, fmt, compress)
+    except BaseException:
+        buffer.close()
+        raise
+    size = buffer.tell()
+    buffer.seek(0)
+    return buffer, size
@@ -0,0 +1,437 @@
+"""
+SQLite attendance history for the Discord bot.
+
+this file provides the optional AttendanceHistory, which keeps every tracked
+session and every closed member interval in a SQLite database instead of
+throwing them away on /leave. Rows are queued from the session store's
+events and inserted in batches, one transaction per save, and indexes on
+(guild, member, start) keep range queries fast however long the history is.
+The same transaction adds each interval to daily and weekly per-member
+rollups, which answer totals over long ranges and period leaderboards.
+"""
+import datetime
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    channel_name TEXT,
+    started_at REAL NOT NULL,
+    ended_at REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_guild_started ON sessions (guild_id, started_at);
+CREATE TABLE IF NOT EXISTS intervals (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    start REAL NOT NULL,
+    end REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS intervals_guild_member_start ON intervals (guild_id, member_id, start);
+CREATE INDEX IF NOT EXISTS intervals_session ON intervals (session_id);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (guild_id, member_id, day)
+);
+CREATE INDEX IF NOT EXISTS daily_totals_guild_day ON daily_totals (guild_id, day);
+CREATE TABLE IF NOT EXISTS weekly_totals (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (guild_id, member_id, week)
+);
+CREATE INDEX IF NOT EXISTS weekly_totals_guild_week ON weekly_totals (guild_id, week);
+"""
+
+# rollup buckets are UTC days counted from the UNIX epoch, weeks are ISO weeks
+# keyed by the day their Monday falls on (the epoch was a Thursday)
+DAY = 86400
+
+
+def day_of(timestamp):
+    """
+    Return the rollup day of a UNIX time.
+
+    Parameters
+    ----------
+    timestamp : float
+        UNIX seconds.
+
+    Returns
+    -------
+    int
+        Days since the epoch, in UTC.
+    """
+    return int(timestamp // DAY)
+
+
+def week_of(day):
+    """
+    Return the rollup week of a rollup day.
+
+    Parameters
+    ----------
+    day : int
+        Days since the epoch, see day_of.
+
+    Returns
+    -------
+    int
+        The day the ISO week's Monday falls on.
+    """
+    return day - (day + 3) % 7
+
+
+def rollup(intervals):
+    """
+    Split intervals into per-day and per-week totals.
+
+    Parameters
+    ----------
+    intervals : iterable of tuple
+        (guild_id, member_id, start, end) with times in UNIX seconds.
+
+    Returns
+    -------
+    tuple of dict
+        (daily, weekly), formats: {(guild_id, member_id, day): seconds} and
+        {(guild_id, member_id, week): seconds}.
+    """
+    daily = {}
+    weekly = {}
+    for guild_id, member_id, start, end in intervals:
+        # an interval running past midnight counts towards both days
+        while start < end:
+            day = day_of(start)
+            cut = min(end, (day + 1) * DAY)
+            seconds = cut - start
+            key = (guild_id, member_id, day)
+            daily[key] = daily.get(key, 0.0) + seconds
+            key = (guild_id, member_id, week_of(day))
+            weekly[key] = weekly.get(key, 0.0) + seconds
+            start = cut
+    return daily, weekly
+
+
+class AttendanceHistory:
+    """
+    Session and interval history stored in SQLite.
+
+    A session starts with the first join recorded in a guild and ends when
+    the guild's data is cleared (/leave or /reset_data). Timestamps are
+    stored as UNIX seconds. Every interval is also added to per-member daily
+    and weekly totals in the same transaction, so long-range totals and
+    leaderboards read one row per bucket instead of every interval.
+
+    Parameters
+    ----------
+    path : str
+        Path of the SQLite database file.
+
+    Attributes
+    ----------
+    open_sessions : dict
+        Format: {guild_id: {"id": int, "channel_id": int, "last_time": float}}
+    """
+    def __init__(self, path):
+        self.path = path
+        # writes happen on the persistence worker thread and queries on executor threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._intervals = []
+        self._closed = []
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            self._next_id = (self._conn.execute("SELECT MAX(id) FROM sessions").fetchone()[0] or 0) + 1
+            self.open_sessions = {
+                guild_id: {"id": session_id, "channel_id": channel_id, "last_time": started_at}
+                for session_id, guild_id, channel_id, started_at in self._conn.execute(
+                    "SELECT id, guild_id, channel_id, started_at FROM sessions WHERE ended_at IS NULL"
+                )
+            }
+            # databases from before the rollups existed get them built once from their intervals
+            if self._conn.execute("SELECT 1 FROM daily_totals LIMIT 1").fetchone() is None:
+                cursor = self._conn.execute("SELECT guild_id, member_id, start, end FROM intervals")
+                while True:
+                    rows = cursor.fetchmany(10000)
+                    if not rows:
+                        break
+                    self._add_rollups(rows)
+
+    def record(self, event):
+        """
+        Queue the rows described by a session store event. Meant to be
+        registered as a SessionStore listener.
+
+        Parameters
+        ----------
+        event : dict
+            The event emitted by the store.
+
+        Returns
+        -------
+        None
+        """
+        op = event["op"]
+        if op == "join":
+            guild_id = event["g"]
+            session = self.open_sessions.get(guild_id)
+            if session is None:
+                started_at = event["t"] / 1_000_000_000
+                session = self.open_sessions[guild_id] = {"id": self._next_id, "channel_id": event["c"], "last_time": started_at}
+                self._sessions.append((self._next_id, guild_id, event["c"], event["n"], started_at))
+                self._next_id += 1
+            session["channel_id"] = event["c"]
+        elif op == "leave":
+            session = self.open_sessions.get(event["g"])
+            if session is None:
+                return
+            end = event["t"] / 1_000_000_000
+            start = event["j"] / 1_000_000_000
+            # the channel the member was in, with several tracked channels it isn't the session's last one
+            self._intervals.append((session["id"], event["g"], event["m"], event["c"], start, end))
+            session["last_time"] = max(session["last_time"], end)
+        elif op == "clear":
+            session = self.open_sessions.pop(event["g"], None)
+            if session is not None:
+                self._closed.append((session["last_time"], session["id"]))
+
+    def take(self):
+        """
+        Detach the queued rows so they can be written elsewhere.
+
+        Returns
+        -------
+        tuple
+            (sessions, intervals, closed) row lists for write.
+        """
+        batch = (self._sessions, self._intervals, self._closed)
+        self._sessions, self._intervals, self._closed = [], [], []
+        return batch
+
+    def requeue(self, batch):
+        """
+        Put a batch returned by take back in front of the queue, e.g. after
+        a failed write.
+
+        Parameters
+        ----------
+        batch : tuple
+            The batch returned by take.
+
+        Returns
+        -------
+        None
+        """
+        sessions, intervals, closed = batch
+        self._sessions[:0] = sessions
+        self._intervals[:0] = intervals
+        self._closed[:0] = closed
+
+    def write(self, sessions, intervals, closed):
+        """
+        Insert a batch of rows in a single transaction.
+
+        Parameters
+        ----------
+        sessions : list
+            New session rows.
+        intervals : list
+            New interval rows.
+        closed : list
+            (ended_at, session_id) of the sessions that ended.
+
+        Returns
+        -------
+        None
+        """
+        if not (sessions or intervals or closed):
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO sessions (id, guild_id, channel_id, channel_name, started_at) VALUES (?, ?, ?, ?, ?)",
+                sessions
+            )
+            self._conn.executemany(
+                "INSERT INTO intervals (session_id, guild_id, member_id, channel_id, start, end) VALUES (?, ?, ?, ?, ?, ?)",
+                intervals
+            )
+            self._conn.executemany("UPDATE sessions SET ended_at = ? WHERE id = ?", closed)
+            self._add_rollups((guild_id, member_id, start, end) for _, guild_id, member_id, _, start, end in intervals)
+
+    def _add_rollups(self, intervals):
+        # called inside a write transaction, with the lock held
+        daily, weekly = rollup(intervals)
+        for table, column, totals in (("daily_totals", "day", daily), ("weekly_totals", "week", weekly)):
+            if not totals:
+                continue
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO {table} (guild_id, member_id, {column}, seconds) VALUES (?, ?, ?, 0)",
+                totals.keys()
+            )
+            self._conn.executemany(
+                f"UPDATE {table} SET seconds = seconds + ? WHERE guild_id = ? AND member_id = ? AND {column} = ?",
+                ((seconds,) + key for key, seconds in totals.items())
+            )
+
+    def member_total(self, guild_id, member_id, days):
+        """
+        Total time a member spent in tracked sessions of a guild, read from
+        the daily rollups.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        member_id : int
+            The ID of the member.
+        days : int
+            How many days to total, today (UTC) included.
+
+        Returns
+        -------
+        datetime.timedelta
+            The summed length of the member's intervals.
+        """
+        since = day_of(datetime.datetime.now().timestamp()) - days + 1
+        with self._lock:
+            seconds = self._conn.execute(
+                "SELECT TOTAL(seconds) FROM daily_totals WHERE guild_id = ? AND member_id = ? AND day >= ?",
+                (guild_id, member_id, since)
+            ).fetchone()[0]
+        return datetime.timedelta(seconds=seconds)
+
+    def period_totals(self, guild_id, period, timestamp=None):
+        """
+        Time spent by every member of a guild in the day or week containing
+        a time, read from the rollups.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        period : str
+            "day" or "week".
+        timestamp : float, optional
+            UNIX time inside the period, now by default.
+
+        Returns
+        -------
+        tuple
+            (start, totals): UNIX time the period starts at, and a list of
+            (member_id, seconds) longest first.
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.now().timestamp()
+        day = day_of(timestamp)
+        if period == "day":
+            table, column, bucket = "daily_totals", "day", day
+        elif period == "week":
+            table, column, bucket = "weekly_totals", "week", week_of(day)
+        else:
+            raise ValueError(f"unknown period: {period}")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT member_id, seconds FROM {table} WHERE guild_id = ? AND {column} = ? ORDER BY seconds DESC",
+                (guild_id, bucket)
+            ).fetchall()
+        return bucket * DAY, rows
+
+    def current_session(self, guild_id):
+        """
+        Return the session of a guild that is running, or the last one.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        int or None
+            The session's ID, None if the guild has no session yet.
+        """
+        session = self.open_sessions.get(guild_id)
+        if session is not None:
+            return session["id"]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM sessions WHERE guild_id = ? ORDER BY started_at DESC LIMIT 1", (guild_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def iter_intervals(self, session_id):
+        """
+        Iterate over the closed intervals of a session, oldest first.
+
+        Rows are read through a connection of their own, so a long export
+        doesn't hold the lock the writes need.
+
+        Parameters
+        ----------
+        session_id : int
+            The ID of the session.
+
+        Returns
+        -------
+        generator of tuple
+            (member_id, channel_id, start, end) per interval, times in UNIX seconds.
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            yield from conn.execute(
+                "SELECT member_id, channel_id, start, end FROM intervals WHERE session_id = ? ORDER BY start",
+                (session_id,)
+            )
+        finally:
+            conn.close()
+
+    def recent_sessions(self, guild_id, limit=10):
+        """
+        Attendance of the most recent sessions of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        limit : int, optional
+            How many sessions to return.
+
+        Returns
+        -------
+        list of tuple
+            (session_id, channel_name, started_at, ended_at, attendees, total_seconds)
+            per session, newest first. Times are datetimes, ended_at is None for
+            a session still running.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT s.id, s.channel_name, s.started_at, s.ended_at,
+                       COUNT(DISTINCT i.member_id), TOTAL(i.end - i.start)
+                FROM (SELECT * FROM sessions WHERE guild_id = ? ORDER BY started_at DESC LIMIT ?) AS s
+                LEFT JOIN intervals AS i ON i.session_id = s.id
+                GROUP BY s.id
+                ORDER BY s.started_at DESC
+                """,
+                (guild_id, limit)
+            ).fetchall()
+        return [
+            (
+                session_id,
+                channel_name,
+                datetime.datetime.fromtimestamp(started_at),
+                datetime.datetime.fromtimestamp(ended_at) if ended_at is not None else None,
+                attendees,
+                total_seconds
+            ) for session_id, channel_name, started_at, ended_at, attendees, total_seconds in rows
+        ]
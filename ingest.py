@@ -0,0 +1,193 @@
+"""
+Voice event ingestion for the Discord bot.
+
+this file provides the VoiceIngest, the stage between on_voice_state_update
+and the session store. The handler only queues the updates that move a member
+in or out of a tracked channel (mute, deafen, stream and video
+toggles are dropped before that); a single consumer task drains the queue and
+applies everything that piled up in one batch, with one print for the whole
+batch, so a burst of joins costs one wake-up instead of one per member.
+"""
+import asyncio
+import time
+from utils import format_time
+
+
+class VoiceIngest:
+    """
+    Queue of voice channel transitions applied to a session store in batches.
+
+    Every transition carries the tracked channels it involved at the time it
+    happened, so applying it later gives the same result as applying it in
+    the handler.
+
+    Parameters
+    ----------
+    store : SessionStore
+        The store the transitions are applied to.
+    metrics : Metrics, optional
+        Where to record batch latencies and join/leave counts.
+    max_batch : int, optional
+        Maximum number of transitions applied per batch.
+
+    Attributes
+    ----------
+    batches : int
+        Number of batches applied so far.
+    applied : int
+        Number of transitions applied so far.
+    """
+    def __init__(self, store, metrics=None, max_batch=1000):
+        self.store = store
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.batches = 0
+        self.applied = 0
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, now, guild, member, left, joined, moved_members=None):
+        """
+        Queue a channel transition. Cheap enough to be called from the event handler.
+
+        Parameters
+        ----------
+        now : int
+            The monotonic time of the update, see now_ns.
+        guild : discord.Guild
+            The member's guild.
+        member : discord.Member
+            The member who moved.
+        left : discord.VoiceChannel or None
+            The channel the member left, if it was tracked (or for the bot, whatever it was).
+        joined : discord.VoiceChannel or None
+            The channel the member joined, if it is tracked (or for the bot, whatever it is).
+        moved_members : list of tuple, optional
+            Only for the bot's own moves: (member_id, member_name) of the
+            members in the channel it joined, the bot included.
+
+        Returns
+        -------
+        None
+        """
+        self._pending.append((now, guild, member.id, member.name, left, joined, moved_members))
+        if self._wakeup is not None and not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def apply(self, batch):
+        """
+        Apply a batch of transitions to the store, in the order they arrived.
+
+        Parameters
+        ----------
+        batch : list
+            Transitions queued by submit.
+
+        Returns
+        -------
+        list of str
+            The log lines of the batch.
+        """
+        store = self.store
+        lines = []
+        joins = leaves = 0
+        for now, guild, member_id, member_name, left, joined, moved_members in batch:
+            guild_id = guild.id
+
+            # handle bot movement
+            if moved_members is not None:
+                session = store.session(guild_id)
+                # bot left its channel, close out the members tracked there and stop tracking it
+                if left is not None and session is not None and session.channel_id == left.id:
+                    for left_id, duration in store.untrack(guild_id, left.id, now):
+                        member_obj = guild.get_member(left_id)
+                        left_name = member_obj.name if member_obj else left_id
+                        lines.append(f"Updated {left_name}'s time: +{format_time(duration / 1_000_000_000)}")
+
+                # bot joined a channel, start tracking all members already in the channel
+                if joined is not None:
+                    store.track(guild_id, joined)
+                    for moved_id, moved_name in moved_members:
+                        store.start(guild_id, moved_id, joined, now)
+                        lines.append(f"Started tracking {moved_name} in {joined.name}")
+                continue
+
+            # member left a tracked channel
+            if left is not None:
+                duration = store.stop(guild_id, member_id, now)
+                if duration is not None:
+                    leaves += 1
+                    lines.append(f"{member_name} left {left.name} after {format_time(duration / 1_000_000_000)}")
+
+            # member joined a tracked channel
+            if joined is not None:
+                store.start(guild_id, member_id, joined, now)
+                joins += 1
+                lines.append(f"{member_name} joined {joined.name} at {store.wall_time(guild_id, now)}")
+
+        self.batches += 1
+        self.applied += len(batch)
+        if self.metrics is not None:
+            if joins:
+                self.metrics.inc("voice_joins", joins)
+            if leaves:
+                self.metrics.inc("voice_leaves", leaves)
+        return lines
+
+    def flush(self):
+        """
+        Apply everything queued right away, e.g. before a command reads or
+        resets the store.
+
+        Returns
+        -------
+        int
+            The number of transitions applied.
+        """
+        applied = 0
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            start = time.perf_counter()
+            lines = self.apply(batch)
+            if self.metrics is not None:
+                self.metrics.histogram("ingest", "apply_batch").observe(time.perf_counter() - start)
+            if lines:
+                print("\n".join(lines))
+            applied += len(batch)
+        return applied
+
+    async def run(self):
+        """
+        Consume the queue until cancelled.
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error applying voice events: {e}")
+
+    def start(self):
+        """
+        Start the consumer task on the running loop if it isn't running.
+
+        Returns
+        -------
+        None
+        """
+        if self._task is None or self._task.done():
+            # created here so it binds to the running loop
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.get_running_loop().create_task(self.run())
@@ -0,0 +1,214 @@
+"""
+Append-only journal for the Discord bot's voice data.
+
+this file provides the VoiceJournal, which records every join/leave transition
+of the session store as one JSON line in its state backend (by default the
+'voice_data.journal' file) and periodically compacts the store into a binary
+snapshot ('voice_data.snapshot', see snapshot.py). Saving only appends the
+transitions that happened since the last save, so its cost follows the
+amount of activity rather than the number of tracked members.
+"""
+import json
+from store import SessionStore
+from backends import FileBackend
+from snapshot import encode_snapshot, decode_snapshot, is_binary, LegacyVoiceData
+
+# number of journal lines after which the next flush writes a new snapshot
+COMPACT_EVERY = 5000
+
+
+class VoiceJournal:
+    """
+    Journal of session store events backed by a snapshot.
+
+    Events are numbered with a sequence number; the snapshot remembers the
+    last sequence number it includes so journal lines that were already
+    compacted are skipped on replay, even if the bot crashed before the
+    journal could be truncated.
+
+    Parameters
+    ----------
+    backend : StateBackend, optional
+        Where the snapshot and the journal are kept, the files
+        'voice_data.snapshot' and 'voice_data.journal' by default.
+    compact_every : int, optional
+        Number of journal lines after which flush compacts.
+
+    Attributes
+    ----------
+    seq : int
+        Sequence number of the last recorded event.
+    pending : list
+        Events recorded but not written yet, as (seq, line) pairs.
+    """
+    def __init__(self, backend=None, compact_every=COMPACT_EVERY):
+        self.backend = backend if backend is not None else FileBackend("voice_data.snapshot", "voice_data.journal", "voice_data.json")
+        self.compact_every = compact_every
+        self.seq = 0
+        self.pending = []
+        self.journal_lines = 0
+
+    def record(self, event):
+        """
+        Queue an event for the next flush. Meant to be registered as a
+        SessionStore listener.
+
+        Parameters
+        ----------
+        event : dict
+            The event emitted by the store.
+
+        Returns
+        -------
+        None
+        """
+        self.seq += 1
+        self.pending.append((self.seq, json.dumps({"seq": self.seq, **event}, separators=(",", ":"))))
+
+    def take(self, store=None):
+        """
+        Detach the queued events so they can be written elsewhere.
+
+        This is the only part of a save that has to run on the event loop;
+        the returned batch is immutable and can be handed to write on a
+        worker thread.
+
+        Parameters
+        ----------
+        store : SessionStore, optional
+            The store the events were recorded from. When given and the
+            journal is due for compaction, a serialized snapshot of it is
+            included in the batch.
+
+        Returns
+        -------
+        tuple
+            (lines, snapshot) where lines are (seq, line) pairs and snapshot
+            is None unless compaction is due, else (seq, encoded snapshot).
+        """
+        lines, self.pending = self.pending, []
+        snapshot = None
+        if store is not None and self.journal_lines + len(lines) >= self.compact_every:
+            snapshot = self.seq, encode_snapshot(self.seq, store)
+        return lines, snapshot
+
+    def write(self, lines, snapshot=None):
+        """
+        Append a batch of events to the journal, then write the snapshot
+        and drop the journal lines it covers if the batch carries one.
+
+        Each step is atomic in the backend: a crash or another process
+        reading the state never sees part of a batch or a half-written snapshot.
+
+        Parameters
+        ----------
+        lines : list
+            Events returned by take.
+        snapshot : tuple, optional
+            (seq, encoded snapshot) returned by take.
+
+        Returns
+        -------
+        None
+        """
+        if lines:
+            self.backend.append(lines)
+            self.journal_lines += len(lines)
+        if snapshot is not None:
+            self.backend.replace(*snapshot)
+            self.journal_lines = 0
+
+    def flush(self):
+        """
+        Append the queued events to the journal.
+
+        Returns
+        -------
+        int
+            The number of events written.
+        """
+        lines, _ = self.take()
+        self.write(lines)
+        return len(lines)
+
+    def compact(self, store):
+        """
+        Write the queued events and a snapshot of the store, dropping the journal lines it covers.
+
+        Parameters
+        ----------
+        store : SessionStore
+            The store the events were recorded from.
+
+        Returns
+        -------
+        None
+        """
+        lines, _ = self.take()
+        self.write(lines, (self.seq, encode_snapshot(self.seq, store)))
+
+    def saved_at(self):
+        """
+        Return when the snapshot or the journal was last written.
+
+        Returns
+        -------
+        int or None
+            Wall-clock nanoseconds (like time.time_ns), None if nothing was saved.
+        """
+        return self.backend.saved_at()
+
+    def load(self, migrate=None):
+        """
+        Rebuild a store from the snapshot and the journal tail.
+
+        Events still queued in memory are flushed first so they're part of
+        the result.
+
+        Parameters
+        ----------
+        migrate : callable, optional
+            Takes the members of voice data saved before guilds were tracked
+            (see LegacyVoiceData) and returns the store to migrate them to.
+            Without it such data isn't loaded.
+
+        Returns
+        -------
+        SessionStore
+            The rebuilt store.
+
+        Raises
+        ------
+        LegacyVoiceData
+            If the saved data is from before guilds were tracked and
+            migrate wasn't given (or raised it itself).
+        """
+        self.flush()
+        data, lines = self.backend.read()
+        legacy = data is not None and not is_binary(data)
+        if data is not None:
+            try:
+                snapshot_seq, store = decode_snapshot(data)
+            except LegacyVoiceData as e:
+                if migrate is None:
+                    raise
+                snapshot_seq, store = 0, migrate(e.members)
+        else:
+            snapshot_seq, store = 0, SessionStore()
+
+        seq = snapshot_seq
+        for line in lines:
+            event = json.loads(line)
+            # skips lines covered by the snapshot and lines appended twice after a failed write
+            if event["seq"] <= seq:
+                continue
+            store.apply(event)
+            seq = event["seq"]
+
+        self.seq = max(self.seq, seq)
+        self.journal_lines = len(lines)
+        if legacy:
+            # a JSON snapshot of an earlier version, rewritten once in the binary format
+            self.compact(store)
+            print("Voice data migrated to the binary snapshot format.")
+        return store
@@ -0,0 +1,234 @@
+"""
+Leaderboard for the Discord bot.
+
+this file provides the Leaderboard, which keeps the members of a guild ordered
+by time spent as joins and leaves happen, so /list and /leave never have to
+sort the whole roster.
+
+Members without an open interval are kept in one sorted list keyed by their
+closed-out duration. Members with an open interval are kept in another, keyed
+by closed-out duration minus join time: adding the current time to that key
+gives their live total, and since the current time is the same for all of
+them the order of that list never changes while time passes. Queries merge
+the two lists at the time they are made.
+"""
+from bisect import bisect_left, insort
+
+# entries pack (key, member_id) into one int: key << 64 | member_id. It sorts
+# like the tuple would (member IDs are 64-bit snowflakes) at about half the memory.
+MEMBER_BITS = 64
+MEMBER_MASK = (1 << MEMBER_BITS) - 1
+
+
+class Leaderboard:
+    """
+    Members of a guild ordered by total time spent, longest first.
+
+    Keys are stored negated so both lists are sorted ascending; entries are
+    (key, member_id) pairs packed into one int, durations and times are integer
+    nanoseconds from the store's monotonic clock, which keeps keys exact.
+
+    Attributes
+    ----------
+    closed : list
+        Packed (-total_ns, member_id) for members without an open interval.
+    open : list
+        Packed (join_ns - total_ns, member_id) for members with an open interval.
+    """
+    def __init__(self):
+        self.closed = []
+        self.open = []
+
+    def __len__(self):
+        return len(self.closed) + len(self.open)
+
+    def rebuild(self, members):
+        """
+        Replace the contents with the given members, sorting once instead of
+        inserting them one by one.
+
+        Parameters
+        ----------
+        members : iterable of tuple
+            (member_id, total_ns, join_ns) with join_ns None for members
+            without an open interval.
+
+        Returns
+        -------
+        None
+        """
+        self.closed, self.open = [], []
+        for member_id, total_ns, join_ns in members:
+            if join_ns is None:
+                self.closed.append((-total_ns) << MEMBER_BITS | member_id)
+            else:
+                self.open.append((join_ns - total_ns) << MEMBER_BITS | member_id)
+        self.closed.sort()
+        self.open.sort()
+
+    @staticmethod
+    def _remove(entries, entry):
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def add_closed(self, member_id, total_ns):
+        """
+        Insert a member without an open interval.
+
+        Parameters
+        ----------
+        member_id : int
+            The ID of the member.
+        total_ns : int
+            The member's closed-out duration.
+
+        Returns
+        -------
+        None
+        """
+        insort(self.closed, (-total_ns) << MEMBER_BITS | member_id)
+
+    def remove_closed(self, member_id, total_ns):
+        """
+        Remove a member inserted with add_closed.
+
+        Parameters
+        ----------
+        member_id : int
+            The ID of the member.
+        total_ns : int
+            The duration the member was inserted with.
+
+        Returns
+        -------
+        None
+        """
+        self._remove(self.closed, (-total_ns) << MEMBER_BITS | member_id)
+
+    def add_open(self, member_id, total_ns, join_ns):
+        """
+        Insert a member with an open interval.
+
+        Parameters
+        ----------
+        member_id : int
+            The ID of the member.
+        total_ns : int
+            The member's closed-out duration.
+        join_ns : int
+            Monotonic time the open interval started.
+
+        Returns
+        -------
+        None
+        """
+        insort(self.open, (join_ns - total_ns) << MEMBER_BITS | member_id)
+
+    def remove_open(self, member_id, total_ns, join_ns):
+        """
+        Remove a member inserted with add_open.
+
+        Parameters
+        ----------
+        member_id : int
+            The ID of the member.
+        total_ns : int
+            The duration the member was inserted with.
+        join_ns : int
+            The join time the member was inserted with.
+
+        Returns
+        -------
+        None
+        """
+        self._remove(self.open, (join_ns - total_ns) << MEMBER_BITS | member_id)
+
+    def _split(self, start, now):
+        # how many closed entries come before rank `start` once both lists are merged,
+        # found by binary search instead of walking the first `start` entries
+        closed, open_ = self.closed, self.open
+        lo, hi = max(0, start - len(open_)), min(start, len(closed))
+        while lo < hi:
+            i = (lo + hi) // 2
+            j = start - i
+            # same tie rule as page: on equal totals the closed entry comes first
+            if j > 0 and closed[i] >> MEMBER_BITS <= (open_[j - 1] >> MEMBER_BITS) - now:
+                lo = i + 1
+            else:
+                hi = i
+        return lo, start - lo
+
+    def page(self, now, start, count):
+        """
+        Return a slice of the ranking.
+
+        Finding the start of the slice costs O(log n), then only the
+        requested entries are produced.
+
+        Parameters
+        ----------
+        now : int
+            The current monotonic time, used to measure open intervals.
+        start : int
+            Zero-based rank of the first entry.
+        count : int
+            Maximum number of entries.
+
+        Returns
+        -------
+        list of tuple
+            (member_id, total_ns) ordered longest first.
+        """
+        closed, open_ = self.closed, self.open
+        i, j = self._split(start, now)
+        entries = []
+        while len(entries) < count and (i < len(closed) or j < len(open_)):
+            if j >= len(open_) or (i < len(closed) and closed[i] >> MEMBER_BITS <= (open_[j] >> MEMBER_BITS) - now):
+                entry = closed[i]
+                key = entry >> MEMBER_BITS
+                i += 1
+            else:
+                entry = open_[j]
+                key = (entry >> MEMBER_BITS) - now
+                j += 1
+            entries.append((entry & MEMBER_MASK, -key))
+        return entries
+
+    def top(self, now, k):
+        """
+        Return the k members with the most time spent.
+
+        Parameters
+        ----------
+        now : int
+            The current monotonic time.
+        k : int
+            How many members to return.
+
+        Returns
+        -------
+        list of tuple
+            (member_id, total_ns) ordered longest first.
+        """
+        return self.page(now, 0, k)
+
+    def rank(self, total_ns, now):
+        """
+        Return the rank a total would have in the ranking.
+
+        Parameters
+        ----------
+        total_ns : int
+            The member's live total.
+        now : int
+            The current monotonic time.
+
+        Returns
+        -------
+        int
+            One-based rank, members with the same total share a rank.
+        """
+        ahead = bisect_left(self.closed, (-total_ns) << MEMBER_BITS)
+        ahead += bisect_left(self.open, (now - total_ns) << MEMBER_BITS)
+        return ahead + 1
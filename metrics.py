@@ -0,0 +1,350 @@
+"""
+Runtime metrics for the Discord bot.
+
+this file provides the Metrics registry, which keeps call counters and
+latency histograms for the event handlers, slash commands and persistence
+calls it instruments, plus gauges read on demand (tracked members, pending
+journal lines, ...). The numbers are shown by the /stats command and can be
+served in the Prometheus text format on a local HTTP port.
+"""
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+
+# histogram bucket upper bounds in seconds, 10 us to 10 s (anything slower lands in +Inf)
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+
+    Observing a value costs one binary search over the bucket bounds and two
+    additions, nothing is allocated.
+
+    Parameters
+    ----------
+    buckets : tuple of float, optional
+        Bucket upper bounds in seconds, ascending.
+
+    Attributes
+    ----------
+    counts : list of int
+        Observations per bucket (not cumulative), the last one is +Inf.
+    count : int
+        Total number of observations.
+    total : float
+        Sum of the observed values in seconds.
+    errors : int
+        Number of calls that raised.
+    """
+    __slots__ = ("buckets", "counts", "count", "total", "errors")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        """
+        Record one observation.
+
+        Parameters
+        ----------
+        seconds : float
+            The observed latency.
+
+        Returns
+        -------
+        None
+        """
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating inside its bucket.
+
+        Parameters
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        float or None
+            The estimated latency in seconds, None without observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                # observations past the last bound are reported at the last bound
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    Registry of the bot's counters, latency histograms and gauges.
+
+    Attributes
+    ----------
+    histograms : dict
+        Format: {(kind, name): Histogram}, kind being "event", "command" or "persistence".
+    counters : dict
+        Format: {name: int}
+    gauges : dict
+        Format: {name: (help, callable returning a number)}
+    started : float
+        Monotonic time the registry was created, for rates.
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.monotonic()
+        self._server = None
+
+    def histogram(self, kind, name):
+        """
+        Return the histogram of an instrumented call, creating it if needed.
+
+        Parameters
+        ----------
+        kind : str
+            "event", "command" or "persistence".
+        name : str
+            Name of the handler, command or call.
+
+        Returns
+        -------
+        Histogram
+            The histogram.
+        """
+        key = (kind, name)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def inc(self, name, amount=1):
+        """
+        Increase a counter.
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter.
+        amount : int, optional
+            How much to add.
+
+        Returns
+        -------
+        None
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, help, read):
+        """
+        Register a gauge read each time the metrics are shown.
+
+        Parameters
+        ----------
+        name : str
+            Name of the gauge.
+        help : str
+            One-line description.
+        read : callable
+            Returns the gauge's current value.
+
+        Returns
+        -------
+        None
+        """
+        self.gauges[name] = (help, read)
+
+    def timed(self, kind, name=None):
+        """
+        Decorator recording the latency of every call of a coroutine
+        function (or a plain function, e.g. one run on a worker thread).
+
+        functools.wraps keeps the name and signature, so the result can
+        still be registered with bot.event or bot.slash_command.
+
+        Parameters
+        ----------
+        kind : str
+            "event", "command" or "persistence".
+        name : str, optional
+            Name to record the calls under, the function's name by default.
+
+        Returns
+        -------
+        callable
+            The decorator.
+        """
+        def decorator(func):
+            histogram = self.histogram(kind, name or func.__name__)
+
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    except BaseException:
+                        histogram.errors += 1
+                        raise
+                    finally:
+                        histogram.observe(time.perf_counter() - start)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return func(*args, **kwargs)
+                    except BaseException:
+                        histogram.errors += 1
+                        raise
+                    finally:
+                        histogram.observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def read_gauges(self):
+        """
+        Read every registered gauge.
+
+        Returns
+        -------
+        dict
+            Format: {name: value}, gauges that failed to read are left out.
+        """
+        values = {}
+        for name, (_, read) in self.gauges.items():
+            try:
+                values[name] = read()
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+        return values
+
+    def summary(self):
+        """
+        Render the metrics as a fixed-width table for the /stats command.
+
+        Returns
+        -------
+        str
+            One line per instrumented call with its count, rate, p50/p99 and
+            errors, followed by the counters and gauges.
+        """
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        lines = [f"{'call':<32}{'count':>9}{'/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}"]
+        for (kind, name), histogram in sorted(self.histograms.items()):
+            if not histogram.count:
+                continue
+            lines.append(
+                f"{kind + ' ' + name:<32.32}{histogram.count:>9}{histogram.count / uptime:>9.2f}"
+                f"{histogram.quantile(0.5) * 1000:>10.3f}{histogram.quantile(0.99) * 1000:>10.3f}{histogram.errors:>8}"
+            )
+        lines.append("")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<32}{value:>9}")
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f"{name:<32}{value:>9}")
+        lines.append(f"{'uptime_seconds':<32}{uptime:>9.0f}")
+        return "\n".join(lines)
+
+    def prometheus(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The metrics, names prefixed with "oculus_".
+        """
+        lines = [
+            "# HELP oculus_call_seconds Latency of the bot's event handlers, slash commands and persistence calls.",
+            "# TYPE oculus_call_seconds histogram"
+        ]
+        for (kind, name), histogram in sorted(self.histograms.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'oculus_call_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'oculus_call_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"oculus_call_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"oculus_call_seconds_count{{{labels}}} {histogram.count}")
+        lines.append("# HELP oculus_call_errors_total Calls that raised.")
+        lines.append("# TYPE oculus_call_errors_total counter")
+        for (kind, name), histogram in sorted(self.histograms.items()):
+            lines.append(f'oculus_call_errors_total{{kind="{kind}",name="{name}"}} {histogram.errors}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE oculus_{name}_total counter")
+            lines.append(f"oculus_{name}_total {value}")
+        values = self.read_gauges()
+        for name, (help, _) in sorted(self.gauges.items()):
+            if name in values:
+                lines.append(f"# HELP oculus_{name} {help}")
+                lines.append(f"# TYPE oculus_{name} gauge")
+                lines.append(f"oculus_{name} {values[name]}")
+        lines.append("# TYPE oculus_uptime_seconds gauge")
+        lines.append(f"oculus_uptime_seconds {time.monotonic() - self.started}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, reader, writer):
+        # a minimal HTTP/1.0 responder: every GET is answered with the metrics
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            if request.startswith(b"GET "):
+                body = self.prometheus().encode()
+                status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                body, status, content_type = b"method not allowed\n", "405 Method Not Allowed", "text/plain"
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the metrics over HTTP for Prometheus to scrape. Calling it
+        again once the server runs does nothing.
+
+        Parameters
+        ----------
+        port : int
+            The port to listen on.
+        host : str, optional
+            The address to bind, local only by default.
+
+        Returns
+        -------
+        None
+        """
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, host, port)
+            print(f"Serving metrics on http://{host}:{port}/metrics")
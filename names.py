@@ -0,0 +1,213 @@
+"""
+Member name cache for the Discord bot.
+
+this file provides the NameCache, which keeps the display name of the
+members shown in reports so rendering a report row is a dict lookup. Before a
+report is rendered its member IDs are resolved at once: members in the
+library's member cache are read from it, the others are requested from the
+gateway in chunks of up to 100 IDs per request rather than one REST call per
+row. Names are kept for a day before they are looked up again, and a member
+who left the guild keeps the last name seen, so old reports still show who
+attended. The cache holds a bounded number of names, least recently resolved
+first out, and is saved to 'member_names.json' next to the voice data so it
+survives restarts.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+# seconds a resolved name is used before it is looked up again
+NAME_TTL = 86400
+# names kept at most, across guilds
+MAX_NAMES = 100_000
+# member IDs per gateway request, Discord's limit
+CHUNK_SIZE = 100
+# gateway requests of one report in flight at once
+LOOKUP_CONCURRENCY = 4
+
+
+class NameCache:
+    """
+    Bounded, persistent {(guild_id, member_id): display name} map with a TTL.
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON file the cache is saved to.
+    ttl : float, optional
+        Seconds a name is used before it is looked up again.
+    limit : int, optional
+        Number of names kept at most.
+
+    Attributes
+    ----------
+    names : OrderedDict
+        Format: {(guild_id, member_id): (name or None, UNIX time it was resolved)},
+        least recently resolved first. None marks a member nobody could name.
+    dirty : bool
+        True if the cache changed since it was last saved.
+    lookups : int
+        Gateway requests made so far.
+    """
+    def __init__(self, path, ttl=NAME_TTL, limit=MAX_NAMES):
+        self.path = path
+        self.ttl = ttl
+        self.limit = limit
+        self.names = OrderedDict()
+        self.dirty = False
+        self.lookups = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self):
+        """
+        Read the saved cache, if there is one.
+
+        Returns
+        -------
+        None
+        """
+        try:
+            with open(self.path, "r") as f:
+                self.names = OrderedDict(((guild_id, member_id), (name, resolved_at)) for guild_id, member_id, name, resolved_at in json.load(f))
+        except FileNotFoundError:
+            self.names = OrderedDict()
+        except Exception as e:
+            print(f"Error loading the member name cache: {e}")
+            self.names = OrderedDict()
+        self.dirty = False
+
+    def _write(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        """
+        Write the cache on a worker thread if it changed.
+
+        Returns
+        -------
+        None
+        """
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = [[guild_id, member_id, name, resolved_at] for (guild_id, member_id), (name, resolved_at) in self.names.items()]
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+        except Exception as e:
+            self.dirty = True
+            print(f"Error saving the member name cache: {e}")
+
+    def get(self, guild_id, member_id):
+        """
+        Return the cached name of a member, even if it is due for a new lookup.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        member_id : int
+            The ID of the member.
+
+        Returns
+        -------
+        str or None
+            The display name, None if it isn't known.
+        """
+        entry = self.names.get((guild_id, member_id))
+        return entry[0] if entry else None
+
+    def put(self, guild_id, member_id, name, now=None):
+        """
+        Remember the name of a member.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        member_id : int
+            The ID of the member.
+        name : str or None
+            The display name, None if nobody could name the member.
+        now : float, optional
+            UNIX time the name was resolved, now by default.
+
+        Returns
+        -------
+        None
+        """
+        key = (guild_id, member_id)
+        entry = self.names.get(key)
+        if entry is None or entry[0] != name:
+            self.dirty = True
+        self.names[key] = (name, time.time() if now is None else now)
+        self.names.move_to_end(key)
+        while len(self.names) > self.limit:
+            self.names.popitem(last=False)
+            self.dirty = True
+
+    def _expired(self, key, now):
+        entry = self.names.get(key)
+        return entry is None or now - entry[1] >= self.ttl
+
+    async def resolve(self, guild, member_ids, users=None):
+        """
+        Make sure the names of a report's members are cached.
+
+        Members in the library's member cache are read from it. The others
+        whose name is missing or expired are requested from the gateway,
+        up to CHUNK_SIZE IDs per request. Those the gateway doesn't return
+        (they left the guild) keep their last name, or get their user name
+        if the user is known.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild.
+        member_ids : iterable of int
+            The IDs of the members.
+        users : callable, optional
+            Returns a discord.User (or None) for a user ID, e.g. bot.get_user.
+
+        Returns
+        -------
+        int
+            The number of gateway requests made.
+        """
+        now = time.time()
+        missing = []
+        for member_id in dict.fromkeys(member_ids):
+            member = guild.get_member(member_id)
+            if member is not None:
+                self.put(guild.id, member_id, member.display_name, now)
+            elif self._expired((guild.id, member_id), now):
+                missing.append(member_id)
+        chunks = [missing[i:i + CHUNK_SIZE] for i in range(0, len(missing), CHUNK_SIZE)]
+        for i in range(0, len(chunks), LOOKUP_CONCURRENCY):
+            batch = chunks[i:i + LOOKUP_CONCURRENCY]
+            results = await asyncio.gather(*(self._lookup(guild, chunk) for chunk in batch), return_exceptions=True)
+            for chunk, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    # tried again with the next report
+                    print(f"Error looking up {len(chunk)} member name(s) in {guild.name}: {result}")
+                    continue
+                for member in result:
+                    self.put(guild.id, member.id, member.display_name, now)
+                found = {member.id for member in result}
+                for member_id in chunk:
+                    if member_id not in found:
+                        user = users(member_id) if users else None
+                        name = user.display_name if user else self.get(guild.id, member_id)
+                        self.put(guild.id, member_id, name, now)
+        return len(chunks)
+
+    async def _lookup(self, guild, chunk):
+        self.lookups += 1
+        # the members aren't added to the library's cache, this one keeps what reports need
+        return await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False)
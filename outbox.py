@@ -0,0 +1,427 @@
+"""
+Outbound messages for the Discord bot.
+
+this file provides the Outbox, the one place the bot's own messages (as
+opposed to the replies of slash commands) are sent from. Messages are queued
+in three priority lanes, interaction followups before reports before notices
+broadcast to every guild, and a single dispatcher task sends them as fast as
+the token bucket of their route (the channel they go to) and the global
+bucket allow. A notice queued with a key replaces the unsent one with the
+same key, so a flapping connection doesn't queue the same farewell twice.
+Queuing never waits for the message to be sent, so a handler can fan a
+notice out to thousands of guilds and return right away.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from functools import partial
+
+import discord
+
+# priority lanes, lower goes first
+INTERACTION = 0
+REPORT = 1
+NOTICE = 2
+LANES = (INTERACTION, REPORT, NOTICE)
+
+# Discord allows 5 messages per 5 seconds in a channel and 50 requests per second in total
+ROUTE_LIMIT = (5, 5.0)
+GLOBAL_LIMIT = (50, 1.0)
+
+# seconds between sweeps of the routes that have been idle long enough to forget
+PRUNE_EVERY = 60
+
+
+class TokenBucket:
+    """
+    Token bucket of one rate limit: every token spent comes back after the
+    limit's window, so no window ever holds more sends than the limit,
+    however they are spread.
+
+    Parameters
+    ----------
+    limit : int
+        Number of tokens.
+    per : float
+        Seconds after which a spent token is available again.
+    """
+    __slots__ = ("limit", "per", "spent", "paused_until")
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        # times the spent tokens come back, in order
+        self.spent = deque()
+        self.paused_until = 0.0
+
+    def delay(self, now):
+        """
+        Return how long until a token is available.
+
+        Parameters
+        ----------
+        now : float
+            time.monotonic()
+
+        Returns
+        -------
+        float
+            Seconds to wait, 0 if a token is available now.
+        """
+        if now < self.paused_until:
+            return self.paused_until - now
+        spent = self.spent
+        while spent and spent[0] <= now:
+            spent.popleft()
+        return 0.0 if len(spent) < self.limit else spent[0] - now
+
+    def take(self, now):
+        """
+        Use a token, call delay first to check there is one.
+
+        Parameters
+        ----------
+        now : float
+            time.monotonic()
+
+        Returns
+        -------
+        None
+        """
+        self.spent.append(now + self.per)
+
+    def pause(self, seconds, now):
+        """
+        Hold every token for a while, after Discord answered with a 429.
+
+        Parameters
+        ----------
+        seconds : float
+            The Retry-After of the 429.
+        now : float
+            time.monotonic()
+
+        Returns
+        -------
+        None
+        """
+        self.paused_until = now + seconds
+
+    @property
+    def idle(self):
+        """
+        bool: True if no token is out, as if the bucket was new.
+        """
+        return not self.spent
+
+
+class _Message:
+    __slots__ = ("target", "args", "kwargs", "key", "future", "attempts")
+
+    def __init__(self, target, args, kwargs, key, future):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.future = future
+        self.attempts = 0
+
+
+class _Route:
+    __slots__ = ("key", "bucket", "lanes", "listed", "blocked")
+
+    def __init__(self, key, bucket):
+        self.key = key
+        self.bucket = bucket
+        self.lanes = [deque() for _ in LANES]
+        # whether the route is in the ready queue of each lane
+        self.listed = [False for _ in LANES]
+        # a message is being sent, or the bucket is empty: nothing else goes out until it's done
+        self.blocked = False
+
+
+def _follow(future, done):
+    # settles future like done, for a message replaced by one that was sent (or failed) in its place
+    if future.done():
+        return
+    if done.cancelled():
+        future.cancel()
+    elif done.exception() is not None:
+        future.set_exception(done.exception())
+        future.exception()
+    else:
+        future.set_result(done.result())
+
+
+class Outbox:
+    """
+    Priority queue of outbound messages, sent within the rate limits by one task.
+
+    Routes take turns within a lane, and a route sends one message at a
+    time, so the messages of one channel arrive in the order they were queued.
+
+    Parameters
+    ----------
+    metrics : Metrics, optional
+        Where to record send latencies, retries and coalesced messages.
+    route_limit : tuple, optional
+        (limit, seconds) of the token bucket of each route.
+    global_limit : tuple, optional
+        (limit, seconds) of the token bucket shared by every route.
+    attempts : int, optional
+        Maximum number of tries of a message that is rate limited or hits a 5xx.
+
+    Attributes
+    ----------
+    sent : int
+        Number of messages sent so far.
+    coalesced : int
+        Number of messages replaced by a later one with the same key.
+    """
+    def __init__(self, metrics=None, route_limit=ROUTE_LIMIT, global_limit=GLOBAL_LIMIT, attempts=4):
+        self.metrics = metrics
+        self.route_limit = route_limit
+        self.bucket = TokenBucket(*global_limit)
+        self.attempts = attempts
+        self.sent = 0
+        self.coalesced = 0
+        self._routes = {}
+        self._ready = [deque() for _ in LANES]
+        # (time, order, route) of routes waiting for their bucket
+        self._delayed = []
+        self._order = itertools.count()
+        self._keyed = {}
+        self._queued = 0
+        self._pruned = time.monotonic()
+        self._wakeup = None
+        self._drained = None
+        self._task = None
+
+    def __len__(self):
+        return self._queued
+
+    def post(self, target, *args, lane=NOTICE, key=None, route=None, **kwargs):
+        """
+        Queue a message and return without waiting for it to be sent.
+
+        Parameters
+        ----------
+        target : discord.abc.Messageable or discord.Webhook
+            What to call send on: a channel, a context or an interaction's followup.
+        *args, **kwargs
+            The arguments of send.
+        lane : int, optional
+            INTERACTION, REPORT or NOTICE.
+        key : hashable, optional
+            Messages with the same key replace each other while unsent, the
+            latest arguments win.
+        route : hashable, optional
+            The rate limit the message counts against, the target's ID by default.
+
+        Returns
+        -------
+        asyncio.Future
+            Resolves to the sent message, or to the exception that stopped it.
+        """
+        if self._task is None or self._task.done():
+            self.start()
+        if key is not None:
+            queued = self._keyed.get(key)
+            if queued is not None:
+                queued.target, queued.args, queued.kwargs = target, args, kwargs
+                self.coalesced += 1
+                if self.metrics is not None:
+                    self.metrics.inc("outbox_coalesced")
+                return queued.future
+
+        future = asyncio.get_running_loop().create_future()
+        message = _Message(target, args, kwargs, key, future)
+        if key is not None:
+            self._keyed[key] = message
+        route_key = route if route is not None else getattr(target, "id", None) or id(target)
+        state = self._routes.get(route_key)
+        if state is None:
+            state = self._routes[route_key] = _Route(route_key, TokenBucket(*self.route_limit))
+        state.lanes[lane].append(message)
+        self._queued += 1
+        self._drained.clear()
+        self._list(state)
+        return future
+
+    async def send(self, target, *args, lane=NOTICE, key=None, route=None, **kwargs):
+        """
+        Queue a message and wait until it is sent, see post.
+
+        Returns
+        -------
+        discord.Message
+            The sent message.
+        """
+        return await self.post(target, *args, lane=lane, key=key, route=route, **kwargs)
+
+    def _list(self, route):
+        # puts a route back in the ready queue of every lane it has messages in
+        if route.blocked:
+            return
+        for lane in LANES:
+            if route.lanes[lane] and not route.listed[lane]:
+                self._ready[lane].append(route)
+                route.listed[lane] = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next(self):
+        # the first route of the highest lane that can send
+        for lane in LANES:
+            ready = self._ready[lane]
+            while ready:
+                route = ready.popleft()
+                route.listed[lane] = False
+                if not route.blocked and route.lanes[lane]:
+                    return route, lane
+        return None, None
+
+    def _delay(self, route, seconds, now):
+        route.blocked = True
+        heapq.heappush(self._delayed, (now + seconds, next(self._order), route))
+
+    async def run(self):
+        """
+        Send queued messages until cancelled.
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                route = heapq.heappop(self._delayed)[2]
+                route.blocked = False
+                self._list(route)
+
+            route, lane = self._next()
+            if route is None:
+                if now - self._pruned >= PRUNE_EVERY:
+                    self._prune(now)
+                self._wakeup.clear()
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = route.bucket.delay(now)
+            if wait > 0:
+                self._delay(route, wait, now)
+                continue
+            wait = self.bucket.delay(now)
+            if wait > 0:
+                # back at the head of its lane, it's next once the global bucket refills
+                self._ready[lane].appendleft(route)
+                route.listed[lane] = True
+                await asyncio.sleep(wait)
+                continue
+
+            route.bucket.take(now)
+            self.bucket.take(now)
+            message = route.lanes[lane].popleft()
+            if message.key is not None and self._keyed.get(message.key) is message:
+                del self._keyed[message.key]
+            route.blocked = True
+            asyncio.get_running_loop().create_task(self._deliver(route, lane, message))
+
+    async def _deliver(self, route, lane, message):
+        start = time.perf_counter()
+        retry_after = None
+        try:
+            message.attempts += 1
+            result = await message.target.send(*message.args, **message.kwargs)
+        except discord.HTTPException as e:
+            if message.attempts >= self.attempts or not (e.status == 429 or e.status >= 500):
+                self._fail(message, e)
+            else:
+                # the library waits out ordinary 429s, this covers the ones it gives up on and 5xx errors
+                header = getattr(e.response, "headers", {}).get("Retry-After")
+                retry_after = float(header) if header else 2 ** (message.attempts - 1) + random.uniform(0, 1)
+                newer = self._keyed.get(message.key) if message.key is not None else None
+                if newer is None:
+                    # unsent again, so later posts with its key replace it like before it was sent
+                    if message.key is not None:
+                        self._keyed[message.key] = message
+                    route.lanes[lane].appendleft(message)
+                else:
+                    # posted with the same key while this one was in flight, the newer arguments win
+                    self._queued -= 1
+                    self.coalesced += 1
+                    if self.metrics is not None:
+                        self.metrics.inc("outbox_coalesced")
+                    newer.future.add_done_callback(partial(_follow, message.future))
+                if self.metrics is not None:
+                    self.metrics.inc("outbox_retries")
+        except Exception as e:
+            self._fail(message, e)
+        else:
+            self._queued -= 1
+            self.sent += 1
+            if not message.future.done():
+                message.future.set_result(result)
+            if self.metrics is not None:
+                self.metrics.histogram("outbox", "send").observe(time.perf_counter() - start)
+        finally:
+            if retry_after is not None:
+                now = time.monotonic()
+                route.bucket.pause(retry_after, now)
+                self._delay(route, retry_after, now)
+                self._wakeup.set()
+            else:
+                route.blocked = False
+                self._list(route)
+            if not self._queued:
+                self._drained.set()
+
+    def _prune(self, now):
+        # routes whose bucket is full again would be created the same, so thousands of one-off channels don't pile up
+        self._pruned = now
+        for key, route in list(self._routes.items()):
+            if not route.blocked and not any(route.lanes) and route.bucket.delay(now) == 0 and route.bucket.idle:
+                del self._routes[key]
+
+    def _fail(self, message, error):
+        self._queued -= 1
+        print(f"Error sending a message to {getattr(message.target, 'name', message.target)}: {error}")
+        if not message.future.done():
+            message.future.set_exception(error)
+            # nobody may be waiting on a notice, don't let asyncio report the exception as unhandled
+            message.future.exception()
+
+    def start(self):
+        """
+        Start the dispatcher task on the running loop if it isn't running.
+
+        Returns
+        -------
+        None
+        """
+        if self._task is None or self._task.done():
+            # created here so it binds to the running loop
+            self._wakeup = asyncio.Event()
+            self._wakeup.set()
+            self._drained = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def drain(self):
+        """
+        Wait until every queued message was sent or gave up.
+
+        Returns
+        -------
+        None
+        """
+        while self._queued:
+            self._drained.clear()
+            await self._drained.wait()
@@ -0,0 +1,121 @@
+"""
+Persistence service for the Discord bot.
+
+this file provides the PersistenceService, which saves the session store
+through its journal without blocking the event loop: saves are skipped when
+nothing changed since the last one, the disk writes run on a worker thread,
+and save requests made while a write is running are coalesced into one.
+When the SQLite attendance history is enabled its rows are written in the
+same worker call, right after the journal.
+"""
+import asyncio
+from backends import StateConflict
+
+
+class PersistenceService:
+    """
+    Dirty-aware, non-blocking saver for a session store.
+
+    The journal's sequence number acts as a generation counter: a save is
+    only needed when it moved past the sequence number of the last write.
+
+    Parameters
+    ----------
+    journal : VoiceJournal
+        The journal the store's events are recorded into.
+    store : SessionStore
+        The store being saved.
+    history : AttendanceHistory, optional
+        The attendance history to write alongside the journal.
+
+    Attributes
+    ----------
+    saved_seq : int
+        Sequence number of the last event written to disk.
+    conflict : StateConflict or None
+        Set when another process was found writing the same state, after
+        which nothing is saved anymore.
+    """
+    def __init__(self, journal, store, history=None):
+        self.journal = journal
+        self.store = store
+        self.history = history
+        self.saved_seq = journal.seq
+        self.conflict = None
+        self._lock = None
+
+    @property
+    def dirty(self):
+        """
+        bool: True if events were recorded since the last write.
+        """
+        return self.journal.seq > self.saved_seq
+
+    def mark_saved(self):
+        """
+        Treat everything recorded so far as saved, e.g. right after loading.
+
+        Returns
+        -------
+        None
+        """
+        self.saved_seq = self.journal.seq
+
+    async def save(self):
+        """
+        Save the events recorded so far.
+
+        Callers arriving while a write is running wait for it; if that write
+        (or the one after it) already covered their events they return
+        without writing again.
+
+        Returns
+        -------
+        bool
+            True if this call wrote something to disk.
+
+        Raises
+        ------
+        StateConflict
+            The first time a write finds another process writing the same
+            state; later calls return False without writing.
+        """
+        # created lazily so it binds to the running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        target = self.journal.seq
+        async with self._lock:
+            if self.conflict is not None:
+                # nothing is written anymore, so nothing is kept for a write either
+                self.journal.pending.clear()
+                return False
+            if self.saved_seq >= target:
+                return False
+            # cheap part on the loop: detach the queued lines (and a snapshot when compaction is due)
+            seq = self.journal.seq
+            lines, snapshot = self.journal.take(self.store)
+            rows = self.history.take() if self.history else None
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, lines, snapshot, rows)
+            except StateConflict as e:
+                # retrying can't succeed, and the batches put back would pile up for good
+                self.conflict = e
+                self.journal.pending.clear()
+                raise
+            except Exception:
+                # put the batch back so the next save retries it, replay skips any duplicate lines
+                # and a failed history transaction leaves nothing behind
+                self.journal.pending[:0] = lines
+                if rows:
+                    self.history.requeue(rows)
+                raise
+            self.saved_seq = seq
+            if snapshot is not None:
+                print("Voice data compacted into a new snapshot.")
+            return True
+
+    def _write(self, lines, snapshot, rows):
+        # runs on the worker thread
+        self.journal.write(lines, snapshot)
+        if rows:
+            self.history.write(*rows)
@@ -0,0 +1,381 @@
+"""
+Report snapshots for the Discord bot.
+
+this file provides the ReportSnapshot, a compact immutable copy of a time
+report from which embeds are only rendered when a page is requested, and the
+ReportRegistry, a bounded LRU/TTL registry of the snapshots behind the
+paginated messages sent by the bot. The registry can optionally keep the
+snapshots on disk so the buttons of old messages keep working after a restart.
+
+It also packs report lines into pages and messages by their measured size,
+so they stay within Discord's embed limits whatever the member names are.
+"""
+import asyncio
+import json
+import os
+import time
+from array import array
+from collections import OrderedDict
+
+# rows per page of reports that weren't measured (see ReportSnapshot.paginate)
+PAGE_SIZE = 10
+# most rows a measured page holds, however short they are
+MAX_PAGE_ROWS = 25
+
+# Discord's limits: characters in an embed description, characters in all the
+# embeds of a message (titles, descriptions, footers...) and embeds per message
+DESCRIPTION_LIMIT = 4096
+MESSAGE_LIMIT = 6000
+EMBEDS_PER_MESSAGE = 10
+
+
+def fit(text, limit=DESCRIPTION_LIMIT):
+    """
+    Shorten a text to a number of characters, marking the cut with an ellipsis.
+
+    Parameters
+    ----------
+    text : str
+        The text.
+    limit : int, optional
+        Maximum number of characters.
+
+    Returns
+    -------
+    str
+        The text, shortened if it was longer than limit.
+    """
+    return text if len(text) <= limit else text[:limit - 1] + "\u2026"
+
+
+def pack_messages(lines, overhead=0, description_limit=DESCRIPTION_LIMIT, message_limit=MESSAGE_LIMIT,
+                  embeds_per_message=EMBEDS_PER_MESSAGE):
+    """
+    Pack lines into as few messages of embeds as the limits allow.
+
+    Lines are consumed one at a time and each message is yielded as soon as
+    it is full, so a report can be sent while the rest of it is still being
+    rendered. A line too long for an embed on its own is shortened.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        The lines, in order.
+    overhead : int, optional
+        Characters each embed uses besides its description (title, footer).
+    description_limit : int, optional
+        Maximum characters in one embed description.
+    message_limit : int, optional
+        Maximum characters in all the embeds of one message.
+    embeds_per_message : int, optional
+        Maximum embeds in one message.
+
+    Returns
+    -------
+    generator of list of str
+        The descriptions of the embeds of each message.
+    """
+    line_limit = min(description_limit, message_limit - overhead)
+    message, description = [], []
+    # characters used by the message's finished embeds and by the current description
+    used = length = 0
+    for line in lines:
+        line = fit(line, line_limit)
+        if description and (length + 1 + len(line) > description_limit or used + length + 1 + len(line) > message_limit):
+            message.append("\n".join(description))
+            used += length
+            description, length = [], 0
+        if description:
+            length += 1 + len(line)
+        else:
+            if message and (len(message) == embeds_per_message or used + overhead + len(line) > message_limit):
+                yield message
+                message, used = [], 0
+            used += overhead
+            length = len(line)
+        description.append(line)
+    if description:
+        message.append("\n".join(description))
+    if message:
+        yield message
+
+
+class ReportSnapshot:
+    """
+    An immutable, column-oriented copy of a time report.
+
+    Parameters
+    ----------
+    guild_id : int
+        The ID of the guild the report is about.
+    rows : iterable of tuple
+        (member_id, total_seconds, channel_name) ordered as they should be shown.
+    created_at : float, optional
+        UNIX timestamp of the report, now by default.
+
+    Attributes
+    ----------
+    member_ids : array.array
+        Member IDs, one per row.
+    seconds : array.array
+        Time spent in seconds, one per row.
+    channels : tuple
+        Channel names, one per row (the same string objects as the session store).
+    page_starts : array.array
+        Index of the first row of each page.
+    """
+    __slots__ = ("guild_id", "created_at", "member_ids", "seconds", "channels", "page_starts")
+
+    def __init__(self, guild_id, rows, created_at=None, page_starts=None):
+        self.guild_id = guild_id
+        self.created_at = created_at if created_at is not None else time.time()
+        self.member_ids = array("Q")
+        self.seconds = array("d")
+        channels = []
+        for member_id, total_seconds, channel_name in rows:
+            self.member_ids.append(member_id)
+            self.seconds.append(total_seconds)
+            channels.append(channel_name)
+        self.channels = tuple(channels)
+        if page_starts is None:
+            page_starts = range(0, max(1, len(channels)), PAGE_SIZE)
+        self.page_starts = array("I", page_starts)
+
+    def __len__(self):
+        return len(self.member_ids)
+
+    @property
+    def page_count(self):
+        """
+        int: Number of pages of the report.
+        """
+        return len(self.page_starts)
+
+    def paginate(self, lengths, limit=DESCRIPTION_LIMIT, max_rows=MAX_PAGE_ROWS):
+        """
+        Cut the report into pages by the size of their lines instead of a
+        fixed number of rows: each page holds as many rows as fit in one
+        embed description, up to max_rows.
+
+        Parameters
+        ----------
+        lengths : iterable of int
+            The length of each row's rendered line, in row order.
+        limit : int, optional
+            Maximum characters in a page.
+        max_rows : int, optional
+            Maximum rows in a page.
+
+        Returns
+        -------
+        None
+        """
+        starts = array("I", [0])
+        rows = size = 0
+        for i, length in enumerate(lengths):
+            length = min(length, limit)
+            if rows and (rows == max_rows or size + 1 + length > limit):
+                starts.append(i)
+                rows = size = 0
+            size += length + (1 if rows else 0)
+            rows += 1
+        self.page_starts = starts
+
+    def rows(self, start=0, stop=None):
+        """
+        Iterate over rows of the report.
+
+        Parameters
+        ----------
+        start : int, optional
+            Index of the first row.
+        stop : int, optional
+            Index after the last row, the end of the report by default.
+
+        Returns
+        -------
+        generator of tuple
+            (rank, member_id, seconds, channel_name) with one-based ranks.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, stop):
+            yield i + 1, self.member_ids[i], self.seconds[i], self.channels[i]
+
+    def page_rows(self, page):
+        """
+        Return the rows of one page.
+
+        Parameters
+        ----------
+        page : int
+            Zero-based page number.
+
+        Returns
+        -------
+        list of tuple
+            (rank, member_id, seconds, channel_name) with one-based ranks.
+        """
+        stop = self.page_starts[page + 1] if page + 1 < len(self.page_starts) else len(self)
+        return list(self.rows(self.page_starts[page], stop))
+
+    def to_dict(self):
+        """
+        Convert the snapshot to a JSON-serializable format.
+
+        Returns
+        -------
+        dict
+            The serialized snapshot.
+        """
+        return {
+            "guild_id": self.guild_id,
+            "created_at": self.created_at,
+            "member_ids": self.member_ids.tolist(),
+            "seconds": self.seconds.tolist(),
+            "channels": self.channels,
+            "page_starts": self.page_starts.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a snapshot from the format produced by to_dict.
+
+        Parameters
+        ----------
+        data : dict
+            The serialized snapshot.
+
+        Returns
+        -------
+        ReportSnapshot
+            The rebuilt snapshot.
+        """
+        return cls(
+            data["guild_id"], zip(data["member_ids"], data["seconds"], data["channels"]), data["created_at"],
+            data.get("page_starts")
+        )
+
+
+class ReportRegistry:
+    """
+    Bounded registry of report snapshots keyed by message ID.
+
+    The least recently used snapshots are dropped from memory past
+    max_reports, and snapshots older than ttl are forgotten entirely.
+    With a directory, snapshots are also written there (on a worker thread)
+    and read back when they're not in memory anymore.
+
+    Parameters
+    ----------
+    max_reports : int, optional
+        Maximum number of snapshots kept in memory.
+    ttl : float, optional
+        Seconds after which a snapshot expires.
+    directory : str, optional
+        Where to keep snapshots across restarts, memory only by default.
+    """
+    def __init__(self, max_reports=256, ttl=7 * 86400, directory=None):
+        self.max_reports = max_reports
+        self.ttl = ttl
+        self.directory = directory
+        self._snapshots = OrderedDict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def _path(self, message_id):
+        return os.path.join(self.directory, f"{message_id}.json")
+
+    def _write(self, message_id, data):
+        with open(self._path(message_id), "w") as f:
+            json.dump(data, f)
+
+    def _read(self, message_id):
+        try:
+            with open(self._path(message_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _delete(self, message_id):
+        try:
+            os.remove(self._path(message_id))
+        except FileNotFoundError:
+            pass
+
+    async def put(self, message_id, snapshot):
+        """
+        Register the snapshot behind a message.
+
+        Parameters
+        ----------
+        message_id : int
+            The ID of the message showing the report.
+        snapshot : ReportSnapshot
+            The report.
+
+        Returns
+        -------
+        None
+        """
+        self._snapshots[message_id] = snapshot
+        self._snapshots.move_to_end(message_id)
+        while len(self._snapshots) > self.max_reports:
+            self._snapshots.popitem(last=False)
+        if self.directory:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, message_id, snapshot.to_dict())
+
+    async def get(self, message_id):
+        """
+        Return the snapshot behind a message.
+
+        Parameters
+        ----------
+        message_id : int
+            The ID of the message showing the report.
+
+        Returns
+        -------
+        ReportSnapshot or None
+            The report, or None if it expired or was never registered.
+        """
+        snapshot = self._snapshots.get(message_id)
+        if snapshot is None and self.directory:
+            data = await asyncio.get_running_loop().run_in_executor(None, self._read, message_id)
+            if data is not None:
+                snapshot = ReportSnapshot.from_dict(data)
+                self._snapshots[message_id] = snapshot
+                while len(self._snapshots) > self.max_reports:
+                    self._snapshots.popitem(last=False)
+        if snapshot is None:
+            return None
+        if time.time() - snapshot.created_at > self.ttl:
+            self._snapshots.pop(message_id, None)
+            if self.directory:
+                await asyncio.get_running_loop().run_in_executor(None, self._delete, message_id)
+            return None
+        self._snapshots.move_to_end(message_id)
+        return snapshot
+
+    def prune(self):
+        """
+        Delete the expired snapshots kept on disk.
+
+        Returns
+        -------
+        int
+            The number of snapshots deleted.
+        """
+        if not self.directory:
+            return 0
+        deleted = 0
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                deleted += 1
+        return deleted
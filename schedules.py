@@ -0,0 +1,342 @@
+"""
+Recurring sessions for the Discord bot.
+
+this file provides the Schedule, a weekly session ("every Tue 18:00-20:00 in
+#lecture-hall") the bot joins and leaves on its own, and the Scheduler that
+drives every schedule of the process from a single task. The Scheduler keeps
+one heap entry per schedule, its next firing, and sleeps until the earliest
+one, so thousands of schedules cost one timer. Schedules are kept in the
+session store of their guild's shard and saved with the rest of its data,
+see SessionStore.add_schedule. Times are in UTC.
+
+After a restart the firings missed while the bot was down are caught up: a
+session still within its hours is started late, one that should have ended
+is ended right away, and occurrences that passed entirely are skipped.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from history import DAY, day_of, week_of
+
+WEEK = 7 * DAY
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# the two firings of an occurrence
+START = "start"
+END = "end"
+
+# longest sleep of the scheduler, so a wall-clock jump delays a firing by at most this much
+MAX_SLEEP = 60
+
+
+def time_of_day(text):
+    """
+    Parse a time of day given as HH:MM.
+
+    Parameters
+    ----------
+    text : str
+        The time, e.g. "18:30".
+
+    Returns
+    -------
+    int
+        Seconds since midnight.
+    """
+    hours, _, minutes = text.strip().partition(":")
+    hours, minutes = int(hours), int(minutes or 0)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"{text} is not a time of day")
+    return hours * 3600 + minutes * 60
+
+
+def clock(seconds):
+    """
+    Format seconds since midnight (or since the start of the week) as HH:MM.
+
+    Parameters
+    ----------
+    seconds : int
+        The time.
+
+    Returns
+    -------
+    str
+        The time of day.
+    """
+    seconds %= DAY
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+
+class Schedule:
+    """
+    A weekly session in a voice channel.
+
+    Parameters
+    ----------
+    schedule_id : int
+        The ID of the schedule, unique within its store.
+    guild_id : int
+        The ID of the guild.
+    channel_id : int
+        The ID of the voice channel the bot joins.
+    channel_name : str
+        The name of the channel when the schedule was made.
+    start : int
+        Seconds from Monday 00:00 UTC to the start of the session.
+    length : int
+        Length of the session in seconds, less than a week.
+    last_start : int, optional
+        UNIX seconds of the last occurrence that was started, 0 for none.
+    running : bool, optional
+        Whether that occurrence is still waiting to be ended.
+    joined : bool, optional
+        Whether that occurrence joined the channel itself, only then does
+        its end leave the channel.
+    """
+    __slots__ = ("id", "guild_id", "channel_id", "channel_name", "start", "length", "last_start", "running", "joined")
+
+    def __init__(self, schedule_id, guild_id, channel_id, channel_name, start, length, last_start=0, running=False, joined=False):
+        self.id = schedule_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.start = start
+        self.length = length
+        self.last_start = last_start
+        self.running = running
+        self.joined = joined
+
+    def occurrence(self, now):
+        """
+        Return the start of the latest occurrence that began at or before a time.
+
+        Parameters
+        ----------
+        now : float
+            UNIX seconds.
+
+        Returns
+        -------
+        int
+            UNIX seconds.
+        """
+        start = week_of(day_of(now)) * DAY + self.start
+        return start if start <= now else start - WEEK
+
+    def next_firing(self, now):
+        """
+        Return the next firing of the schedule.
+
+        An occurrence that is still within its hours but wasn't started
+        (the bot was down, or the schedule was just made) is due right away.
+
+        Parameters
+        ----------
+        now : float
+            UNIX seconds.
+
+        Returns
+        -------
+        tuple
+            (UNIX seconds, START or END, start of the occurrence).
+        """
+        if self.running:
+            return self.last_start + self.length, END, self.last_start
+        occurrence = self.occurrence(now)
+        if occurrence > self.last_start and now < occurrence + self.length:
+            return now, START, occurrence
+        return occurrence + WEEK, START, occurrence + WEEK
+
+    def missed(self, now):
+        """
+        Count the occurrences that passed entirely since the last one was started.
+
+        Parameters
+        ----------
+        now : float
+            UNIX seconds.
+
+        Returns
+        -------
+        int
+            The number of occurrences nobody started, 0 for a schedule that never ran.
+        """
+        if not self.last_start:
+            return 0
+        ended = self.occurrence(now)
+        if now < ended + self.length:
+            ended -= WEEK
+        return max(0, (ended - self.last_start) // WEEK)
+
+    def describe(self):
+        """
+        Describe the schedule.
+
+        Returns
+        -------
+        str
+            e.g. "#3: every Tue 18:00-20:00 UTC in lecture-hall"
+        """
+        day = WEEKDAYS[self.start // DAY].capitalize()
+        return f"#{self.id}: every {day} {clock(self.start)}-{clock(self.start + self.length)} UTC in {self.channel_name}"
+
+
+def parse_schedule(day, start, end):
+    """
+    Turn the day and hours of a weekly session into its offset and length.
+
+    Parameters
+    ----------
+    day : str
+        The weekday, e.g. "Tue" or "tuesday".
+    start : str
+        The start time, HH:MM.
+    end : str
+        The end time, HH:MM; earlier than start for a session running past midnight.
+
+    Returns
+    -------
+    tuple
+        (seconds from Monday 00:00 UTC to the start, length in seconds).
+    """
+    weekday = day.strip().lower()[:3]
+    if weekday not in WEEKDAYS:
+        raise ValueError(f"{day} is not a day of the week")
+    start, end = time_of_day(start), time_of_day(end)
+    length = (end - start) % DAY
+    if not length:
+        raise ValueError("the session has to end after it starts")
+    return WEEKDAYS.index(weekday) * DAY + start, length
+
+
+class Scheduler:
+    """
+    Single task firing the schedules of every shard of the process.
+
+    Parameters
+    ----------
+    fire : coroutine function
+        Called as fire(shard, schedule, action, occurrence) when a schedule
+        is due, action being START or END. The firing is recorded in the
+        store before it is called, a firing that fails isn't retried.
+
+    Attributes
+    ----------
+    heap : list
+        (UNIX seconds, tie-breaker, action, occurrence, shard, schedule)
+        entries, one per schedule. Entries of removed schedules are dropped
+        when they come up.
+    """
+    def __init__(self, fire):
+        self.fire = fire
+        self.heap = []
+        self._order = itertools.count()
+        self.task = None
+        self._wake = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add(self, shard, schedule, now=None):
+        """
+        Queue the next firing of a schedule.
+
+        Parameters
+        ----------
+        shard : Shard
+            The shard whose store holds the schedule.
+        schedule : Schedule
+            The schedule.
+        now : float, optional
+            UNIX seconds, the current time by default.
+
+        Returns
+        -------
+        None
+        """
+        when, action, occurrence = schedule.next_firing(time.time() if now is None else now)
+        entry = (when, next(self._order), action, occurrence, shard, schedule)
+        heapq.heappush(self.heap, entry)
+        if self._wake is not None and self.heap[0] is entry:
+            self._wake.set()
+
+    def load(self, shard, now=None):
+        """
+        Queue every schedule of a shard, after its saved data was loaded.
+
+        Parameters
+        ----------
+        shard : Shard
+            The shard.
+        now : float, optional
+            UNIX seconds, the current time by default.
+
+        Returns
+        -------
+        None
+        """
+        now = time.time() if now is None else now
+        # entries of the schedules loaded before are stale, they're dropped when they come up
+        for schedule in shard.store.schedules.values():
+            missed = schedule.missed(now)
+            if missed:
+                print(f"Schedule {schedule.describe()} missed {missed} session(s) while the bot was offline")
+            self.add(shard, schedule, now)
+
+    def start(self):
+        """
+        Start the scheduler task if it isn't running.
+
+        Returns
+        -------
+        None
+        """
+        if self.task is None or self.task.done():
+            self._wake = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def _current(self, entry):
+        _, _, action, occurrence, shard, schedule = entry
+        if shard.store.schedules.get(schedule.id) is not schedule:
+            return False  # removed, or replaced by a reload
+        if action == END:
+            return schedule.running and occurrence == schedule.last_start
+        return not schedule.running and occurrence > schedule.last_start
+
+    async def run(self):
+        """
+        Fire the schedules as they come due, forever.
+
+        Returns
+        -------
+        None
+        """
+        heap = self.heap
+        while True:
+            now = time.time()
+            while heap and heap[0][0] <= now:
+                entry = heapq.heappop(heap)
+                if not self._current(entry):
+                    continue
+                _, _, action, occurrence, shard, schedule = entry
+                if action == START:
+                    shard.store.start_schedule(schedule.id, occurrence)
+                else:
+                    shard.store.end_schedule(schedule.id)
+                self.add(shard, schedule, now)
+                # a slow voice connection in one guild doesn't hold up the others
+                asyncio.get_running_loop().create_task(self._fire(shard, schedule, action, occurrence))
+            self._wake.clear()
+            timeout = min(heap[0][0] - now, MAX_SLEEP) if heap else MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, shard, schedule, action, occurrence):
+        try:
+            await self.fire(shard, schedule, action, occurrence)
+        except Exception as e:
+            print(f"Error running schedule {schedule.describe()}: {e}")
@@ -0,0 +1,230 @@
+"""
+Shard partitions for the Discord bot.
+
+this file provides the Shard, the state of one gateway shard (its session
+store, journal, persistence and ingest queue), and the ShardRegistry that
+maps a guild to the shard it belongs to. Each shard saves to its own state
+(its own files, or its own keys in a shared backend) and reconnects on its
+own, so the shards of an AutoShardedBot, or shard ranges run in separate
+processes, never write to the same state. A bot without sharding has a
+single shard using the original file names.
+"""
+from store import SessionStore
+from journal import VoiceJournal
+from persistence import PersistenceService
+from backends import open_backend
+from snapshot import encode_snapshot
+
+
+def shard_of(guild_id, shard_count):
+    """
+    Return the shard a guild belongs to, with Discord's formula.
+
+    Parameters
+    ----------
+    guild_id : int
+        The ID of the guild.
+    shard_count : int
+        Total number of shards of the bot.
+
+    Returns
+    -------
+    int
+        The shard ID.
+    """
+    return (guild_id >> 22) % shard_count
+
+
+def parse_shard_ids(text):
+    """
+    Parse a list of shard IDs such as "0-3" or "0,2,4-6".
+
+    Parameters
+    ----------
+    text : str or None
+        The list, empty for none.
+
+    Returns
+    -------
+    list of int or None
+        The shard IDs in ascending order, None if the text is empty.
+    """
+    if not text:
+        return None
+    ids = set()
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        ids.update(range(int(first), int(last or first) + 1))
+    return sorted(ids)
+
+
+class Shard:
+    """
+    Voice data of the guilds of one shard, with everything that saves it.
+
+    Parameters
+    ----------
+    shard_id : int
+        The shard's ID.
+    backend : StateBackend
+        Where the shard's snapshot and journal are kept.
+    history : AttendanceHistory, optional
+        The attendance history, shared by every shard.
+
+    Attributes
+    ----------
+    store : SessionStore
+        The voice data of the shard's guilds.
+    journal : VoiceJournal
+        The journal the store's events are recorded into.
+    persistence : PersistenceService
+        Saves the store.
+    ingest : VoiceIngest
+        The shard's queue of voice transitions, set up by events.py.
+    loaded : bool
+        Whether the saved data was loaded, the shard becomes ready again on a new gateway session.
+    disconnected_at : int or None
+        Monotonic time (see now_ns) the shard last lost its connection.
+    save_task : asyncio.Task or None
+        The shard's periodic save.
+    """
+    def __init__(self, shard_id, backend, history=None):
+        self.id = shard_id
+        self.store = SessionStore()
+        self.journal = VoiceJournal(backend)
+        self.store.listeners.append(self.journal.record)
+        if history:
+            self.store.listeners.append(history.record)
+        self.persistence = PersistenceService(self.journal, self.store, history)
+        self.ingest = None
+        self.loaded = False
+        self.disconnected_at = None
+        self.save_task = None
+
+    def load(self, fallback=None, shard_count=None, migrate=None):
+        """
+        Read the shard's saved data into its store.
+
+        The first time a bot runs sharded its shards have no saved data yet,
+        each one then takes its own guilds from the data the bot saved before.
+
+        Parameters
+        ----------
+        fallback : StateBackend, optional
+            The state saved without sharding.
+        shard_count : int, optional
+            Total number of shards, needed to pick the guilds from the fallback.
+        migrate : callable, optional
+            Passed to VoiceJournal.load for the shard's own data saved before
+            guilds were tracked.
+
+        Returns
+        -------
+        None
+        """
+        journal = self.journal
+        if fallback and not journal.backend.exists() and fallback.exists():
+            # only the shard's own guilds are decoded
+            saved = VoiceJournal(fallback).load()
+            mine = SessionStore()
+            mine.sessions = {k: v for k, v in saved.sessions.items() if shard_of(k, shard_count) == self.id}
+            mine.schedules = {k: v for k, v in saved.schedules.items() if shard_of(v.guild_id, shard_count) == self.id}
+            journal.write([], (journal.seq, encode_snapshot(journal.seq, mine)))
+            # the other shards' guilds were never decoded, this lets go of the saved snapshot
+            saved.clear()
+            print(f"Shard {self.id} took {len(mine.sessions)} guild(s) from the data saved without sharding")
+        store = journal.load(migrate)
+        self.persistence.mark_saved()
+        self.store.clear()
+        self.store.update(store)
+        self.loaded = True
+
+
+class ShardRegistry:
+    """
+    The shards run by this process, created the first time one of their
+    guilds is seen.
+
+    Parameters
+    ----------
+    sharded : bool
+        False for a bot without sharding: a single shard 0 saved under the
+        name "voice_data" (the original 'voice_data.snapshot' and
+        'voice_data.journal' with the file backend).
+    history : AttendanceHistory, optional
+        The attendance history, shared by every shard.
+    backend : str, optional
+        The STATE_BACKEND setting, see backends.open_backend.
+
+    Attributes
+    ----------
+    shards : dict
+        Format: {shard_id: Shard}
+    """
+    def __init__(self, sharded, history=None, backend=None):
+        self.sharded = sharded
+        self.history = history
+        self.backend = backend
+        self.shards = {}
+        self._hooks = []
+
+    def __iter__(self):
+        return iter(list(self.shards.values()))
+
+    def __len__(self):
+        return len(self.shards)
+
+    def on_create(self, hook):
+        """
+        Register a function called with every shard, the existing ones included.
+
+        Parameters
+        ----------
+        hook : callable
+            Takes the new Shard.
+
+        Returns
+        -------
+        None
+        """
+        self._hooks.append(hook)
+        for shard in self:
+            hook(shard)
+
+    def get(self, shard_id):
+        """
+        Return a shard, creating it if needed.
+
+        Parameters
+        ----------
+        shard_id : int
+            The shard's ID, 0 without sharding.
+
+        Returns
+        -------
+        Shard
+            The shard.
+        """
+        shard = self.shards.get(shard_id)
+        if shard is None:
+            name = f"voice_data.shard-{shard_id}" if self.sharded else "voice_data"
+            shard = self.shards[shard_id] = Shard(shard_id, open_backend(self.backend, name), self.history)
+            for hook in self._hooks:
+                hook(shard)
+        return shard
+
+    def for_guild(self, guild):
+        """
+        Return the shard of a guild.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild.
+
+        Returns
+        -------
+        Shard
+            The shard whose gateway connection receives the guild's events.
+        """
+        return self.get(guild.shard_id)
@@ -1,24 +1,38 @@
 """
-Shared resources for the Discord bot (voice data and global start time)
+Shared resources for the Discord bot (bot instance and global start time)
 
 this file contains shared variables and objects used across the bot,
-including the bot instance, intents configuration, and global data structures
-for tracking voice activity.
+including the bot instance and intents configuration. The bot is sharded
+when SHARD_COUNT or SHARD_IDS is set in the .env file; voice activity data
+is kept per shard, see shards.py.
 """
 import discord
 from discord.ext import commands
+from dotenv import dotenv_values
+from shards import parse_shard_ids
 
+config = dotenv_values(".env")
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 intents.voice_states = True
 
-bot = commands.Bot(command_prefix='/', intents=intents)
+# SHARD_COUNT=<n> (or "auto" for Discord's recommendation) runs every shard in this process,
+# SHARD_IDS=<ids> (e.g. "0-3") with SHARD_COUNT runs a range of them, the others in other processes
+SHARD_COUNT = config.get("SHARD_COUNT")
+SHARD_IDS = parse_shard_ids(config.get("SHARD_IDS"))
+SHARDED = bool(SHARD_COUNT or SHARD_IDS)
 
-# Dictionary inside a dictionary to store voice activity data for all members
-# Format: {member_id: {"join_time": datetime, "total_duration": timedelta, "channel_name": str}}
-voice_data = {}
+if SHARDED:
+    bot = commands.AutoShardedBot(
+        command_prefix='/',
+        intents=intents,
+        shard_count=int(SHARD_COUNT) if SHARD_COUNT and SHARD_COUNT.lower() != "auto" else None,
+        shard_ids=SHARD_IDS
+    )
+else:
+    bot = commands.Bot(command_prefix='/', intents=intents)
 
 # global variable to track when the bot started its session
 global_start_time = None
@@ -0,0 +1,416 @@
+"""
+Binary snapshots for the Discord bot.
+
+this file provides the snapshot format the voice data is compacted into: a
+header, a string table holding every channel name once, one fixed-width
+record per guild and per channel, and one fixed-width record per member, all
+little-endian. Loading reads the header and the guild table only; a guild's
+members are decoded the first time the guild is used, straight from the
+buffer (a memory-mapped file with the file backend), so the bot is ready
+without parsing the whole roster. Snapshots saved as JSON by earlier
+versions are still read.
+
+Layout (version 3):
+
+- header: magic b"OCVS", version (u16), flags (u16), seq (i64), guild
+  count (u32), string count (u32), schedule count (u32), offset of the
+  schedules (u64)
+- string table: string count + 1 offsets (u32) into the UTF-8 data that follows
+- guilds: guild_id (u64), channel_id (u64, 0 for none), channel_name
+  (string index, -1 for none), tracked count, channel count, member count
+  (u32 each), offset of its channels and of its members (u64 each),
+  interval count (u32) and offset of its intervals (u64)
+- channels of a guild: its tracked channels then the channels its members
+  were seen in, channel_id (u64) and name (string index) each
+- members of a guild: member_id (u64), join time (wall-clock ns, i64, NO_JOIN
+  when there is no open interval), total_ns (i64), channel (u32 index into
+  the guild's seen channels)
+- intervals of a guild, closed during its session: the member IDs, then the
+  starts, then the ends (wall-clock ns), one i64 column each, so they load
+  straight into the guild's Timeline arrays
+- schedules, after the last guild: schedule_id, guild_id, channel_id (u64
+  each), channel name (string index), start and length (u32 seconds each),
+  last started occurrence (i64 UNIX seconds) and flags (u8): RUNNING while
+  it waits to be ended, JOINED if it joined the channel itself
+
+Version 1 snapshots, without intervals, and version 2 snapshots, without
+schedules, are still read.
+"""
+import json
+import struct
+import sys
+from array import array
+from store import SessionStore, GuildSession, MemberRecord
+from schedules import Schedule
+
+MAGIC = b"OCVS"
+VERSION = 3
+
+HEADER = struct.Struct("<4sHHqII")
+OFFSET = struct.Struct("<I")
+SCHEDULES = struct.Struct("<IQ")
+GUILD = struct.Struct("<QQiIIIQQIQ")
+GUILD_V1 = struct.Struct("<QQiIIIQQ")
+CHANNEL = struct.Struct("<Qi")
+MEMBER = struct.Struct("<QqqI")
+SCHEDULE = struct.Struct("<QQQiIIqB")
+
+# join time of members without an open interval
+NO_JOIN = -2**63
+
+# flags of a schedule's last started occurrence
+RUNNING = 1
+JOINED = 2
+
+
+def is_binary(data):
+    """
+    Tell whether saved snapshot data is in the binary format.
+
+    Parameters
+    ----------
+    data : bytes-like
+        The saved snapshot.
+
+    Returns
+    -------
+    bool
+        True for a binary snapshot, False for JSON.
+    """
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def encode_snapshot(seq, store):
+    """
+    Serialize a store into a binary snapshot.
+
+    Parameters
+    ----------
+    seq : int
+        Sequence number of the last journal event the store includes.
+    store : SessionStore
+        The store.
+
+    Returns
+    -------
+    bytes
+        The snapshot.
+    """
+    strings = {}
+
+    def string(value):
+        if value is None:
+            return -1
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    guilds = []
+    for guild_id, session in store.sessions.items():
+        tracked = [(channel_id, string(name)) for channel_id, name in session.tracked.items()]
+        seen = list(session.channel_names.items())
+        position = {channel_id: i for i, (channel_id, _) in enumerate(seen)}
+        channels = tracked + [(channel_id, string(name)) for channel_id, name in seen]
+        members = [
+            (
+                member_id,
+                session.to_wall_ns(record.join_ns) if record.join_ns is not None else NO_JOIN,
+                record.total_ns,
+                position[record.channel_id]
+            ) for member_id, record in session.members.items()
+        ]
+        guilds.append((guild_id, session.channel_id or 0, string(session.channel_name), len(tracked), len(seen), channels, members, session.timeline))
+    schedules = b"".join(
+        SCHEDULE.pack(
+            schedule.id, schedule.guild_id, schedule.channel_id, string(schedule.channel_name),
+            schedule.start, schedule.length, schedule.last_start,
+            (RUNNING if schedule.running else 0) | (JOINED if schedule.joined else 0)
+        ) for schedule in store.schedules.values()
+    )
+
+    encoded = [name.encode("utf-8") for name in strings]
+    offsets = [0]
+    for name in encoded:
+        offsets.append(offsets[-1] + len(name))
+    head = bytearray(HEADER.pack(MAGIC, VERSION, 0, seq, len(guilds), len(encoded)))
+    schedules_at = len(head)
+    head += SCHEDULES.pack(len(store.schedules), 0)  # offset filled in once the guilds are laid out
+    head += struct.pack(f"<{len(offsets)}I", *offsets)
+    head += b"".join(encoded)
+
+    # channels and members follow the guild table, in guild order
+    position = len(head) + GUILD.size * len(guilds)
+    table = []
+    bodies = []
+    for guild_id, channel_id, channel_name, tracked_count, seen_count, channels, members, timeline in guilds:
+        channels_at = position
+        body = b"".join(CHANNEL.pack(*channel) for channel in channels)
+        members_at = channels_at + len(body)
+        body += b"".join(MEMBER.pack(*member) for member in members)
+        intervals_at = channels_at + len(body)
+        body += b"".join(_little_endian(column) for column in (timeline.members, timeline.starts, timeline.ends))
+        position += len(body)
+        table.append(GUILD.pack(
+            guild_id, channel_id, channel_name, tracked_count, seen_count, len(members), channels_at, members_at, len(timeline), intervals_at
+        ))
+        bodies.append(body)
+    SCHEDULES.pack_into(head, schedules_at, len(store.schedules), position)
+    return b"".join([bytes(head)] + table + bodies + [schedules])
+
+
+def _little_endian(column):
+    if sys.byteorder == "big":
+        column = array("q", column)
+        column.byteswap()
+    return column.tobytes()
+
+
+class SnapshotReader:
+    """
+    Reader of a binary snapshot, decoding each guild's members on demand.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The snapshot, e.g. an mmap.mmap of the file. Closed (if it can be)
+        once every guild was decoded or discarded.
+
+    Attributes
+    ----------
+    seq : int
+        Sequence number of the last journal event the snapshot includes.
+    guild_count : int
+        Number of guilds in the snapshot.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        magic, version, _, self.seq, self.guild_count, string_count = HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC:
+            raise ValueError("not a binary voice data snapshot")
+        if version > VERSION:
+            raise ValueError(f"voice data snapshot version {version} is newer than this bot (version {VERSION})")
+        self.guild_struct = GUILD if version >= 2 else GUILD_V1
+        position = HEADER.size
+        self.schedule_count, self.schedules_at = 0, 0
+        if version >= 3:
+            self.schedule_count, self.schedules_at = SCHEDULES.unpack_from(self.view, position)
+            position += SCHEDULES.size
+        offsets = struct.unpack_from(f"<{string_count + 1}I", self.view, position)
+        position += OFFSET.size * (string_count + 1)
+        data = bytes(self.view[position:position + offsets[-1]])
+        self.strings = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(string_count)]
+        self.guilds_at = position + offsets[-1]
+        self._pending = self.guild_count
+
+    def _string(self, index):
+        return self.strings[index] if index >= 0 else None
+
+    def guilds(self):
+        """
+        Generate the guild records, without their members.
+
+        Returns
+        -------
+        generator of tuple
+            (guild_id, channel_id, channel_name, tracked, seen, member_count, members_at, interval_count, intervals_at)
+            where tracked and seen are lists of (channel_id, channel_name).
+        """
+        view = self.view
+        guild = self.guild_struct
+        for i in range(self.guild_count):
+            guild_id, channel_id, channel_name, tracked_count, seen_count, member_count, channels_at, members_at, *intervals = (
+                guild.unpack_from(view, self.guilds_at + i * guild.size)
+            )
+            interval_count, intervals_at = intervals or (0, 0)
+            channels = [
+                (channel, self._string(name))
+                for channel, name in CHANNEL.iter_unpack(view[channels_at:channels_at + CHANNEL.size * (tracked_count + seen_count)])
+            ]
+            yield (
+                guild_id, channel_id or None, self._string(channel_name), channels[:tracked_count], channels[tracked_count:],
+                member_count, members_at, interval_count, intervals_at
+            )
+
+    def schedules(self):
+        """
+        Decode the schedules.
+
+        Returns
+        -------
+        list of Schedule
+            The schedules.
+        """
+        chunk = self.view[self.schedules_at:self.schedules_at + SCHEDULE.size * self.schedule_count]
+        try:
+            return [
+                Schedule(
+                    schedule_id, guild_id, channel_id, self._string(name), start, length, last_start,
+                    bool(flags & RUNNING), bool(flags & JOINED)
+                )
+                for schedule_id, guild_id, channel_id, name, start, length, last_start, flags in SCHEDULE.iter_unpack(chunk)
+            ]
+        finally:
+            chunk.release()
+
+    def members(self, members_at, member_count):
+        """
+        Decode the member records of a guild.
+
+        Parameters
+        ----------
+        members_at : int
+            Offset of the guild's members.
+        member_count : int
+            Number of members of the guild.
+
+        Returns
+        -------
+        list of tuple
+            (member_id, join wall-clock ns or None, total_ns, channel index)
+        """
+        chunk = self.view[members_at:members_at + MEMBER.size * member_count]
+        try:
+            return [
+                (member_id, join if join != NO_JOIN else None, total_ns, channel)
+                for member_id, join, total_ns, channel in MEMBER.iter_unpack(chunk)
+            ]
+        finally:
+            chunk.release()
+
+    def intervals(self, intervals_at, interval_count):
+        """
+        Copy the intervals of a guild into a Timeline's arrays.
+
+        Parameters
+        ----------
+        intervals_at : int
+            Offset of the guild's intervals.
+        interval_count : int
+            Number of intervals of the guild.
+
+        Returns
+        -------
+        tuple of array.array
+            (members, starts, ends)
+        """
+        columns = []
+        for i in range(3):
+            column = array("q")
+            start = intervals_at + 8 * interval_count * i
+            chunk = self.view[start:start + 8 * interval_count]
+            column.frombytes(chunk)
+            chunk.release()
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+        return tuple(columns)
+
+    def _done(self):
+        self._pending -= 1
+        if self._pending == 0:
+            self.close()
+
+    def close(self):
+        """
+        Release the buffer, called once every guild was decoded or
+        discarded so a mapped file can be replaced again.
+
+        Returns
+        -------
+        None
+        """
+        self.view.release()
+        close = getattr(self.buffer, "close", None)
+        if close is not None:
+            close()
+
+    def load(self):
+        """
+        Build a store whose partitions decode their members the first time they are used.
+
+        Returns
+        -------
+        SessionStore
+            The store.
+        """
+        store = SessionStore()
+        store.schedules = {schedule.id: schedule for schedule in self.schedules()}
+        for guild_id, channel_id, channel_name, tracked, seen, member_count, members_at, interval_count, intervals_at in self.guilds():
+            session = GuildSession(guild_id, channel_id, channel_name)
+            session.tracked = dict(tracked)
+            for seen_id, seen_name in seen:
+                session._intern(seen_id, seen_name)
+            loader = self._loader(members_at, member_count, interval_count, intervals_at, [seen_id for seen_id, _ in seen])
+            session.defer(loader, member_count, self._done)
+            store.sessions[guild_id] = session
+            for tracked_id in session.tracked:
+                store.routes[tracked_id] = session
+        if not self.guild_count:
+            self.close()
+        return store
+
+    def _loader(self, members_at, member_count, interval_count, intervals_at, seen):
+        def load(session):
+            members = session.members
+            for member_id, join_wall, total_ns, channel in self.members(members_at, member_count):
+                channel_id = session._interned[seen[channel]]
+                join_ns = session.to_mono_ns(join_wall) if join_wall is not None else None
+                members[member_id] = MemberRecord(join_ns, total_ns, channel_id)
+                if join_ns is not None:
+                    session._index(member_id, channel_id)
+            session._rebuild_leaderboard()
+            timeline = session.timeline
+            timeline.members, timeline.starts, timeline.ends = self.intervals(intervals_at, interval_count)
+            self._done()
+        return load
+
+
+class LegacyVoiceData(ValueError):
+    """
+    Raised for voice data saved before it was partitioned by guild, which
+    can't be mapped back to a guild on its own.
+
+    Parameters
+    ----------
+    members : dict
+        The saved data.
+        Format: {member_id: {"join_time": str or None, "total_duration": str, "channel_name": str}}
+    """
+    def __init__(self, members):
+        super().__init__("the saved voice data uses the old format without guild IDs")
+        self.members = members
+
+
+def decode_snapshot(data):
+    """
+    Read saved snapshot data, binary or JSON.
+
+    Parameters
+    ----------
+    data : bytes-like
+        The saved snapshot.
+
+    Returns
+    -------
+    tuple
+        (seq, store): the sequence number of the last journal event the
+        snapshot includes (0 for JSON snapshots without one) and the store.
+
+    Raises
+    ------
+    LegacyVoiceData
+        If the data is the per-member format written before guilds were
+        tracked, see SessionStore.from_legacy.
+    """
+    if is_binary(data):
+        reader = SnapshotReader(data)
+        return reader.seq, reader.load()
+    # written by earlier versions
+    snapshot = json.loads(bytes(data))
+    if "sessions" in snapshot:
+        return snapshot["seq"], SessionStore.from_dict(snapshot["sessions"])
+    if any("join_time" in v for v in snapshot.values()):
+        raise LegacyVoiceData(snapshot)
+    return 0, SessionStore.from_dict(snapshot)
@@ -0,0 +1,1139 @@
+"""
+Session store for the Discord bot.
+
+this file provides the SessionStore that holds voice activity data for every
+guild the bot is in. Data is partitioned by guild (each partition knows the
+channels it is tracking, any number of them, and the store maps every tracked
+channel ID to its partition so events are routed with one lookup) and an index of the members with an open interval,
+grouped by the voice channel they are tracked in, is kept per guild, so event handlers and commands only touch the live members
+of the guild (or channel) involved instead of the whole table. Each partition
+also keeps a Leaderboard ordered by time spent, updated on every transition,
+and a Timeline of the intervals closed during the session.
+
+Members are stored as compact slotted records. Times are integer nanoseconds
+from the monotonic clock, so durations aren't affected by wall-clock jumps;
+each partition keeps one wall-clock anchor to convert them for persistence
+and display. Channels are referenced by ID, with each name stored once per
+partition.
+
+The store also holds the weekly schedules of its guilds (see schedules.py),
+which outlive the sessions they start.
+
+Every join/leave transition is also described as a small event dict that is
+passed to the store's listeners (the persistence journal), and the same events
+can be replayed with SessionStore.apply to rebuild the store.
+"""
+import datetime
+import time
+from leaderboard import Leaderboard
+from timeline import Timeline
+from schedules import Schedule
+
+
+def now_ns():
+    """
+    Return the current time of the monotonic clock the store works with.
+
+    Returns
+    -------
+    int
+        Nanoseconds from time.monotonic_ns.
+    """
+    return time.monotonic_ns()
+
+
+def _wall_ns(value):
+    # persisted times are wall-clock nanoseconds, older files used ISO strings
+    if isinstance(value, str):
+        return int(datetime.datetime.fromisoformat(value).timestamp() * 1_000_000_000)
+    return value
+
+
+class MemberRecord:
+    """
+    Voice activity of one member in a guild.
+
+    Attributes
+    ----------
+    join_ns : int or None
+        Monotonic time the open interval started, None if there is none.
+    total_ns : int
+        Closed-out time spent, in nanoseconds.
+    channel_id : int
+        The channel of the member's last interval (the partition's interned ID object).
+    """
+    __slots__ = ("join_ns", "total_ns", "channel_id")
+
+    def __init__(self, join_ns, total_ns, channel_id):
+        self.join_ns = join_ns
+        self.total_ns = total_ns
+        self.channel_id = channel_id
+
+
+class GuildSession:
+    """
+    Voice activity data for a single guild.
+
+    Parameters
+    ----------
+    guild_id : int
+        The ID of the guild this partition belongs to.
+    channel_id : int, optional
+        The ID of the voice channel the bot tracks from.
+    channel_name : str, optional
+        The name of the voice channel the bot tracks from.
+
+    Attributes
+    ----------
+    tracked : dict
+        Format: {channel_id: channel name} for every channel being tracked,
+        including the bot's own and channels registered with /track.
+    members : dict
+        Format: {member_id: MemberRecord}
+    channel_names : dict
+        Format: {channel_id: channel name} for every channel referenced by a record.
+    anchor_wall_ns : int
+        Wall-clock time (time.time_ns) at anchor_mono_ns.
+    anchor_mono_ns : int
+        Monotonic time the partition was created in this process.
+    channels : dict
+        Format: {channel_id: set of member IDs with an open interval in that channel}
+    leaderboard : Leaderboard
+        The members ordered by time spent.
+    timeline : Timeline
+        The intervals closed since the partition was created, in wall-clock nanoseconds.
+    """
+    def __init__(self, guild_id, channel_id=None, channel_name=None):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.tracked = {channel_id: channel_name} if channel_id is not None else {}
+        self.members = {}
+        self.channel_names = {}
+        self._interned = {}
+        self.anchor_wall_ns = time.time_ns()
+        self.anchor_mono_ns = time.monotonic_ns()
+        self.channels = {}
+        self.leaderboard = Leaderboard()
+        self.timeline = Timeline()
+        self._loader = None
+        self._release = None
+        self._deferred = 0
+
+    def defer(self, loader, count, release=None):
+        """
+        Leave the members out until they are first used, for partitions read
+        from a snapshot: members, channels, leaderboard and timeline are
+        filled by loader the first time one of them is accessed.
+
+        Parameters
+        ----------
+        loader : callable
+            Takes the partition and fills its members, channels, leaderboard and timeline.
+        count : int
+            Number of members the loader will add.
+        release : callable, optional
+            Called instead of loader if the partition is discarded before
+            its members were used.
+
+        Returns
+        -------
+        None
+        """
+        del self.members, self.channels, self.leaderboard, self.timeline
+        self._loader = loader
+        self._release = release
+        self._deferred = count
+
+    def discard(self):
+        """
+        Drop the members not decoded yet, for a partition removed from its
+        store, so the snapshot it would have been read from can be released.
+
+        Returns
+        -------
+        None
+        """
+        if self._loader is None:
+            return
+        release = self._release
+        self._loader = self._release = None
+        self.members, self.channels, self.leaderboard, self.timeline = {}, {}, Leaderboard(), Timeline()
+        if release is not None:
+            release()
+
+    def __getattr__(self, name):
+        # only called for missing attributes, so a loaded partition pays nothing
+        loader = self.__dict__.get("_loader")
+        if loader is None or name not in ("members", "channels", "leaderboard", "timeline"):
+            raise AttributeError(name)
+        self._loader = self._release = None
+        self.members, self.channels, self.leaderboard, self.timeline = {}, {}, Leaderboard(), Timeline()
+        loader(self)
+        return getattr(self, name)
+
+    def to_wall_ns(self, mono_ns):
+        """
+        Convert a monotonic time of this partition to wall-clock nanoseconds.
+
+        Parameters
+        ----------
+        mono_ns : int
+            The monotonic time.
+
+        Returns
+        -------
+        int
+            The matching time.time_ns value.
+        """
+        return self.anchor_wall_ns + (mono_ns - self.anchor_mono_ns)
+
+    def to_mono_ns(self, wall_ns):
+        """
+        Convert wall-clock nanoseconds to a monotonic time of this partition.
+
+        Parameters
+        ----------
+        wall_ns : int
+            The time.time_ns value.
+
+        Returns
+        -------
+        int
+            The matching monotonic time.
+        """
+        return self.anchor_mono_ns + (wall_ns - self.anchor_wall_ns)
+
+    def _intern(self, channel_id, channel_name):
+        # returns the one int object used for this channel by every record
+        interned = self._interned.setdefault(channel_id, channel_id)
+        self.channel_names[interned] = channel_name
+        return interned
+
+    def _index(self, member_id, channel_id):
+        members = self.channels.get(channel_id)
+        if members is None:
+            members = self.channels[channel_id] = set()
+        members.add(member_id)
+
+    def _unindex(self, member_id, channel_id):
+        members = self.channels.get(channel_id)
+        if members is not None:
+            members.discard(member_id)
+            if not members:
+                del self.channels[channel_id]
+
+    def _rank(self, member_id, record):
+        if record.join_ns is not None:
+            self.leaderboard.add_open(member_id, record.total_ns, record.join_ns)
+        else:
+            self.leaderboard.add_closed(member_id, record.total_ns)
+
+    def _unrank(self, member_id, record):
+        # must be called with the record as it was when _rank was called
+        if record.join_ns is not None:
+            self.leaderboard.remove_open(member_id, record.total_ns, record.join_ns)
+        else:
+            self.leaderboard.remove_closed(member_id, record.total_ns)
+
+    def _rebuild_leaderboard(self):
+        # one sort instead of an insertion per member, used after bulk loads
+        self.leaderboard.rebuild(
+            (member_id, record.total_ns, record.join_ns) for member_id, record in self.members.items()
+        )
+
+    @property
+    def active(self):
+        """
+        list of int: IDs of the members with an open interval, a copy that
+        is safe to iterate while intervals are being closed.
+        """
+        return [member_id for members in self.channels.values() for member_id in members]
+
+    @property
+    def decoded(self):
+        """
+        bool: False while the members read from a snapshot haven't been used
+        yet, reading them (e.g. channels) would decode them.
+        """
+        return self._loader is None
+
+    def __len__(self):
+        if self._loader is not None:
+            return self._deferred
+        return len(self.members)
+
+
+class SessionStore:
+    """
+    Voice activity data for all guilds, partitioned by guild.
+
+    Attributes
+    ----------
+    sessions : dict
+        Format: {guild_id: GuildSession}
+    routes : dict
+        Format: {channel_id: GuildSession} for every tracked channel of every guild.
+    schedules : dict
+        Format: {schedule_id: Schedule} for the schedules of every guild.
+    listeners : list
+        Callables receiving an event dict for every change made through
+        track, untrack, open_session, start, stop, clear_guild and the
+        schedule methods.
+    """
+    def __init__(self):
+        self.sessions = {}
+        self.routes = {}
+        self.schedules = {}
+        self.listeners = []
+
+    def _emit(self, event):
+        for listener in self.listeners:
+            listener(event)
+
+    def __len__(self):
+        return sum(len(session) for session in self.sessions.values())
+
+    def __contains__(self, guild_id):
+        return guild_id in self.sessions
+
+    def session(self, guild_id):
+        """
+        Return the partition of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        GuildSession or None
+            The guild's partition, or None if nothing is tracked there.
+        """
+        return self.sessions.get(guild_id)
+
+    def track(self, guild_id, channel, primary=True):
+        """
+        Return the partition of a guild, creating it if needed, and add the
+        given voice channel to the channels it tracks.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel : discord.VoiceChannel
+            The voice channel to track.
+        primary : bool, optional
+            True if it is the channel the bot is connected to, False for a
+            channel tracked without the bot (/track).
+
+        Returns
+        -------
+        GuildSession
+            The guild's partition.
+        """
+        return self._track(guild_id, channel.id, channel.name, primary)
+
+    def _track(self, guild_id, channel_id, channel_name, primary=True):
+        session = self.sessions.get(guild_id)
+        if session is None:
+            session = self.sessions[guild_id] = GuildSession(guild_id)
+        changed = session.tracked.get(channel_id) != channel_name
+        if changed:
+            session.tracked[channel_id] = channel_name
+            self.routes[channel_id] = session
+        if primary and (session.channel_id != channel_id or session.channel_name != channel_name):
+            session.channel_id = channel_id
+            session.channel_name = channel_name
+            changed = True
+        if changed:
+            event = {"op": "track", "g": guild_id, "c": channel_id, "n": channel_name}
+            if not primary:
+                event["p"] = 0
+            self._emit(event)
+        return session
+
+    def untrack(self, guild_id, channel_id, now):
+        """
+        Stop tracking a voice channel, closing the open intervals of the
+        members in it.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel_id : int
+            The ID of the voice channel.
+        now : int
+            The monotonic time the intervals end, see now_ns.
+
+        Returns
+        -------
+        list of tuple
+            (member_id, duration in nanoseconds) for each closed interval.
+        """
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return []
+        closed = self.stop_channel(guild_id, channel_id, now)
+        if session.tracked.pop(channel_id, None) is not None or session.channel_id == channel_id:
+            if self.routes.get(channel_id) is session:
+                del self.routes[channel_id]
+            if session.channel_id == channel_id:
+                session.channel_id = session.channel_name = None
+            self._emit({"op": "untrack", "g": guild_id, "c": channel_id})
+        return closed
+
+    def tracking(self, channel_id):
+        """
+        Return the partition tracking a voice channel.
+
+        Parameters
+        ----------
+        channel_id : int
+            The ID of the voice channel.
+
+        Returns
+        -------
+        GuildSession or None
+            The partition, or None if the channel isn't tracked.
+        """
+        return self.routes.get(channel_id)
+
+    def reconcile(self, guild_id, present, now, ended=None):
+        """
+        Bring the open intervals of a guild in line with who is in its
+        tracked channels, e.g. after missing voice updates while offline.
+
+        Members still in the channel of their open interval keep it, open
+        intervals of members who left are closed at `ended`, and members who
+        are present without an open interval get one starting at `now`.
+        Open intervals in channels missing from `present` are closed.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        present : dict
+            Format: {channel_id: (discord.VoiceChannel, iterable of member_id)},
+            the members currently in each of the guild's tracked channels.
+        now : int
+            The monotonic time to open intervals at, see now_ns.
+        ended : int, optional
+            The monotonic time to close intervals at, the last moment the
+            bot knew who was connected; `now` by default.
+
+        Returns
+        -------
+        tuple of int
+            (closed, opened): numbers of intervals closed and opened.
+        """
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return 0, 0
+        if ended is None:
+            ended = now
+        present_ids = {channel_id: set(member_ids) for channel_id, (_, member_ids) in present.items()}
+        closed = opened = 0
+        # one pass over the open intervals, another over the present members
+        for channel_id, member_ids in list(session.channels.items()):
+            still_here = present_ids.get(channel_id, ())
+            for member_id in [m for m in member_ids if m not in still_here]:
+                # an interval can't end before it started, e.g. if it was opened after the last save
+                self.stop(guild_id, member_id, max(ended, session.members[member_id].join_ns))
+                closed += 1
+        for channel_id, (channel, _) in present.items():
+            open_here = session.channels.get(channel_id, ())
+            for member_id in present_ids[channel_id]:
+                if member_id not in open_here:
+                    self.start(guild_id, member_id, channel, now)
+                    opened += 1
+        return closed, opened
+
+    def open_session(self, guild_id, channel, member_ids, now):
+        """
+        Start a fresh session in a guild and track the given members.
+
+        Any stale data left over for the guild is dropped.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel : discord.VoiceChannel
+            The voice channel being tracked.
+        member_ids : iterable of int
+            IDs of the members already in the channel.
+        now : int
+            The monotonic time the session starts, see now_ns.
+
+        Returns
+        -------
+        GuildSession
+            The new partition.
+        """
+        self.clear_guild(guild_id)
+        session = self.track(guild_id, channel)
+        for member_id in member_ids:
+            self.start(guild_id, member_id, channel, now)
+        return session
+
+    def start(self, guild_id, member_id, channel, now):
+        """
+        Open an interval for a member.
+
+        Nothing changes if the member already has an open interval in that
+        channel; an open interval in another channel is closed first.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the member's guild.
+        member_id : int
+            The ID of the member.
+        channel : discord.VoiceChannel
+            The voice channel the member joined.
+        now : int
+            The monotonic time the member joined, see now_ns.
+
+        Returns
+        -------
+        None
+        """
+        self._start(guild_id, member_id, channel.id, channel.name, now)
+
+    def _start(self, guild_id, member_id, channel_id, channel_name, now):
+        session = self.sessions.get(guild_id)
+        if session is None:
+            session = self._track(guild_id, channel_id, channel_name)
+        channel_id = session._intern(channel_id, channel_name)
+        record = session.members.get(member_id)
+        if record is None:
+            record = session.members[member_id] = MemberRecord(now, 0, channel_id)
+        else:
+            if record.join_ns is not None:
+                if record.channel_id == channel_id:
+                    return
+                # moved straight from one tracked channel to another
+                self.stop(guild_id, member_id, now)
+            session._unrank(member_id, record)
+            record.join_ns = now
+            record.channel_id = channel_id
+        session._index(member_id, channel_id)
+        session._rank(member_id, record)
+        if self.listeners:
+            self._emit({"op": "join", "g": guild_id, "m": member_id, "c": channel_id, "n": channel_name, "t": session.to_wall_ns(now)})
+
+    def stop(self, guild_id, member_id, now):
+        """
+        Close the open interval of a member.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the member's guild.
+        member_id : int
+            The ID of the member.
+        now : int
+            The monotonic time the member left, see now_ns.
+
+        Returns
+        -------
+        int or None
+            The length of the closed interval in nanoseconds, or None if the
+            member had no open interval.
+        """
+        session = self.sessions.get(guild_id)
+        record = session.members.get(member_id) if session else None
+        if record is None or record.join_ns is None:
+            return None
+        session._unindex(member_id, record.channel_id)
+        session._unrank(member_id, record)
+        duration = now - record.join_ns
+        record.total_ns += duration
+        start, end = session.to_wall_ns(record.join_ns), session.to_wall_ns(now)
+        session.timeline.add(member_id, start, end)
+        if self.listeners:
+            self._emit({"op": "leave", "g": guild_id, "m": member_id, "c": record.channel_id, "t": end, "j": start})
+        record.join_ns = None
+        session._rank(member_id, record)
+        return duration
+
+    def stop_guild(self, guild_id, now):
+        """
+        Close every open interval in a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        now : int
+            The monotonic time the intervals end, see now_ns.
+
+        Returns
+        -------
+        None
+        """
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return
+        for member_id in session.active:
+            self.stop(guild_id, member_id, now)
+
+    def stop_channel(self, guild_id, channel_id, now):
+        """
+        Close the open intervals of the members tracked in a voice channel.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel_id : int
+            The ID of the voice channel.
+        now : int
+            The monotonic time the intervals end, see now_ns.
+
+        Returns
+        -------
+        list of tuple
+            (member_id, duration in nanoseconds) for each closed interval.
+        """
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return []
+        return [
+            (member_id, self.stop(guild_id, member_id, now))
+            for member_id in list(session.channels.get(channel_id, ()))
+        ]
+
+    def stop_all(self, now):
+        """
+        Close every open interval in every guild.
+
+        Parameters
+        ----------
+        now : int
+            The monotonic time the intervals end, see now_ns.
+
+        Returns
+        -------
+        None
+        """
+        for guild_id, session in self.sessions.items():
+            if session.channels:
+                self.stop_guild(guild_id, now)
+
+    def active_members(self, guild_id):
+        """
+        Return the IDs of the members of a guild with an open interval.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        list of int
+            A copy of the guild's active index, safe to iterate while
+            intervals are being closed.
+        """
+        session = self.sessions.get(guild_id)
+        return session.active if session else []
+
+    def ranking(self, guild_id, now, start=0, count=None):
+        """
+        Return a slice of the guild's members ordered by time spent (longest
+        first), including the open part of their current interval, without
+        modifying anything or sorting the roster.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        now : int
+            The monotonic time to measure open intervals up to, see now_ns.
+        start : int, optional
+            Zero-based rank of the first member to return.
+        count : int, optional
+            Maximum number of members to return, all of them by default.
+
+        Returns
+        -------
+        list of tuple
+            (member_id, total_seconds, channel_name) for each member.
+        """
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return []
+        if count is None:
+            count = len(session)
+        members, channel_names = session.members, session.channel_names
+        return [
+            (member_id, total_ns / 1_000_000_000, channel_names[members[member_id].channel_id])
+            for member_id, total_ns in session.leaderboard.page(now, start, count)
+        ]
+
+    def iter_ranking(self, guild_id, now, chunk=1000):
+        """
+        Iterate over the whole ranking of a guild, a page of the leaderboard
+        at a time, without building the full list.
+
+        The store must not change while the iterator is being consumed.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        now : int
+            The monotonic time to measure open intervals up to, see now_ns.
+        chunk : int, optional
+            Number of members fetched from the leaderboard at once.
+
+        Returns
+        -------
+        generator of tuple
+            (member_id, total_seconds, channel_name) for each member, longest first.
+        """
+        start = 0
+        while True:
+            rows = self.ranking(guild_id, now, start, chunk)
+            yield from rows
+            if len(rows) < chunk:
+                return
+            start += chunk
+
+    def open_intervals(self, guild_id):
+        """
+        Return the open intervals of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        list of tuple
+            (member_id, channel_id, join time in UNIX seconds) per member with an open interval.
+        """
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return []
+        members = session.members
+        return [
+            (member_id, members[member_id].channel_id, session.to_wall_ns(members[member_id].join_ns) / 1_000_000_000)
+            for member_id in session.active
+        ]
+
+    def intervals(self, guild_id, now):
+        """
+        Return every interval of a guild's session, the open ones measured up to now.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        now : int
+            The monotonic time open intervals end at, see now_ns.
+
+        Returns
+        -------
+        tuple or None
+            (members, starts, ends) arrays with times in wall-clock
+            nanoseconds, see Timeline.with_open; None if nothing is tracked there.
+        """
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return None
+        members = session.members
+        open_intervals = [(member_id, session.to_wall_ns(members[member_id].join_ns)) for member_id in session.active]
+        return session.timeline.with_open(open_intervals, session.to_wall_ns(now))
+
+    def rank(self, guild_id, member_id, now):
+        """
+        Return the rank of a member in the guild's ranking.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        member_id : int
+            The ID of the member.
+        now : int
+            The monotonic time to measure open intervals up to, see now_ns.
+
+        Returns
+        -------
+        int or None
+            One-based rank, or None if the member isn't tracked.
+        """
+        session = self.sessions.get(guild_id)
+        record = session.members.get(member_id) if session else None
+        if record is None:
+            return None
+        total_ns = record.total_ns
+        if record.join_ns is not None:
+            total_ns += now - record.join_ns
+        return session.leaderboard.rank(total_ns, now)
+
+    def wall_time(self, guild_id, now):
+        """
+        Convert a monotonic time to a wall-clock datetime for display.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild whose anchor is used.
+        now : int
+            The monotonic time, see now_ns.
+
+        Returns
+        -------
+        datetime.datetime
+            The matching local time.
+        """
+        session = self.sessions.get(guild_id)
+        wall_ns = session.to_wall_ns(now) if session else time.time_ns() + (now - time.monotonic_ns())
+        return datetime.datetime.fromtimestamp(wall_ns / 1_000_000_000)
+
+    def clear_guild(self, guild_id):
+        """
+        Drop all the data of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        None
+        """
+        session = self.sessions.pop(guild_id, None)
+        if session is not None:
+            self._unroute(session)
+            session.discard()
+            self._emit({"op": "clear", "g": guild_id})
+
+    def _unroute(self, session):
+        for channel_id in session.tracked:
+            if self.routes.get(channel_id) is session:
+                del self.routes[channel_id]
+
+    def clear(self):
+        """
+        Drop the data of every guild.
+
+        Unlike clear_guild this isn't reported to the listeners, it is meant
+        for replacing the whole store with freshly loaded data.
+
+        Returns
+        -------
+        None
+        """
+        for session in self.sessions.values():
+            session.discard()
+        self.sessions.clear()
+        self.routes.clear()
+        self.schedules.clear()
+
+    def add_schedule(self, guild_id, channel, start, length):
+        """
+        Add a weekly session to a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel : discord.VoiceChannel
+            The voice channel the bot joins.
+        start : int
+            Seconds from Monday 00:00 UTC to the start of the session.
+        length : int
+            Length of the session in seconds.
+
+        Returns
+        -------
+        Schedule
+            The new schedule.
+        """
+        schedule_id = max(self.schedules, default=0) + 1
+        schedule = self.schedules[schedule_id] = Schedule(schedule_id, guild_id, channel.id, channel.name, start, length)
+        self._emit({"op": "schedule", "g": guild_id, "s": schedule_id, "c": channel.id, "n": channel.name, "w": start, "l": length})
+        return schedule
+
+    def remove_schedule(self, schedule_id):
+        """
+        Remove a schedule. A session it started keeps going until /leave.
+
+        Parameters
+        ----------
+        schedule_id : int
+            The ID of the schedule.
+
+        Returns
+        -------
+        Schedule or None
+            The removed schedule, None if there was none with that ID.
+        """
+        schedule = self.schedules.pop(schedule_id, None)
+        if schedule is not None:
+            self._emit({"op": "unschedule", "g": schedule.guild_id, "s": schedule_id})
+        return schedule
+
+    def start_schedule(self, schedule_id, occurrence):
+        """
+        Record that an occurrence of a schedule was started.
+
+        Parameters
+        ----------
+        schedule_id : int
+            The ID of the schedule.
+        occurrence : int
+            UNIX seconds the occurrence starts.
+
+        Returns
+        -------
+        None
+        """
+        schedule = self.schedules[schedule_id]
+        schedule.last_start, schedule.running, schedule.joined = occurrence, True, False
+        self._emit({"op": "schedule_start", "g": schedule.guild_id, "s": schedule_id, "t": occurrence})
+
+    def join_schedule(self, schedule_id):
+        """
+        Record that the running occurrence of a schedule joined its channel,
+        so its end is the one to leave it.
+
+        Parameters
+        ----------
+        schedule_id : int
+            The ID of the schedule.
+
+        Returns
+        -------
+        None
+        """
+        schedule = self.schedules[schedule_id]
+        schedule.joined = True
+        self._emit({"op": "schedule_join", "g": schedule.guild_id, "s": schedule_id})
+
+    def end_schedule(self, schedule_id):
+        """
+        Record that the running occurrence of a schedule was ended.
+
+        Parameters
+        ----------
+        schedule_id : int
+            The ID of the schedule.
+
+        Returns
+        -------
+        None
+        """
+        schedule = self.schedules[schedule_id]
+        schedule.running = False
+        self._emit({"op": "schedule_end", "g": schedule.guild_id, "s": schedule_id})
+
+    def guild_schedules(self, guild_id):
+        """
+        Return the schedules of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        list of Schedule
+            The schedules, oldest first.
+        """
+        return [schedule for schedule in self.schedules.values() if schedule.guild_id == guild_id]
+
+    def apply(self, event):
+        """
+        Replay an event previously emitted to the listeners.
+
+        Parameters
+        ----------
+        event : dict
+            The event, as passed to the listeners.
+
+        Returns
+        -------
+        None
+        """
+        op = event["op"]
+        if op == "join":
+            session = self.sessions.get(event["g"]) or self._track(event["g"], event["c"], event["n"])
+            self._start(event["g"], event["m"], event["c"], event["n"], session.to_mono_ns(_wall_ns(event["t"])))
+        elif op == "leave":
+            session = self.sessions.get(event["g"])
+            if session is not None:
+                self.stop(event["g"], event["m"], session.to_mono_ns(_wall_ns(event["t"])))
+        elif op == "track":
+            self._track(event["g"], event["c"], event["n"], event.get("p", 1))
+        elif op == "untrack":
+            session = self.sessions.get(event["g"])
+            if session is not None:
+                session.tracked.pop(event["c"], None)
+                if self.routes.get(event["c"]) is session:
+                    del self.routes[event["c"]]
+                if session.channel_id == event["c"]:
+                    session.channel_id = session.channel_name = None
+        elif op == "clear":
+            self.clear_guild(event["g"])
+        elif op == "schedule":
+            self.schedules[event["s"]] = Schedule(event["s"], event["g"], event["c"], event["n"], event["w"], event["l"])
+        elif op == "unschedule":
+            self.schedules.pop(event["s"], None)
+        elif op == "schedule_start":
+            if event["s"] in self.schedules:
+                self.start_schedule(event["s"], event["t"])
+        elif op == "schedule_join":
+            if event["s"] in self.schedules:
+                self.join_schedule(event["s"])
+        elif op == "schedule_end":
+            if event["s"] in self.schedules:
+                self.end_schedule(event["s"])
+
+    def update(self, other):
+        """
+        Copy the partitions and schedules of another store into this one.
+
+        Like clear, this isn't reported to the listeners.
+
+        Parameters
+        ----------
+        other : SessionStore
+            The store to copy from.
+
+        Returns
+        -------
+        None
+        """
+        for guild_id, session in other.sessions.items():
+            previous = self.sessions.get(guild_id)
+            if previous is not None and previous is not session:
+                self._unroute(previous)
+                previous.discard()
+            self.sessions[guild_id] = session
+            for channel_id in session.tracked:
+                self.routes[channel_id] = session
+        self.schedules.update(other.schedules)
+
+    def to_dict(self):
+        """
+        Convert the store to a JSON-serializable format.
+
+        Times are stored as wall-clock nanoseconds so they survive restarts.
+
+        Returns
+        -------
+        dict
+            Format: {guild_id: {"channel_id": int, "channel_name": str, "tracked": {channel_id: name},
+            "channels": {channel_id: name},
+            "members": {member_id: {"join_ns": int or None, "total_ns": int, "channel_id": int}}}}
+        """
+        return {
+            str(guild_id): {
+                "channel_id": session.channel_id,
+                "channel_name": session.channel_name,
+                "tracked": {str(k): v for k, v in session.tracked.items()},
+                "channels": {str(k): v for k, v in session.channel_names.items()},
+                "members": {
+                    str(k): {
+                        "join_ns": session.to_wall_ns(v.join_ns) if v.join_ns is not None else None,
+                        "total_ns": v.total_ns,
+                        "channel_id": v.channel_id
+                    } for k, v in session.members.items()
+                }
+            } for guild_id, session in self.sessions.items()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a store from the format produced by to_dict.
+
+        Also reads the earlier format that stored ISO join times, seconds and
+        a channel name per member.
+
+        Parameters
+        ----------
+        data : dict
+            The serialized store.
+
+        Returns
+        -------
+        SessionStore
+            The rebuilt store.
+        """
+        store = cls()
+        for guild_id, raw in data.items():
+            session = GuildSession(int(guild_id), raw.get("channel_id"), raw.get("channel_name"))
+            if "tracked" in raw:
+                session.tracked = {int(k): v for k, v in raw["tracked"].items()}
+            names = {int(k): v for k, v in raw.get("channels", {}).items()}
+            for k, v in raw["members"].items():
+                member_id = int(k)
+                channel_id = v.get("channel_id", session.channel_id)
+                channel_id = session._intern(channel_id, names.get(channel_id) or v.get("channel_name"))
+                if "total_ns" in v:
+                    join_wall, total_ns = v["join_ns"], v["total_ns"]
+                else:
+                    join_wall = _wall_ns(v["join_time"]) if v["join_time"] else None
+                    total_ns = int(float(v["total_duration"]) * 1_000_000_000)
+                join_ns = session.to_mono_ns(join_wall) if join_wall is not None else None
+                session.members[member_id] = MemberRecord(join_ns, total_ns, channel_id)
+                if join_ns is not None:
+                    session._index(member_id, channel_id)
+            session._rebuild_leaderboard()
+            store.sessions[session.guild_id] = session
+            for channel_id in session.tracked:
+                store.routes[channel_id] = session
+        return store
+
+    @classmethod
+    def from_legacy(cls, guild_id, members, channel_ids, saved_at):
+        """
+        Build a store from the voice data of a bot from before guilds were
+        tracked, which only ever ran in one guild.
+
+        The migrated guild tracks no channel, so nothing would ever close an
+        interval that was open when the data was saved: those are closed at
+        the time it was saved.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild the data belongs to.
+        members : dict
+            The saved data.
+            Format: {member_id: {"join_time": str or None, "total_duration": str, "channel_name": str}}
+        channel_ids : dict
+            The guild's voice channels, to find the members' channels by name.
+            Format: {channel_name: channel_id}, channels not found get ID 0.
+        saved_at : int
+            Wall-clock nanoseconds the data was saved.
+
+        Returns
+        -------
+        SessionStore
+            The store, with the members in the guild, no tracked channel and no open interval.
+        """
+        converted = {}
+        for member_id, record in members.items():
+            total_ns = int(float(record["total_duration"]) * 1_000_000_000)
+            if record["join_time"]:
+                total_ns += max(0, saved_at - _wall_ns(record["join_time"]))
+            converted[member_id] = {
+                "join_ns": None,
+                "total_ns": total_ns,
+                "channel_id": channel_ids.get(record["channel_name"], 0),
+                "channel_name": record["channel_name"]
+            }
+        return cls.from_dict({guild_id: {"members": converted}})
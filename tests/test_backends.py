@@ -0,0 +1,164 @@
+import asyncio
+import json
+
+import pytest
+
+from backends import FileBackend, MemoryBackend, SQLiteBackend, RedisBackend, StateBackend, StateConflict
+from journal import VoiceJournal
+from persistence import PersistenceService
+
+
+class Channel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+
+
+def events(first, last, op="join"):
+    return [(seq, json.dumps({"seq": seq, "op": op})) for seq in range(first, last + 1)]
+
+
+def shared_backend(kind, tmp_path, server=None):
+    if kind == "sqlite":
+        return SQLiteBackend(str(tmp_path / "state.db"), "state")
+    return redis_backend("state", server)
+
+
+def redis_backend(name, server):
+    import fakeredis
+    return RedisBackend(name, client=fakeredis.FakeRedis(server=server))
+
+
+@pytest.fixture(params=["file", "memory", "sqlite", "redis"])
+def make_backend(request, tmp_path):
+    # a factory, so the shared backends can be opened twice on the same state
+    server = None
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+    backends = {}
+
+    def make():
+        if request.param == "file":
+            return FileBackend(str(tmp_path / "state.snapshot"), str(tmp_path / "state.journal"))
+        if request.param == "memory":
+            # one instance is the whole state
+            return backends.setdefault("memory", MemoryBackend())
+        if request.param == "sqlite":
+            return SQLiteBackend(str(tmp_path / "state.db"), "state")
+        return redis_backend("state", server)
+
+    return make
+
+
+def test_incomplete_backend_cannot_be_created():
+    class NoReplace(StateBackend):
+        def exists(self):
+            return False
+
+        def read(self):
+            return None, []
+
+        def append(self, events):
+            pass
+
+        def saved_at(self):
+            return None
+
+    with pytest.raises(TypeError):
+        NoReplace()
+
+
+def test_round_trip(make_backend):
+    backend = make_backend()
+    assert not backend.exists()
+    assert backend.read() == (None, [])
+
+    backend.append(events(1, 3))
+    assert backend.exists()
+    assert backend.saved_at() is not None
+    backend.replace(3, b"snapshot at 3")
+    backend.append(events(4, 5))
+
+    data, lines = make_backend().read()
+    assert bytes(data) == b"snapshot at 3"
+    assert [json.loads(line)["seq"] for line in lines] == [4, 5]
+
+
+@pytest.fixture
+def server(kind):
+    if kind != "redis":
+        return None
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeServer()
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_retried_batch_is_not_duplicated(kind, tmp_path, server):
+    backend = shared_backend(kind, tmp_path, server)
+    backend.read()
+    backend.append(events(1, 2))
+    # a failed save puts its lines back in front of the next batch
+    backend.append(events(1, 4))
+    _, lines = backend.read()
+    assert [json.loads(line)["seq"] for line in lines] == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_second_writer_is_refused(kind, tmp_path, server):
+    first, second = shared_backend(kind, tmp_path, server), shared_backend(kind, tmp_path, server)
+    first.read()
+    second.read()
+
+    first.append(events(1, 2))
+    with pytest.raises(StateConflict):
+        second.append(events(1, 3, op="leave"))
+    with pytest.raises(StateConflict):
+        second.replace(3, b"snapshot at 3")
+
+    # the refused writes left the state as the first process wrote it
+    data, lines = first.read()
+    assert data is None
+    assert [json.loads(line)["seq"] for line in lines] == [1, 2]
+    # and the first process keeps writing
+    first.append(events(3, 3))
+    first.replace(3, b"snapshot at 3")
+    assert first.read() == (b"snapshot at 3", [])
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_batch_that_went_through_unacknowledged(kind, tmp_path, server):
+    backend = shared_backend(kind, tmp_path, server)
+    backend.read()
+    backend.append(events(1, 2))
+    # as if the reply to the write was lost: the batch is retried with the next events
+    backend.head = 0
+    backend.append(events(1, 4))
+    assert backend.head == 4
+    _, lines = backend.read()
+    assert [json.loads(line)["seq"] for line in lines] == [1, 2, 3, 4]
+
+
+def test_conflict_stops_the_saves(tmp_path):
+    path = str(tmp_path / "state.db")
+    journals = [VoiceJournal(SQLiteBackend(path, "voice_data")) for _ in range(2)]
+    services = []
+    for journal in journals:
+        store = journal.load()
+        store.listeners.append(journal.record)
+        services.append(PersistenceService(journal, store))
+
+    async def run():
+        first, second = services
+        first.store.track(1, Channel(10, "hall"))
+        assert await first.save()
+        second.store.track(2, Channel(20, "room"))
+        with pytest.raises(StateConflict):
+            await second.save()
+        # from then on the shard's saves are off, and its events aren't kept for them
+        second.store.track(3, Channel(30, "lounge"))
+        assert not await second.save()
+        assert second.journal.pending == []
+
+    asyncio.run(run())
+    assert set(VoiceJournal(SQLiteBackend(path, "voice_data")).load().sessions) == {1}
@@ -0,0 +1,24 @@
+from history import AttendanceHistory
+from store import SessionStore, now_ns
+
+
+class Channel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+
+
+def test_intervals_keep_the_member_channel(tmp_path):
+    history = AttendanceHistory(str(tmp_path / "history.db"))
+    store = SessionStore()
+    store.listeners.append(history.record)
+    hall, room = Channel(10, "hall"), Channel(20, "room")
+    now = now_ns()
+    store.track(1, hall)
+    store.track(1, room, primary=False)
+    store.start(1, 100, hall, now)
+    store.start(1, 200, room, now)
+    store.stop(1, 100, now + 1_000_000_000)
+    store.stop(1, 200, now + 2_000_000_000)
+    channels = {member_id: channel_id for _, _, member_id, channel_id, _, _ in history._intervals}
+    assert channels == {100: 10, 200: 20}
@@ -0,0 +1,40 @@
+import random
+
+from leaderboard import Leaderboard
+
+
+def ranking(board, now, chunk):
+    entries = []
+    start = 0
+    while start < len(board):
+        entries += board.page(now, start, chunk)
+        start += chunk
+    return entries
+
+
+def test_tie_across_page_boundary():
+    now = 1_000
+    board = Leaderboard()
+    board.add_closed(1, 10)
+    board.add_open(2, 0, now - 10)
+    assert board.page(now, 0, 1) == [(1, 10)]
+    assert board.page(now, 1, 1) == [(2, 10)]
+
+
+def test_pages_match_full_ranking():
+    rng = random.Random(0)
+    now = 10_000
+    board = Leaderboard()
+    for member_id in range(1, 301):
+        # few distinct totals, so closed and open entries tie often
+        total = rng.randrange(5) * 100
+        if rng.random() < 0.5:
+            board.add_closed(member_id, total)
+        else:
+            joined = now - rng.randrange(3) * 100
+            board.add_open(member_id, total, joined)
+    full = board.page(now, 0, len(board))
+    assert sorted(member_id for member_id, _ in full) == list(range(1, 301))
+    assert [total for _, total in full] == sorted((total for _, total in full), reverse=True)
+    for chunk in (1, 7, 64, 1000):
+        assert ranking(board, now, chunk) == full
@@ -0,0 +1,37 @@
+from backends import MemoryBackend
+from shards import Shard
+from snapshot import encode_snapshot, decode_snapshot
+from store import SessionStore
+
+import utils
+
+
+class Channel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+
+
+def test_gauges_leave_snapshot_guilds_encoded(monkeypatch):
+    saved = SessionStore()
+    for guild_id in (1, 2):
+        channel = Channel(guild_id * 10, "hall")
+        saved.track(guild_id, channel)
+        saved.start(guild_id, 100, channel, 0)
+        saved.start(guild_id, 200, channel, 0)
+    _, loaded = decode_snapshot(encode_snapshot(1, saved))
+
+    shard = Shard(0, MemoryBackend())
+    shard.store.update(loaded)
+    monkeypatch.setattr(utils.shards, "shards", {0: shard})
+    guild = shard.store.sessions[1]
+    assert not guild.decoded
+
+    gauges = utils.metrics.read_gauges()
+    assert gauges["members_tracked"] == 4
+    assert gauges["open_intervals"] == 0
+    assert not guild.decoded
+
+    guild.members
+    assert utils.metrics.read_gauges()["open_intervals"] == 2
+    assert not shard.store.sessions[2].decoded
@@ -0,0 +1,68 @@
+import asyncio
+
+import discord
+
+from outbox import Outbox
+
+
+class Response:
+    status = 429
+    reason = "Too Many Requests"
+    headers = {"Retry-After": "0.05"}
+
+
+class Channel:
+    id = 1
+    name = "attendance"
+
+    def __init__(self):
+        self.sent = []
+        self.attempts = 0
+        # the first send is answered with a 429 once released
+        self.release = asyncio.Event()
+
+    async def send(self, content):
+        self.attempts += 1
+        if self.attempts == 1:
+            await self.release.wait()
+            raise discord.HTTPException(Response(), "rate limited")
+        self.sent.append(content)
+        return content
+
+
+async def until(condition):
+    while not condition():
+        await asyncio.sleep(0)
+
+
+def test_keyed_message_rate_limited_is_replaced_by_a_later_post():
+    async def run():
+        outbox = Outbox()
+        channel = Channel()
+        channel.release.set()
+        first = outbox.post(channel, "first", key="farewell")
+        await until(lambda: channel.attempts == 1)
+        await asyncio.sleep(0)
+        # queued again after the 429, a post with its key replaces it
+        second = outbox.post(channel, "second", key="farewell")
+        results = await asyncio.gather(first, second)
+        outbox._task.cancel()
+        return results, channel.sent, outbox.coalesced
+
+    assert asyncio.run(run()) == (["second", "second"], ["second"], 1)
+
+
+def test_keyed_message_posted_while_one_is_in_flight():
+    async def run():
+        outbox = Outbox()
+        channel = Channel()
+        first = outbox.post(channel, "first", key="farewell")
+        await until(lambda: channel.attempts == 1)
+        second = outbox.post(channel, "second", key="farewell")
+        # the one in flight gets a 429 after the second was queued: it isn't sent again
+        channel.release.set()
+        results = await asyncio.gather(first, second)
+        outbox._task.cancel()
+        return results, channel.sent, len(outbox)
+
+    assert asyncio.run(run()) == (["second", "second"], ["second"], 0)
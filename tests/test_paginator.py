@@ -0,0 +1,20 @@
+import asyncio
+
+import utils
+
+
+def test_buttons_pass_the_interaction(monkeypatch):
+    turned = []
+
+    async def turn_page(self, interaction, step):
+        turned.append((interaction, step))
+
+    monkeypatch.setattr(utils.Paginator, "turn_page", turn_page)
+
+    async def click():
+        view = utils.Paginator()
+        for item in view.children:
+            await item.callback("interaction")
+
+    asyncio.run(click())
+    assert turned == [("interaction", -1), ("interaction", 1)]
@@ -0,0 +1,120 @@
+import asyncio
+
+from backends import MemoryBackend
+import schedules
+from schedules import Schedule, Scheduler, START, END, WEEK
+from shards import Shard
+from snapshot import encode_snapshot, decode_snapshot
+
+import utils
+
+# a Wednesday, 12:00 UTC
+NOW = 1_700_049_600
+
+
+class Channel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+
+
+class Ingest:
+    def flush(self):
+        pass
+
+
+def schedule_at(offset, length=3600):
+    # a schedule whose latest occurrence started offset seconds before NOW
+    schedule = Schedule(1, 1, 10, "hall", 0, length)
+    schedule.start = (NOW - offset - schedule.occurrence(NOW)) % WEEK
+    return schedule
+
+
+def test_next_firing_catches_up():
+    # within its hours but never started: due right away
+    schedule = schedule_at(600)
+    assert schedule.next_firing(NOW) == (NOW, START, NOW - 600)
+    # started, and should have ended while the bot was down: due right away
+    schedule = schedule_at(7200)
+    schedule.last_start, schedule.running = NOW - 7200, True
+    assert schedule.next_firing(NOW) == (NOW - 3600, END, NOW - 7200)
+    # passed entirely: skipped to next week
+    schedule = schedule_at(7200)
+    assert schedule.next_firing(NOW) == (NOW - 7200 + WEEK, START, NOW - 7200 + WEEK)
+
+
+def test_missed():
+    schedule = schedule_at(7200)
+    assert schedule.missed(NOW) == 0
+    schedule.last_start = NOW - 7200 - 3 * WEEK
+    assert schedule.missed(NOW) == 3
+
+
+def test_scheduler_fires_due_schedules_on_load(monkeypatch):
+    class Clock:
+        @staticmethod
+        def time():
+            return NOW
+
+    monkeypatch.setattr(schedules, "time", Clock)
+    shard = Shard(0, MemoryBackend())
+    hall = Channel(10, "hall")
+    late = shard.store.add_schedule(1, hall, schedule_at(600).start, 3600)
+    overdue = shard.store.add_schedule(2, hall, schedule_at(7200).start, 3600)
+    shard.store.start_schedule(overdue.id, NOW - 7200)
+    later = shard.store.add_schedule(3, hall, schedule_at(-600).start, 3600)
+
+    fired = []
+
+    async def fire(shard, schedule, action, occurrence):
+        fired.append((schedule.id, action, occurrence))
+
+    async def run():
+        scheduler = Scheduler(fire)
+        scheduler.load(shard)
+        scheduler.start()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        scheduler.task.cancel()
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert sorted(fired) == [(late.id, START, NOW - 600), (overdue.id, END, NOW - 7200)]
+    assert (late.running, late.last_start) == (True, NOW - 600)
+    assert not overdue.running
+    # what is queued next: the late session's end, the others' next start
+    assert sorted((entry[5].id, entry[0], entry[2]) for entry in scheduler.heap) == [
+        (late.id, NOW - 600 + 3600, END), (overdue.id, NOW - 7200 + WEEK, START), (later.id, NOW + 600, START)
+    ]
+
+
+def test_joined_is_saved():
+    shard = Shard(0, MemoryBackend())
+    schedule = shard.store.add_schedule(1, Channel(10, "hall"), 0, 3600)
+    shard.store.start_schedule(schedule.id, NOW)
+    shard.store.join_schedule(schedule.id)
+    _, loaded = decode_snapshot(encode_snapshot(1, shard.store))
+    assert (loaded.schedules[schedule.id].running, loaded.schedules[schedule.id].joined) == (True, True)
+    # a new occurrence hasn't joined yet
+    shard.store.start_schedule(schedule.id, NOW + WEEK)
+    assert not schedule.joined
+
+
+def test_end_leaves_sessions_the_start_did_not_join(monkeypatch):
+    class Guild:
+        id = 1
+        name = "guild"
+
+    shard = Shard(0, MemoryBackend())
+    shard.ingest = Ingest()
+    hall = Channel(10, "hall")
+    # joined with /join while the schedule's start was skipped
+    shard.store.open_session(1, hall, [100], 0)
+    schedule = shard.store.add_schedule(1, hall, 0, 3600)
+    shard.store.start_schedule(schedule.id, NOW)
+    shard.store.end_schedule(schedule.id)
+    monkeypatch.setattr(utils.bot, "get_guild", lambda guild_id: Guild())
+
+    asyncio.run(utils.run_schedule(shard, schedule, END, NOW))
+    session = shard.store.session(1)
+    assert session is not None and session.members[100].join_ns is not None
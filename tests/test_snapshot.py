@@ -0,0 +1,167 @@
+import datetime
+import json
+import mmap
+
+import pytest
+
+from backends import FileBackend
+from journal import VoiceJournal
+from snapshot import encode_snapshot, decode_snapshot, is_binary, SnapshotReader, LegacyVoiceData
+from store import SessionStore
+
+SECOND = 1_000_000_000
+
+
+class Channel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+
+
+def build():
+    store = SessionStore()
+    hall, room = Channel(10, "hall"), Channel(20, "room")
+    store.track(1, hall)
+    store.track(1, room, primary=False)
+    store.track(2, Channel(30, "lounge"))
+    for member_id in range(100, 110):
+        store.start(1, member_id, hall if member_id % 2 else room, member_id * SECOND)
+        store.stop(1, member_id, (member_id + member_id % 7 + 1) * SECOND)
+    store.start(2, 200, Channel(30, "lounge"), 0)
+    store.stop(2, 200, 5 * SECOND)
+    store.start(1, 100, hall, 300 * SECOND)  # still in the channel
+    schedule = store.add_schedule(1, hall, 3600, 7200)
+    schedule.last_start, schedule.running = 1_700_000_000, True
+    return store
+
+
+def closed_totals(store, guild_id):
+    return {member_id: record.total_ns for member_id, record in store.sessions[guild_id].members.items()}
+
+
+def test_round_trip():
+    store = build()
+    data = encode_snapshot(42, store)
+    assert is_binary(data)
+
+    seq, loaded = decode_snapshot(data)
+    assert seq == 42
+    assert set(loaded.sessions) == {1, 2}
+    for guild_id in (1, 2):
+        original, session = store.sessions[guild_id], loaded.sessions[guild_id]
+        assert session.tracked == original.tracked
+        assert closed_totals(loaded, guild_id) == closed_totals(store, guild_id)
+        assert {member_id: record.channel_id for member_id, record in session.members.items()} == \
+            {member_id: record.channel_id for member_id, record in original.members.items()}
+        assert list(session.timeline.members) == list(original.timeline.members)
+        assert list(session.timeline.starts) == list(original.timeline.starts)
+        assert list(session.timeline.ends) == list(original.timeline.ends)
+    # the open interval is still open, in the channel it started in
+    assert loaded.sessions[1].members[100].join_ns is not None
+    assert loaded.sessions[1].channels[10] == {100}
+    assert loaded.routes[20] is loaded.sessions[1]
+
+    (schedule,) = loaded.schedules.values()
+    assert (schedule.guild_id, schedule.channel_id, schedule.channel_name, schedule.start, schedule.length) == (1, 10, "hall", 3600, 7200)
+    assert (schedule.last_start, schedule.running) == (1_700_000_000, True)
+
+
+def test_members_are_decoded_on_first_use():
+    store = build()
+    loaded = SnapshotReader(encode_snapshot(1, store)).load()
+    session = loaded.sessions[1]
+    assert "members" not in session.__dict__
+    assert len(session) == len(store.sessions[1])
+    # the first use decodes the guild, and only that one
+    assert session.leaderboard.top(0, 1)
+    assert "members" in session.__dict__
+    assert "members" not in loaded.sessions[2].__dict__
+
+
+def mapped(tmp_path, store):
+    backend = FileBackend(str(tmp_path / "state.snapshot"), str(tmp_path / "state.journal"))
+    backend.replace(1, encode_snapshot(1, store))
+    buffer, _ = backend.read()
+    assert isinstance(buffer, mmap.mmap)
+    return backend, buffer
+
+
+def test_snapshot_released_once_every_guild_is_decoded(tmp_path):
+    _, buffer = mapped(tmp_path, build())
+    loaded = SnapshotReader(buffer).load()
+    loaded.sessions[1].members
+    assert not buffer.closed
+    loaded.sessions[2].members
+    assert buffer.closed
+
+
+def test_discarded_guilds_release_the_snapshot(tmp_path):
+    backend, buffer = mapped(tmp_path, build())
+    loaded = SnapshotReader(buffer).load()
+    loaded.sessions[1].members
+    # a guild dropped without ever being used doesn't keep the file mapped
+    loaded.clear_guild(2)
+    assert buffer.closed
+    backend.replace(2, encode_snapshot(2, loaded))
+
+    buffer, _ = backend.read()
+    reloaded = SnapshotReader(buffer).load()
+    replacement = SessionStore()
+    replacement.update(reloaded)
+    # replacing the whole store, as a shard reload does
+    replacement.clear()
+    assert buffer.closed
+
+
+def test_replaced_guild_releases_the_snapshot(tmp_path):
+    _, buffer = mapped(tmp_path, build())
+    loaded = SnapshotReader(buffer).load()
+    other = build()
+    loaded.update(other)
+    assert buffer.closed
+    assert loaded.sessions[1] is other.sessions[1]
+
+
+def legacy_file(tmp_path):
+    path = tmp_path / "voice_data.json"
+    path.write_text(json.dumps({
+        "100": {"join_time": None, "total_duration": "90.5", "channel_name": "hall"},
+        "200": {"join_time": None, "total_duration": "30", "channel_name": "deleted channel"},
+    }))
+    return FileBackend(str(tmp_path / "voice_data.snapshot"), str(tmp_path / "voice_data.journal"), str(path))
+
+
+def test_data_without_guilds_is_not_dropped(tmp_path):
+    backend = legacy_file(tmp_path)
+    with pytest.raises(LegacyVoiceData):
+        VoiceJournal(backend).load()
+    # nothing was written over it
+    assert (tmp_path / "voice_data.json").exists()
+    assert not (tmp_path / "voice_data.snapshot").exists()
+
+
+def test_data_without_guilds_is_migrated(tmp_path):
+    backend = legacy_file(tmp_path)
+    store = VoiceJournal(backend).load(lambda members: SessionStore.from_legacy(1, members, {"hall": 10}, 0))
+    members = store.sessions[1].members
+    assert (members[100].total_ns, members[100].channel_id) == (90_500_000_000, 10)
+    assert (members[200].total_ns, members[200].channel_id) == (30_000_000_000, 0)
+    assert store.sessions[1].channel_names[0] == "deleted channel"
+
+    # written in the current format, the old file kept aside
+    assert (tmp_path / "voice_data.json.bak").exists()
+    reloaded = VoiceJournal(backend).load()
+    assert reloaded.sessions[1].members[100].total_ns == 90_500_000_000
+
+
+def test_interval_open_in_data_without_guilds_is_closed_when_saved(tmp_path):
+    members = {
+        "100": {"join_time": "2024-01-01T10:00:00", "total_duration": "60", "channel_name": "hall"},
+    }
+    saved_at = int(datetime.datetime(2024, 1, 1, 10, 30).timestamp() * SECOND)
+    store = SessionStore.from_legacy(1, members, {"hall": 10}, saved_at)
+    session = store.sessions[1]
+    # the 30 minutes up to the save are counted, nothing keeps growing after it
+    assert (session.members[100].join_ns, session.members[100].total_ns) == (None, (60 + 1800) * SECOND)
+    assert not session.channels
+    assert store.ranking(1, 10**30) == store.ranking(1, 0)
@@ -0,0 +1,32 @@
+import pytest
+
+import timeline
+from timeline import Timeline
+
+
+@pytest.fixture(params=["numpy", "plain"])
+def vectorized(request, monkeypatch):
+    if request.param == "plain":
+        monkeypatch.setattr(timeline, "numpy", None)
+    elif timeline.numpy is None:
+        pytest.skip("NumPy isn't installed")
+    return request.param == "numpy"
+
+
+def test_first_start(vectorized):
+    intervals = Timeline()
+    assert timeline.first_start(intervals.with_open([], 100)) is None
+    intervals.add(1, 50, 60)
+    intervals.add(2, 20, 70)
+    assert timeline.first_start(intervals.with_open([(3, 10)], 100)) == 10
+    assert timeline.first_start(intervals.with_open([], 100)) == 20
+
+
+def test_with_open_leaves_the_timeline_growable(vectorized):
+    intervals = Timeline()
+    intervals.add(1, 0, 10)
+    queried = intervals.with_open([(2, 5)], 20)
+    # a query still being used doesn't stop the next interval from being recorded
+    intervals.add(3, 10, 20)
+    assert list(queried[0]) == [1, 2]
+    assert timeline.present_at(intervals.with_open([], 20), 15) == {3}
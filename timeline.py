@@ -0,0 +1,248 @@
+"""
+Interval timelines for the Discord bot.
+
+this file provides the Timeline, which keeps every closed join/leave interval
+of a guild's session in three flat integer arrays (member IDs, starts and
+ends in wall-clock nanoseconds, 24 bytes per interval), and the queries run
+on it across the whole roster at once: who was present at a given time, who
+attended at least a share of the session, and how many members were
+connected over time. With NumPy installed (pip install numpy) the queries
+are vectorized over the arrays; without it they fall back to plain loops
+with the same results.
+"""
+from array import array
+from bisect import bisect_right
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Timeline:
+    """
+    Closed intervals of the members of a guild, in the order they closed.
+
+    Attributes
+    ----------
+    members : array.array
+        Member ID of each interval.
+    starts : array.array
+        Wall-clock nanoseconds each interval started.
+    ends : array.array
+        Wall-clock nanoseconds each interval ended.
+    """
+    __slots__ = ("members", "starts", "ends")
+
+    def __init__(self):
+        self.members = array("q")
+        self.starts = array("q")
+        self.ends = array("q")
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, member_id, start, end):
+        """
+        Record a closed interval.
+
+        Parameters
+        ----------
+        member_id : int
+            The ID of the member.
+        start : int
+            Wall-clock nanoseconds the interval started.
+        end : int
+            Wall-clock nanoseconds the interval ended.
+
+        Returns
+        -------
+        None
+        """
+        self.members.append(member_id)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def extend(self, intervals):
+        """
+        Record several closed intervals at once.
+
+        Parameters
+        ----------
+        intervals : iterable of tuple
+            (member_id, start, end)
+
+        Returns
+        -------
+        None
+        """
+        for member_id, start, end in intervals:
+            self.add(member_id, start, end)
+
+    def with_open(self, open_intervals, now):
+        """
+        Return the intervals with the open ones closed at a given time, as arrays.
+
+        Parameters
+        ----------
+        open_intervals : iterable of tuple
+            (member_id, start) of the intervals still running, start in wall-clock nanoseconds.
+        now : int
+            Wall-clock nanoseconds the open intervals are measured up to.
+
+        Returns
+        -------
+        tuple
+            (members, starts, ends), NumPy arrays when NumPy is installed,
+            array.array otherwise.
+        """
+        members, starts, ends = array("q", self.members), array("q", self.starts), array("q", self.ends)
+        for member_id, start in open_intervals:
+            members.append(member_id)
+            starts.append(start)
+            ends.append(now)
+        if numpy is not None:
+            # views over the copies made above, the arrays aren't copied a second time (the
+            # timeline's own arrays can't be viewed: a buffer in use can't grow on the next add)
+            return numpy.frombuffer(members, numpy.int64), numpy.frombuffer(starts, numpy.int64), numpy.frombuffer(ends, numpy.int64)
+        return members, starts, ends
+
+
+def first_start(intervals):
+    """
+    Return when the earliest interval started.
+
+    Parameters
+    ----------
+    intervals : tuple
+        (members, starts, ends) as returned by Timeline.with_open.
+
+    Returns
+    -------
+    int or None
+        Wall-clock nanoseconds, None without intervals.
+    """
+    _, starts, _ = intervals
+    if not len(starts):
+        return None
+    if numpy is not None and isinstance(starts, numpy.ndarray):
+        return int(starts.min())
+    return min(starts)
+
+
+def present_at(intervals, timestamp):
+    """
+    Return the members who were connected at a given time.
+
+    Parameters
+    ----------
+    intervals : tuple
+        (members, starts, ends) as returned by Timeline.with_open.
+    timestamp : int
+        Wall-clock nanoseconds.
+
+    Returns
+    -------
+    set of int
+        The IDs of the members with an interval covering the time.
+    """
+    members, starts, ends = intervals
+    if numpy is not None and isinstance(members, numpy.ndarray):
+        return set(numpy.unique(members[(starts <= timestamp) & (ends > timestamp)]).tolist())
+    return {member_id for member_id, start, end in zip(members, starts, ends) if start <= timestamp < end}
+
+
+def attendance(intervals, start, end):
+    """
+    Return the share of a period each member was connected for.
+
+    A member is in one channel at a time, so their intervals never overlap
+    and their durations add up.
+
+    Parameters
+    ----------
+    intervals : tuple
+        (members, starts, ends) as returned by Timeline.with_open.
+    start : int
+        Wall-clock nanoseconds the period starts.
+    end : int
+        Wall-clock nanoseconds the period ends.
+
+    Returns
+    -------
+    dict
+        Format: {member_id: share of the period between 0 and 1}
+    """
+    members, starts, ends = intervals
+    length = max(end - start, 1)
+    if numpy is not None and isinstance(members, numpy.ndarray):
+        durations = numpy.clip(numpy.minimum(ends, end) - numpy.maximum(starts, start), 0, None)
+        ids, inverse = numpy.unique(members, return_inverse=True)
+        shares = numpy.bincount(inverse, weights=durations, minlength=len(ids)) / length
+        return dict(zip(ids.tolist(), shares.tolist()))
+    shares = {}
+    for member_id, interval_start, interval_end in zip(members, starts, ends):
+        duration = max(0, min(interval_end, end) - max(interval_start, start))
+        shares[member_id] = shares.get(member_id, 0) + duration / length
+    return shares
+
+
+def concurrency(intervals, times):
+    """
+    Return how many members were connected at each of the given times.
+
+    Parameters
+    ----------
+    intervals : tuple
+        (members, starts, ends) as returned by Timeline.with_open.
+    times : list of int
+        Wall-clock nanoseconds, in any order.
+
+    Returns
+    -------
+    list of int
+        The number of intervals covering each time.
+    """
+    _, starts, ends = intervals
+    if numpy is not None and isinstance(starts, numpy.ndarray):
+        at = numpy.asarray(times, dtype=numpy.int64)
+        counts = numpy.searchsorted(numpy.sort(starts), at, "right") - numpy.searchsorted(numpy.sort(ends), at, "right")
+        return counts.tolist()
+    sorted_starts, sorted_ends = sorted(starts), sorted(ends)
+    return [bisect_right(sorted_starts, t) - bisect_right(sorted_ends, t) for t in times]
+
+
+def peak(intervals):
+    """
+    Return when the most members were connected at once.
+
+    Parameters
+    ----------
+    intervals : tuple
+        (members, starts, ends) as returned by Timeline.with_open.
+
+    Returns
+    -------
+    tuple
+        (count, timestamp): the highest number of members connected at once
+        and the first time it was reached, (0, None) without intervals.
+    """
+    _, starts, ends = intervals
+    if not len(starts):
+        return 0, None
+    if numpy is not None and isinstance(starts, numpy.ndarray):
+        times = numpy.concatenate((starts, ends))
+        steps = numpy.concatenate((numpy.ones(len(starts), numpy.int64), -numpy.ones(len(ends), numpy.int64)))
+        # leaves sort before joins at the same time, a member moving channels isn't counted twice
+        order = numpy.lexsort((steps, times))
+        counts = numpy.cumsum(steps[order])
+        best = int(numpy.argmax(counts))
+        return int(counts[best]), int(times[order][best])
+    events = sorted([(start, 1) for start in starts] + [(end, -1) for end in ends])
+    count = best = 0
+    best_time = None
+    for time, step in events:
+        count += step
+        if count > best:
+            best, best_time = count, time
+    return best, best_time
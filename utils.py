@@ -6,94 +6,297 @@ channel management, and UI components like paginated embeds for displaying
 voice activity data in Discord.
 """
 
-import json
+import re
+import random
 import datetime
 import asyncio
+import time
 import discord
 from discord.ui import Button, View
-from shared import voice_data, bot
+from shared import bot, SHARDED
+from store import SessionStore, now_ns
+from dotenv import dotenv_values
+from shards import ShardRegistry
+from backends import open_backend, StateConflict
+from snapshot import LegacyVoiceData
+from history import AttendanceHistory
+from reports import ReportSnapshot, ReportRegistry, fit, pack_messages
+from metrics import Metrics
+from channels import BotChannelCache
+from names import NameCache
+from outbox import Outbox, INTERACTION, REPORT
+from schedules import Scheduler, START, clock
 
-def save_voice_data():
+config = dotenv_values(".env")
+
+# optional SQLite attendance history, enabled with HISTORY_DB=<path> in the .env file
+HISTORY_DB = config.get("HISTORY_DB")
+attendance_history = AttendanceHistory(HISTORY_DB) if HISTORY_DB else None
+
+# where the voice data is saved: files by default, or sqlite:<path> / redis://... shared by several processes
+STATE_BACKEND = config.get("STATE_BACKEND")
+
+# voice data per gateway shard, each with a journal of every join/leave transition
+# compacted into its snapshot (voice_data.snapshot without sharding, voice_data.shard-<id>.snapshot with)
+shards = ShardRegistry(SHARDED, attendance_history, STATE_BACKEND)
+
+# ID of the bot's channel in each guild, so sending a report doesn't scan the guild's channels;
+# processes running different shards keep their own file
+bot_channels = BotChannelCache(f"bot_channels.{config.get('SHARD_IDS')}.json" if config.get("SHARD_IDS") else "bot_channels.json")
+bot_channels.load()
+
+# display names of the members shown in reports, looked up in batches and kept for members who left
+member_names = NameCache(f"member_names.{config.get('SHARD_IDS')}.json" if config.get("SHARD_IDS") else "member_names.json")
+member_names.load()
+
+# snapshots behind the paginated reports, kept on disk across restarts if REPORTS_DIR=<path> is set
+reports = ReportRegistry(directory=config.get("REPORTS_DIR"))
+# idle seconds after which a report message's own view stops listening,
+# later clicks are served by the Paginator registered in on_ready
+PAGINATOR_TIMEOUT = 900
+FOOTER_PAGE = re.compile(r"Page (\d+)/")
+
+# guilds prepared at once on startup; channel creation and sends share Discord's per-route rate limits
+STARTUP_CONCURRENCY = int(config.get("STARTUP_CONCURRENCY") or 8)
+# greet every guild once the bot is ready, GREETING=off to stay quiet on restarts
+GREETING = (config.get("GREETING") or "on").lower() not in ("0", "off", "false", "no")
+GREETING_TEXT = "hello!!! beep boop! if you'd like to try this bot you could add it to your server using this link: insert your bot link"
+
+# call counters and latency histograms shown by /stats, served to Prometheus if METRICS_PORT=<port> is set
+metrics = Metrics()
+METRICS_PORT = config.get("METRICS_PORT")
+METRICS_HOST = config.get("METRICS_HOST") or "127.0.0.1"
+
+# every message the bot sends on its own goes through here, within Discord's rate limits
+outbox = Outbox(metrics)
+
+def _time_writes(shard):
+    # time spent writing on the worker thread, apart from the time save_voice_data waits for it
+    shard.persistence._write = metrics.timed("persistence", "write")(shard.persistence._write)
+
+shards.on_create(_time_writes)
+metrics.gauge("shards", "Shards run by this process.", lambda: len(shards))
+metrics.gauge("guilds_tracked", "Guilds with voice data.", lambda: sum(len(shard.store.sessions) for shard in shards))
+metrics.gauge("members_tracked", "Members with voice data.", lambda: sum(len(shard.store) for shard in shards))
+metrics.gauge(
+    "open_intervals", "Members currently counted in a tracked channel, in the guilds decoded since startup.",
+    # guilds still waiting in the snapshot are left out rather than decoded by a scrape
+    lambda: sum(
+        len(members) for shard in shards for session in shard.store.sessions.values() if session.decoded
+        for members in session.channels.values()
+    )
+)
+metrics.gauge(
+    "unsaved_events", "Transitions recorded since the last save.",
+    lambda: sum(shard.journal.seq - shard.persistence.saved_seq for shard in shards)
+)
+metrics.gauge("journal_lines", "Lines in the journals since the last snapshot.", lambda: sum(shard.journal.journal_lines for shard in shards))
+metrics.gauge("bot_channels_cached", "Guilds whose bot channel ID is cached.", lambda: len(bot_channels))
+metrics.gauge("member_names_cached", "Member names cached for reports.", lambda: len(member_names))
+metrics.gauge("member_name_lookups", "Gateway requests made to look up member names.", lambda: member_names.lookups)
+metrics.gauge("reports_cached", "Report snapshots held in memory.", lambda: len(reports))
+metrics.gauge("outbox_queue", "Messages waiting to be sent.", lambda: len(outbox))
+
+@metrics.timed("persistence")
+async def save_voice_data(shard=None):
     """
-    Save voice tracking data to a JSON file.
+    Save voice tracking data without blocking the event loop.
     
-    Converts the voice_data dictionary to a JSON-serializable format
-    and saves it to 'voice_data.json'.
+    Appends the join/leave transitions recorded since the last save to the
+    shard's journal ('voice_data.journal' without sharding) on a worker
+    thread, and compacts everything into a new snapshot once the journal has
+    grown large enough. Closed intervals are also inserted into the attendance history if it is enabled.
+    Nothing is written when nothing changed, and calls made while a write
+    is running share the next write.
     
     Parameters
     ----------
-    None
+    shard : Shard, optional
+        The shard to save, every shard of this process by default.
     
     Returns
     -------
     None
     """
-    try:
-        with open("voice_data.json", "w") as f:
-            json.dump(
-                {str(k): {
-                    "join_time": v["join_time"].isoformat() if v["join_time"] else None,
-                    "total_duration": str(v["total_duration"].total_seconds()),
-                    "channel_name": v["channel_name"]
-                } for k, v in voice_data.items()},
-                f
-            )
-        print("Voice data saved.")
-    except Exception as e:
-        print(f"Error saving voice data: {e}")
+    for shard in ([shard] if shard is not None else shards):
+        try:
+            await shard.persistence.save()
+        except StateConflict as e:
+            # another process runs this shard, stopping beats losing every save from now on
+            print(f"Stopping: the voice data of shard {shard.id} can't be saved, {e}")
+            bot.loop.create_task(bot.close())
+        except Exception as e:
+            print(f"Error saving voice data of shard {shard.id}: {e}")
 
-def load_voice_data():
+@metrics.timed("persistence")
+def load_voice_data(shard):
     """
-    Load voice tracking data from a JSON file.
+    Load a shard's voice tracking data into its store.
     
-    Reads 'voice_data.json' and converts the data back to the format
-    used by the bot for tracking voice activity.
+    Reads the shard's snapshot and replays the transitions recorded in its
+    journal after it. A shard without saved data of its own takes its
+    guilds from the data saved before the bot was sharded. A
+    'voice_data.json' from before guilds were tracked is moved into the
+    bot's guild if it is in only one, otherwise the bot stops rather than
+    start over without it.
     
     Parameters
     ----------
-    None
+    shard : Shard
+        The shard to load.
     
     Returns
     -------
-    dict
-        The loaded voice data, or an empty dictionary if the file doesn't exist.
+    SessionStore
+        The shard's store, left empty if the data couldn't be read.
     """
+    def migrate(members):
+        # such data was written by a bot that only ever ran in one guild, it belongs to that guild
+        if shards.sharded or len(bot.guilds) != 1:
+            raise LegacyVoiceData(members)
+        guild = bot.guilds[0]
+        print(f"Voice data saved without guild IDs moved into {guild.name}.")
+        channel_ids = {channel.name: channel.id for channel in guild.voice_channels}
+        return SessionStore.from_legacy(guild.id, members, channel_ids, shard.journal.saved_at() or time.time_ns())
+
     try:
-        with open("voice_data.json", "r") as f:
-            data = json.load(f)
-        return {
-            int(k): {
-                "join_time": datetime.datetime.fromisoformat(v["join_time"]) if v["join_time"] else None,
-                "total_duration": datetime.timedelta(seconds=float(v["total_duration"])),
-                "channel_name": v["channel_name"]
-            } for k, v in data.items()
-        }
-    except FileNotFoundError:
-        return {}
+        # the data the bot saved before it was sharded is split between the shards the first time they load
+        fallback = open_backend(STATE_BACKEND, "voice_data") if shards.sharded else None
+        shard.load(fallback, bot.shard_count, migrate)
+    except LegacyVoiceData:
+        # left unloaded, so nothing is saved over the old data
+        print(
+            "The saved voice data (voice_data.json) is from a version without guild IDs, and with the bot in "
+            "several servers (or sharded) it can't tell which one the data belongs to. Start the bot once, "
+            "unsharded, in only the server it belongs to, or remove the file to start over. Stopping."
+        )
+        bot.loop.create_task(bot.close())
     except Exception as e:
-        print(f"Error loading voice data: {e}")
-        return {}
+        print(f"Error loading voice data of shard {shard.id}: {e}")
+        shard.loaded = True
+    return shard.store
 
-async def periodic_save():
+async def periodic_save(shard):
     """
-    Periodically save voice tracking data.
+    Periodically save a shard's voice tracking data.
     
-    This coroutine runs in the background and saves voice data every 30 seconds.
+    This coroutine runs in the background, one per shard, and appends the
+    shard's pending transitions to its journal every 5 seconds, along with
+    the bot channel and member name caches. Nothing is written when nothing changed.
     
     Parameters
     ----------
-    None
+    shard : Shard
+        The shard to save.
     
     Returns
     -------
     None
     """
-    await bot.wait_until_ready()
     while not bot.is_closed():
-        save_voice_data()
-        print("Voice data saved (periodic save)")
-        await asyncio.sleep(30)  # save every 30 secs
+        await save_voice_data(shard)
+        await bot_channels.save()
+        await member_names.save()
+        await asyncio.sleep(5)  # a crash loses at most the last 5 secs of transitions
+
+async def join_voice(shard, guild, channel):
+    """
+    Connect the bot to a voice channel and track the members in it.
+    
+    Without other tracked channels this starts a fresh session for the
+    guild; channels registered with /track keep their session and the
+    bot's channel is added to it.
+    
+    Parameters
+    ----------
+    shard : Shard
+        The guild's shard.
+    guild : discord.Guild
+        The guild.
+    channel : discord.VoiceChannel
+        The voice channel to join.
+    
+    Returns
+    -------
+    None
+    """
+    session = shard.store.session(guild.id)
+    fresh = not (session and session.tracked)
+    await channel.connect()
+    now = now_ns()
+    # the bot and all members already in the channel
+    member_ids = [bot.user.id] + [member.id for member in channel.members if member.id != bot.user.id]
+    if fresh:
+        shard.store.open_session(guild.id, channel, member_ids, now)
+    else:
+        shard.store.track(guild.id, channel)
+        for member_id in member_ids:
+            shard.store.start(guild.id, member_id, channel, now)
+
+async def run_schedule(shard, schedule, action, occurrence):
+    """
+    Start or end a scheduled session, called by the scheduler when it is due.
+    
+    Starting joins the schedule's channel like /join, unless the bot is
+    already connected somewhere in the guild. Ending sends the report to the
+    bot's channel and leaves like /leave, only if the start joined the
+    channel and the session wasn't already ended by hand.
+    
+    Parameters
+    ----------
+    shard : Shard
+        The guild's shard.
+    schedule : Schedule
+        The schedule.
+    action : str
+        START or END.
+    occurrence : int
+        UNIX seconds the occurrence starts.
+    
+    Returns
+    -------
+    None
+    """
+    guild = bot.get_guild(schedule.guild_id)
+    if guild is None:
+        return
+    shard.ingest.flush()
+    if action == START:
+        channel = guild.get_channel(schedule.channel_id)
+        voice_client = guild.voice_client
+        if channel is None:
+            print(f"Schedule {schedule.describe()} skipped in {guild.name}: the channel was deleted")
+            return
+        if voice_client and voice_client.is_connected():
+            print(f"Schedule {schedule.describe()} skipped in {guild.name}: already connected to {voice_client.channel.name}")
+            return
+        await join_voice(shard, guild, channel)
+        if shard.store.schedules.get(schedule.id) is schedule:
+            shard.store.join_schedule(schedule.id)
+        text = f"Scheduled session started in {channel.name}, it ends at {clock(occurrence + schedule.length)} UTC."
+    else:
+        if not schedule.joined:
+            return  # the start was skipped, the session isn't the schedule's to end
+        session = shard.store.session(guild.id)
+        if session is None or schedule.channel_id not in session.tracked:
+            return  # ended with /leave
+        now = now_ns()
+        shard.store.stop_guild(guild.id, now)
+        members_data = shard.store.ranking(guild.id, now)
+        if members_data:
+            await post_report(guild, members_data)
+        shard.store.clear_guild(guild.id)
+        if guild.voice_client:
+            await guild.voice_client.disconnect()
+        text = f"Scheduled session in {schedule.channel_name} ended."
+    await save_voice_data(shard)
+    print(f"{text} ({guild.name})")
+    attendance_channel = await ensure_bot_channel(guild)
+    if attendance_channel:
+        outbox.post(attendance_channel, text)
 
+# weekly sessions of every shard's guilds, joined and left from one task
+scheduler = Scheduler(run_schedule)
 
 def format_time(input_time):
     """
@@ -140,7 +343,9 @@ async def ensure_bot_channel(guild):
     """
     Ensure that the bot's dedicated channel exists in a guild.
     
-    Creates the 'project-oculus' channel if it doesn't exist.
+    Creates the 'project-oculus' channel if it doesn't exist. The channel
+    is looked up in the bot channel cache first, the guild's text channels
+    are only scanned on a cache miss.
     
     Parameters
     ----------
@@ -152,72 +357,405 @@ async def ensure_bot_channel(guild):
     discord.TextChannel
         The bot's dedicated channel.
     """
-    attendance_channel = discord.utils.get(guild.text_channels, name="project-oculus")
-    if not attendance_channel:
+    attendance_channel, _ = await _ensure_bot_channel(guild)
+    return attendance_channel
+
+async def _ensure_bot_channel(guild):
+    # returns (channel, True if it was just created)
+    attendance_channel = bot_channels.get(guild)
+    if attendance_channel:
+        return attendance_channel, False
+    # one lookup/creation per guild at a time, callers that waited find the channel in the cache
+    async with bot_channels.lock(guild.id):
+        attendance_channel = bot_channels.get(guild)
+        if attendance_channel:
+            return attendance_channel, False
+        attendance_channel = discord.utils.get(guild.text_channels, name="project-oculus")
+        if attendance_channel:
+            bot_channels.set(guild.id, attendance_channel.id)
+            return attendance_channel, False
         try:
             # creates the attendance channel
             overwrites = {
                 guild.default_role: discord.PermissionOverwrite(send_messages=False),
                 guild.me: discord.PermissionOverwrite(send_messages=True)
             }
-            attendance_channel = await guild.create_text_channel("project-oculus", overwrites=overwrites)
-            await attendance_channel.send("This channel logs the time spent by members in voice chats.")
+            attendance_channel = await with_backoff(lambda: guild.create_text_channel("project-oculus", overwrites=overwrites))
+            bot_channels.set(guild.id, attendance_channel.id)
+            outbox.post(attendance_channel, "This channel logs the time spent by members in voice chats.")
             print(f"Created 'project-oculus' channel in guild: {guild.name}")
+            return attendance_channel, True
         except Exception as e:
             print(f"Error creating project-oculus channel in guild {guild.name}: {e}")
-    return attendance_channel
+            return attendance_channel, attendance_channel is not None
+
+async def with_backoff(call, attempts=4, base_delay=1.0):
+    """
+    Await an API call, retrying it when Discord rate limits it or fails.
+    
+    The library already waits out ordinary 429s; this covers the ones it
+    gives up on and 5xx errors, waiting for the Retry-After header when
+    there is one and an exponential delay with jitter otherwise.
+    
+    Parameters
+    ----------
+    call : callable
+        Returns a new awaitable of the call each time it is invoked.
+    attempts : int, optional
+        Maximum number of tries.
+    base_delay : float, optional
+        Delay before the first retry in seconds, doubled on each retry.
+    
+    Returns
+    -------
+    object
+        The result of the call.
+    """
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except discord.HTTPException as e:
+            if attempt == attempts - 1 or not (e.status == 429 or e.status >= 500):
+                raise
+            retry_after = getattr(e.response, "headers", {}).get("Retry-After")
+            delay = float(retry_after) if retry_after else base_delay * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, base_delay))
+
+async def run_bounded(items, worker, concurrency):
+    """
+    Run a coroutine function on every item, at most concurrency at a time.
+    
+    Parameters
+    ----------
+    items : iterable
+        The items to process.
+    worker : callable
+        Coroutine function taking one item.
+    concurrency : int
+        Maximum number of workers running at once.
+    
+    Returns
+    -------
+    list
+        The results in the order of the items, None where the worker failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            try:
+                return await worker(item)
+            except Exception as e:
+                print(f"Error processing {item}: {e}")
+                return None
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+async def prepare_guilds(guilds, concurrency=STARTUP_CONCURRENCY):
+    """
+    Do the startup work of every guild concurrently.
+    
+    Each guild is handled in one pass: the bot's channel is taken from the
+    cache, or found with one scan of its text channels, or created if it is
+    missing. At most
+    concurrency guilds are worked on at a time, so a bot in thousands of
+    guilds doesn't trip the rate limits.
+    
+    Parameters
+    ----------
+    guilds : iterable of discord.Guild
+        The guilds to prepare.
+    concurrency : int, optional
+        Maximum number of guilds prepared at once.
+    
+    Returns
+    -------
+    list
+        For each guild, a (channel, created) tuple: the bot's channel (None
+        if it couldn't be created) and whether it was just created.
+    """
+    return await run_bounded(guilds, _ensure_bot_channel, concurrency)
+
+async def greet_guilds(channels):
+    """
+    Send the greeting message to the bot's channel of each guild.
+    
+    The greetings are queued in the outbox at once and sent as fast as the
+    rate limits allow, after any report or followup queued meanwhile.
+    
+    Parameters
+    ----------
+    channels : iterable of discord.TextChannel
+        The channels to greet in.
+    
+    Returns
+    -------
+    None
+        Returns once every greeting was sent or gave up.
+    """
+    futures = [outbox.post(channel, GREETING_TEXT, key=("greeting", channel.id)) for channel in channels]
+    await asyncio.gather(*futures, return_exceptions=True)
 
-async def send_paginated_time_logs(interaction_or_ctx, members_data):
+async def reconcile_guild(guild, ended=None):
+    """
+    Bring a guild's tracked data in line with its current voice states, after
+    the bot missed voice updates (a reconnection or a restart).
+    
+    The bot reconnects to the channel it was in, found by ID. Then, for every
+    tracked channel, members who are still there keep their interval, the
+    intervals of members who left are closed at `ended`, and members who are
+    there now get a new one. Channels that were deleted stop being tracked.
+    Only the open intervals and the members in tracked channels are looked at.
+    
+    Parameters
+    ----------
+    guild : discord.Guild
+        The guild to reconcile.
+    ended : int, optional
+        The monotonic time (see now_ns) the bot last knew who was connected,
+        intervals that ended while it was away are closed then. Now by default.
+    
+    Returns
+    -------
+    tuple of int
+        (closed, opened): numbers of intervals closed and opened.
+    """
+    store = shards.for_guild(guild).store
+    session = store.session(guild.id)
+    if session is None or not session.tracked:
+        return 0, 0
+
+    # rejoin the bot's channel first so the bot itself is among the members present
+    if session.channel_id is not None and guild.voice_client is None:
+        channel = guild.get_channel(session.channel_id)
+        try:
+            if channel is None:
+                raise LookupError("the channel was deleted")
+            await channel.connect()
+            print(f"reconnected to voice channel: {channel.name}")
+        except Exception as e:
+            print(f"failed to reconnect to voice channel {session.channel_name}: {e}")
+            store.untrack(guild.id, session.channel_id, ended if ended is not None else now_ns())
+
+    present = {}
+    for channel_id in list(session.tracked):
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            store.untrack(guild.id, channel_id, ended if ended is not None else now_ns())
+            continue
+        # picks up renames that happened while the bot was away
+        store.track(guild.id, channel, channel_id == session.channel_id)
+        present[channel_id] = (channel, channel.voice_states.keys())
+    closed, opened = store.reconcile(guild.id, present, now_ns(), ended)
+    if closed or opened:
+        print(f"Reconciled {guild.name}: {closed} interval(s) closed, {opened} opened")
+    return closed, opened
+
+async def reconcile_guilds(guilds, ended=None, concurrency=STARTUP_CONCURRENCY):
+    """
+    Reconcile every guild with tracked channels, see reconcile_guild.
+    
+    Parameters
+    ----------
+    guilds : iterable of discord.Guild
+        The guilds to reconcile.
+    ended : int, optional
+        The monotonic time the bot last knew who was connected.
+    concurrency : int, optional
+        Maximum number of guilds reconciled at once (reconnecting to voice is a network call).
+    
+    Returns
+    -------
+    None
+    """
+    await run_bounded(
+        [guild for guild in guilds if shards.for_guild(guild).store.session(guild.id) is not None],
+        lambda guild: reconcile_guild(guild, ended),
+        concurrency
+    )
+
+def report_line(rank, member_id, seconds, channel_name, guild):
+    """
+    Render one row of a report.
+    
+    Parameters
+    ----------
+    rank : int
+        One-based rank of the member.
+    member_id : int
+        The ID of the member.
+    seconds : float
+        Time spent by the member.
+    channel_name : str
+        The channel of the member's last interval.
+    guild : discord.Guild
+        The guild whose member names are used, resolved beforehand (see
+        NameCache.resolve).
+    
+    Returns
+    -------
+    str
+        The row's line.
+    """
+    member_name = (member_names.get(guild.id, member_id) if guild else None) or f"Unknown member (ID: {member_id})"
+    return f"{rank}. **{member_name}** was in {channel_name} for: {format_time(seconds)}"
+
+def render_report_page(snapshot, page, guild):
+    """
+    Build the embed of one page of a report.
+    
+    Parameters
+    ----------
+    snapshot : ReportSnapshot
+        The report.
+    page : int
+        Zero-based page number.
+    guild : discord.Guild
+        The guild used to look up member names.
+    
+    Returns
+    -------
+    discord.Embed
+        The page's embed.
+    """
+    lines = [report_line(*row, guild) for row in snapshot.page_rows(page)]
+    embed = discord.Embed(
+        title="Time Spent",
+        # pages were measured when the report was made, names may have grown since
+        description=fit("\n".join(lines)),
+        color=discord.Color.teal()
+    )
+    embed.set_footer(text=f"Page {page + 1}/{snapshot.page_count} | Members who attended: {len(snapshot)}")
+    return embed
+
+async def send_report_dump(channel, snapshot, guild):
+    """
+    Send a whole report at once, without pagination.
+    
+    Rows are rendered one at a time and packed into as many embeds per
+    message as Discord's size limits allow; each message is sent as soon
+    as it is full.
+    
+    Parameters
+    ----------
+    channel : discord.TextChannel
+        Where to send the report.
+    snapshot : ReportSnapshot
+        The report.
+    guild : discord.Guild
+        The guild used to look up member names.
+    
+    Returns
+    -------
+    int
+        The number of messages sent.
+    """
+    title = "Time Spent"
+    footer = f"Members who attended: {len(snapshot)}"
+    lines = (report_line(*row, guild) for row in snapshot.rows())
+    sent = 0
+    for descriptions in pack_messages(lines, len(title) + len(footer)):
+        embeds = []
+        for description in descriptions:
+            embed = discord.Embed(title=title, description=description, color=discord.Color.teal())
+            embed.set_footer(text=footer)
+            embeds.append(embed)
+        # one message at a time, so a long report doesn't hold its whole rendering in the queue
+        await outbox.send(channel, embeds=embeds, lane=REPORT)
+        sent += 1
+    return sent
+
+async def send_paginated_time_logs(interaction_or_ctx, members_data, static=False):
     """
     Create and sends paginated time logs to the bot's channel.
     
+    Only a compact snapshot of the report is kept (in the reports registry),
+    each page's embed is rendered when it is shown. Pages hold as many rows
+    as fit in an embed (up to MAX_PAGE_ROWS). With static, the whole report
+    is sent at once in as few messages as possible instead.
+    
     Parameters
     ----------
     interaction_or_ctx : discord.Interaction or discord.ApplicationContext
         The interaction or context that triggered this function.
     members_data : list
-        List of strings containing formatted member time data.
+        List of (member_id, total_seconds, channel_name) tuples, in the order
+        they should be shown.
+    static : bool, optional
+        Send every row now rather than a paginated message.
     
     Returns
     -------
     None
     """
     if not members_data:
-        # checks if we're dealing with an Interaction or a Context
-        if isinstance(interaction_or_ctx, discord.Interaction):
-            await interaction_or_ctx.followup.send("No voice activity to log.")
-        else:
-            await interaction_or_ctx.send("No voice activity to log.")
+        await send_followup(interaction_or_ctx, "No voice activity to log.")
         return
-        
-    log_pages = []
-    numbered_members_data = [f"{i+1}. {member}" for i, member in enumerate(members_data)]
-    
-    for i in range(0, len(numbered_members_data), 10):
-        pages_logs = "\n".join(numbered_members_data[i:i + 10])
-        embed = discord.Embed(
-            title="Time Spent",
-            description=pages_logs,
-            color=discord.Color.teal()
-        )
-        current_page = i // 10 + 1
-        total_pages = (len(numbered_members_data) - 1) // 10 + 1
-        embed.set_footer(text=f"Page {current_page}/{total_pages} | Members who attended: {len(voice_data)}")
-        log_pages.append(embed)
 
     # get the guild from either interaction or context
     guild = getattr(interaction_or_ctx, 'guild', None)
+    if not await post_report(guild, members_data, static):
+        await send_followup(interaction_or_ctx, "The attendance channel cannot cease to exist, I made it this way")
+
+async def post_report(guild, members_data, static=False):
+    """
+    Send a report to the bot's channel of a guild, paginated or whole.
+    
+    Parameters
+    ----------
+    guild : discord.Guild
+        The guild.
+    members_data : list
+        List of (member_id, total_seconds, channel_name) tuples, in the order
+        they should be shown.
+    static : bool, optional
+        Send every row now rather than a paginated message.
+    
+    Returns
+    -------
+    bool
+        False if the bot's channel couldn't be found or created.
+    """
     attendance_channel = await ensure_bot_channel(guild)
+    if not attendance_channel:
+        return False
+    # every name of the report in a few gateway requests, pages rendered later read the cache
+    await member_names.resolve(guild, (row[0] for row in members_data), bot.get_user)
+    snapshot = ReportSnapshot(guild.id, members_data)
+    if static:
+        await send_report_dump(attendance_channel, snapshot, guild)
+    else:
+        # cut the pages by the size of their lines so none goes over the description limit
+        snapshot.paginate(len(report_line(*row, guild)) for row in snapshot.rows())
+        message = await outbox.send(
+            attendance_channel, embed=render_report_page(snapshot, 0, guild), view=Paginator(timeout=PAGINATOR_TIMEOUT), lane=REPORT
+        )
+        await reports.put(message.id, snapshot)
+    return True
 
-    if attendance_channel:
-        view = Paginator(log_pages)
-        await attendance_channel.send(embed=log_pages[0], view=view)
+async def send_followup(interaction_or_ctx, content):
+    """
+    Send a followup message to an interaction, ahead of queued reports and notices.
+    
+    Parameters
+    ----------
+    interaction_or_ctx : discord.Interaction or discord.ApplicationContext
+        The interaction or context to follow up on.
+    content : str
+        The message.
+    
+    Returns
+    -------
+    discord.Message
+        The sent message.
+    """
+    # checks if we're dealing with an Interaction or a Context
+    if isinstance(interaction_or_ctx, discord.Interaction):
+        target = interaction_or_ctx.followup
     else:
-        # checks if we're dealing with an Interaction or Context
-        if isinstance(interaction_or_ctx, discord.Interaction):
-            await interaction_or_ctx.followup.send("The attendance channel cannot cease to exist, I made it this way")
-        else:
-            await interaction_or_ctx.send("The attendance channel cannot cease to exist, I made it this way")
+        target = interaction_or_ctx
+    # every interaction has its own webhook token, and so its own rate limit
+    return await outbox.send(target, content, lane=INTERACTION, route=("interaction", id(interaction_or_ctx)))
 
 # Paginator class for paginated embeds
 class Paginator(View):
@@ -225,78 +763,78 @@ class Paginator(View):
     A view for paginated embeds.
     
     This class provides a UI with previous and next buttons to navigate
-    through multiple pages of embeds.
+    through the pages of a report. It holds no state of its own: the report
+    is looked up in the reports registry by message ID and the current page
+    is read from the message's footer, so a single instance registered with
+    bot.add_view (timeout=None) can serve every report message, including
+    ones sent before a restart.
     
     Parameters
     ----------
-    pages : list
-        List of discord.Embed objects representing the pages.
-    
-    Attributes
-    ----------
-    pages : list
-        The list of embed pages.
-    current_page : int
-        The index of the currently displayed page.
+    timeout : float, optional
+        Seconds of inactivity after which this instance stops listening.
     """
-    def __init__(self, pages):
-        super().__init__(timeout=None)
-        self.pages = pages
-        self.current_page = 0
+    def __init__(self, timeout=None):
+        super().__init__(timeout=timeout)
 
-    async def update_message(self, interaction):
+    async def turn_page(self, interaction, step):
         """
-        Update the message with the current page.
+        Move the message to another page of its report.
         
         Parameters
         ----------
         interaction : discord.Interaction
             The interaction that triggered this update.
+        step : int
+            How many pages to move by.
         
         Returns
         -------
         None
         """
-        self.previous.disabled = self.current_page == 0
-        self.next.disabled = self.current_page == len(self.pages) - 1
-        await interaction.response.edit_message(embed=self.pages[self.current_page], view=self)
+        snapshot = await reports.get(interaction.message.id)
+        if snapshot is None:
+            return await interaction.response.send_message("This report has expired, run /list again.", ephemeral=True)
+        embeds = interaction.message.embeds
+        match = FOOTER_PAGE.match(embeds[0].footer.text or "") if embeds else None
+        page = (int(match.group(1)) - 1 if match else 0) + step
+        if 0 <= page < snapshot.page_count:
+            await interaction.response.edit_message(embed=render_report_page(snapshot, page, interaction.guild))
+        else:
+            await interaction.response.defer()
 
-    @discord.ui.button(label="⬅️", style=discord.ButtonStyle.blurple)
-    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+    @discord.ui.button(label="⬅️", style=discord.ButtonStyle.blurple, custom_id="oculus:report:previous")
+    async def previous(self, button: discord.ui.Button, interaction: discord.Interaction):
         """
         Handle the previous page button click.
         
         Parameters
         ----------
-        interaction : discord.Interaction
-            The interaction that triggered this button.
         button : discord.ui.Button
             The button that was clicked.
+        interaction : discord.Interaction
+            The interaction that triggered this button.
         
         Returns
         -------
         None
         """
-        if self.current_page > 0:
-            self.current_page -= 1
-            await self.update_message(interaction)
+        await self.turn_page(interaction, -1)
 
-    @discord.ui.button(label="➡️", style=discord.ButtonStyle.blurple)
-    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+    @discord.ui.button(label="➡️", style=discord.ButtonStyle.blurple, custom_id="oculus:report:next")
+    async def next(self, button: discord.ui.Button, interaction: discord.Interaction):
         """
         Handle the next page button click.
         
         Parameters
         ----------
-        interaction : discord.Interaction
-            The interaction that triggered this button.
         button : discord.ui.Button
             The button that was clicked.
+        interaction : discord.Interaction
+            The interaction that triggered this button.
         
         Returns
         -------
         None
         """
-        if self.current_page < len(self.pages) - 1:
-            self.current_page += 1
-            await self.update_message(interaction)
+        await self.turn_page(interaction, 1)